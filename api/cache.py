@@ -0,0 +1,198 @@
+# Filename: cache.py
+# Author: MAYSHLAMY
+# Problem: Response cache keyed on the warehouse data version, with ETag revalidation
+
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+from src.instrumentation import metrics
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis is optional; the in-process LRU works on its own
+    aioredis = None
+
+load_dotenv()
+
+CACHE_ENABLED = os.getenv('API_CACHE_ENABLED', '1') == '1'
+# In-process LRU: at most this many responses and this many bytes in total
+CACHE_MAX_ENTRIES = int(os.getenv('API_CACHE_MAX_ENTRIES', 512))
+CACHE_MAX_BYTES = int(os.getenv('API_CACHE_MAX_BYTES', 256 * 2**20))
+# Larger responses are streamed through but not kept
+CACHE_MAX_ENTRY_BYTES = int(os.getenv('API_CACHE_MAX_ENTRY_BYTES', 16 * 2**20))
+# Shared second tier, e.g. redis://localhost:6379/0; entries expire on their own after the TTL
+CACHE_REDIS_URL = os.getenv('API_CACHE_REDIS_URL')
+CACHE_REDIS_TTL = int(os.getenv('API_CACHE_REDIS_TTL', 24 * 3600))
+# How long the data version read from Postgres is trusted before asking again
+DATA_VERSION_TTL = float(os.getenv('API_DATA_VERSION_TTL', 5))
+
+
+class LRUCache:
+    """Byte-bounded in-process LRU of (metadata, body) entries."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    async def set(self, key, meta, body):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key)[1])
+        self.entries[key] = (meta, body)
+        self.size += len(body)
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class RedisCache:
+    """Redis tier shared by every API worker; entries are '<json metadata>\\n<body>'."""
+
+    def __init__(self, client, ttl=CACHE_REDIS_TTL):
+        self.client = client
+        self.ttl = ttl
+
+    async def get(self, key):
+        value = await self.client.get(f"api-cache:{key}")
+        if value is None:
+            return None
+        meta, body = value.split(b"\n", 1)
+        return json.loads(meta), body
+
+    async def set(self, key, meta, body):
+        await self.client.set(f"api-cache:{key}", json.dumps(meta).encode() + b"\n" + body, ex=self.ttl)
+
+
+class ResponseCache:
+    """
+    Two tiers: the LRU answers repeated requests inside this process, Redis (when
+    configured) shares entries between workers. Keys contain the data version,
+    so nothing is ever invalidated explicitly: a bump makes old keys unreachable
+    and they age out of the LRU and expire in Redis.
+    """
+
+    def __init__(self, engine, redis_client=None):
+        self.engine = engine
+        self.tiers = [LRUCache()]
+        if redis_client is None and CACHE_REDIS_URL and aioredis is not None:
+            redis_client = aioredis.from_url(CACHE_REDIS_URL)
+        if redis_client is not None:
+            self.tiers.append(RedisCache(redis_client))
+        self._version = None
+        self._version_read_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "bypassed": 0}
+
+    async def data_version(self):
+        """
+        The current data version, re-read every DATA_VERSION_TTL seconds. If the
+        read fails the last known version is kept; None means it was never read,
+        and respond() then skips the cache rather than guess.
+        """
+        if self._version is None or time.monotonic() - self._version_read_at > DATA_VERSION_TTL:
+            try:
+                async with self.engine.connect() as conn:
+                    if (await conn.execute(text("SELECT to_regclass('refined.data_version')"))).scalar():
+                        self._version = (await conn.execute(
+                            text("SELECT version FROM refined.data_version"))).scalar() or 0
+                    else:
+                        # No pipeline run has created the table yet
+                        self._version = 0
+            except Exception:
+                pass
+            # Also after a failure, so an outage is not asked about on every request
+            self._version_read_at = time.monotonic()
+        return self._version
+
+    def _count(self, result):
+        self.stats[result] += 1
+        metrics.inc("api_cache_requests_total", result=result)
+
+    def key_for(self, request, version):
+        params = '&'.join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return hashlib.sha256(f"{request.url.path}?{params}#v{version}".encode()).hexdigest()
+
+    async def _get(self, key):
+        for i, tier in enumerate(self.tiers):
+            entry = await tier.get(key)
+            if entry is not None:
+                # Promote Redis hits into the local LRU
+                for upper in self.tiers[:i]:
+                    await upper.set(key, *entry)
+                return entry
+        return None
+
+    async def _set(self, key, meta, body):
+        for tier in self.tiers:
+            await tier.set(key, meta, body)
+
+    async def respond(self, request, build):
+        """
+        Serves `build()`'s response from the cache when possible. A matching
+        If-None-Match gets a 304 without touching the database beyond the
+        version check. Streamed responses are teed into the cache as they go
+        out and stored only if they complete and stay under the size cap.
+        """
+        if not CACHE_ENABLED:
+            return await build()
+        version = await self.data_version()
+        if version is None:
+            self._count("bypassed")
+            return await build()
+        key = self.key_for(request, version)
+        etag = f'"{version}-{key[:32]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            self._count("not_modified")
+            return Response(status_code=304, headers=headers)
+
+        entry = await self._get(key)
+        if entry is not None:
+            self._count("hits")
+            meta, body = entry
+            return Response(content=body, status_code=meta["status_code"], media_type=meta["media_type"],
+                            headers={**meta["headers"], **headers, "X-Cache": "HIT"})
+
+        self._count("misses")
+        response = await build()
+        if not isinstance(response, Response):
+            response = Response(content=json.dumps(response, ensure_ascii=False).encode('utf-8'),
+                                media_type="application/json")
+        meta = {"status_code": response.status_code, "media_type": response.media_type,
+                "headers": {k: v for k, v in response.headers.items()
+                            if k.lower() in ("x-next-after", "link")}}
+        response.headers.update({**headers, "X-Cache": "MISS"})
+
+        if isinstance(response, StreamingResponse):
+            response.body_iterator = self._tee(key, meta, response.body_iterator)
+        elif response.status_code == 200 and len(response.body) <= CACHE_MAX_ENTRY_BYTES:
+            await self._set(key, meta, bytes(response.body))
+        return response
+
+    async def _tee(self, key, meta, body_iterator):
+        chunks, size = [], 0
+        async for chunk in body_iterator:
+            chunk = chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+            if chunks is not None:
+                size += len(chunk)
+                if size > CACHE_MAX_ENTRY_BYTES:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+            yield chunk
+        if chunks is not None and meta["status_code"] == 200:
+            await self._set(key, meta, b"".join(chunks))
@@ -0,0 +1,67 @@
+# Filename: database.py
+# Author: MAYSHLAMY
+# Problem: Async, pooled PostgreSQL access for the FastAPI service
+
+import os
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool sizing: POOL_SIZE connections are kept open, up to MAX_OVERFLOW more under bursts;
+# a request waits at most POOL_TIMEOUT seconds for one before failing
+POOL_SIZE = int(os.getenv('API_DB_POOL_SIZE', 10))
+MAX_OVERFLOW = int(os.getenv('API_DB_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.getenv('API_DB_POOL_TIMEOUT', 5))
+POOL_RECYCLE = int(os.getenv('API_DB_POOL_RECYCLE', 1800))
+# Server-side cap on every statement, so one slow query cannot pin a connection
+STATEMENT_TIMEOUT_MS = int(os.getenv('API_DB_STATEMENT_TIMEOUT_MS', 5000))
+# asyncpg prepares each statement once per connection and reuses it from this cache
+PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv('API_DB_PREPARED_STATEMENT_CACHE_SIZE', 500))
+
+ASYNC_DB_URL = (f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:"
+                f"{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+                f"?prepared_statement_cache_size={PREPARED_STATEMENT_CACHE_SIZE}")
+
+engine = create_async_engine(
+    ASYNC_DB_URL,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={"server_settings": {
+        "statement_timeout": str(STATEMENT_TIMEOUT_MS),
+        "application_name": "medical-data-api",
+    }},
+)
+
+def pool_status():
+    """Connections in use against what the pool may open; saturation 1.0 means requests start queueing."""
+    pool = engine.pool
+    checked_out = pool.checkedout()
+    capacity = POOL_SIZE + MAX_OVERFLOW
+    return {
+        "size": pool.size(),
+        "checked_out": checked_out,
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "capacity": capacity,
+        "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
+
+async def check_database(timeout=2.0):
+    """Round trip through the pool; returns None when healthy, else the error text."""
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    try:
+        await asyncio.wait_for(ping(), timeout)
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+async def dispose():
+    await engine.dispose()
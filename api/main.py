@@ -2,70 +2,361 @@
 # Author: MAYSHLAMY
 # Problem: Task 6 - Robust FastAPI for Medical Data Warehouse
 
-from fastapi import FastAPI, HTTPException
-from sqlalchemy import create_engine, text
-import pandas as pd
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+from decimal import Decimal
+from typing import Optional
+from urllib.parse import urlencode
+import json
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.search_index import search_messages, SEARCH_PAGE_SIZE
+# Database Connection: async engine and pool, see api/database.py
+from api.database import engine, pool_status, check_database, dispose
+# Response cache keyed on the refined data version, see api/cache.py
+from api.cache import ResponseCache
+# Counters and latency histograms shared with the pipeline, see src/instrumentation.py
+from src.instrumentation import metrics, log_event
+
 load_dotenv()
 
-app = FastAPI(title="MAYSHLAMY Medical Data API")
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await dispose()
+
+app = FastAPI(title="MAYSHLAMY Medical Data API", lifespan=lifespan)
+cache = ResponseCache(engine)
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    """Counts every request and times it up to the first response byte, labelled by route template."""
+    started = perf_counter()
+    response = await call_next(request)
+    seconds = perf_counter() - started
+    route = request.scope.get("route")
+    # Templates such as /search/{keyword} keep the label set small
+    path = route.path if route is not None else "unmatched"
+    if path != "/metrics":
+        metrics.inc("api_requests_total", route=path, status=response.status_code)
+        metrics.observe("api_request_seconds", seconds, route=path)
+        log_event("request", route=path, status=response.status_code, seconds=round(seconds, 6))
+    return response
+
+# Columns a client may ask for with fields=; msg_key is always returned, it is the page cursor
+DETECTION_FIELDS = ['msg_key', 'channel_name', 'content', 'message_timestamp', 'view_count',
+                    'forward_count', 'image_path', 'cleaned_content', 'has_detection', 'detection_count']
+PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 1000))
+MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 10000))
+# Rows fetched from the server-side cursor per round trip
+STREAM_BATCH_ROWS = int(os.getenv('API_STREAM_BATCH_ROWS', 500))
+# Schema dbt builds the marts in (the profile's target schema)
+MARTS_SCHEMA = os.getenv('MARTS_SCHEMA', 'staging')
+
+def _json_value(column, value):
+    """Same output as the old fillna(0) / image_path "0" -> "None" cleanup, without pandas."""
+    if value is None:
+        return 0
+    if column == 'image_path' and value == "0":
+        return "None"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def _select_fields(fields):
+    if not fields:
+        return DETECTION_FIELDS
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in DETECTION_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ['msg_key'] + [f for f in requested if f != 'msg_key']
+
+def _page_filters(confirmed_only, after, channel, date_from, date_to):
+    """WHERE clause of a keyset page over refined.medical_data; values are bound parameters."""
+    where = ["msg_key > :after"]
+    params = {"after": after}
+    if confirmed_only:
+        where.append("has_detection = TRUE")
+    if channel:
+        where.append("channel_name = :channel")
+        params["channel"] = channel
+    if date_from:
+        where.append("message_timestamp >= :date_from")
+        params["date_from"] = datetime.combine(date_from, time.min)
+    if date_to:
+        # Inclusive end date
+        where.append("message_timestamp < :date_to")
+        params["date_to"] = datetime.combine(date_to + timedelta(days=1), time.min)
+    return ' AND '.join(where), params
+
+def _mart_filters(date_column, channel=None, date_from=None, date_to=None):
+    """WHERE clause over one of the daily marts; both dates are inclusive."""
+    where, params = ["TRUE"], {}
+    if channel:
+        where.append("channel_name = :channel")
+        params["channel"] = channel
+    if date_from:
+        where.append(f"{date_column} >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        where.append(f"{date_column} <= :date_to")
+        params["date_to"] = date_to
+    return ' AND '.join(where), params
 
-# Database Connection
-DB_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-engine = create_engine(DB_URL)
+async def fetch_rows(sql, params):
+    """Runs a query against the small pre-aggregated marts and returns JSON-ready dicts."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text(sql), params)
+        return [{c: _json_value(c, v) for c, v in row.items()} for row in result.mappings()]
+
+async def stream_page(columns, confirmed_only=False, after=0, limit=PAGE_SIZE, channel=None,
+                date_from=None, date_to=None, fmt='json', query_params=()):
+    """
+    Streams one page of rows from a server-side cursor as a JSON array or
+    NDJSON, so memory per request stays flat however large the page or table.
+    The cursor for the next page goes in the X-Next-After header (and a Link
+    header with the request's other query parameters); it is absent on the last page.
+    """
+    where, params = _page_filters(confirmed_only, after, channel, date_from, date_to)
+    params.update(limit=limit, last=limit - 1)
+
+    conn = await engine.connect()
+    try:
+        # Probe the key that ends this page and whether anything follows it
+        probe = (await conn.execute(text(f"""
+            SELECT msg_key FROM refined.medical_data WHERE {where}
+            ORDER BY msg_key OFFSET :last LIMIT 2
+        """), params)).scalars().all()
+        # Run the query before returning, so SQL errors still become a 500
+        result = await conn.stream(text(f"""
+            SELECT {', '.join(columns)} FROM refined.medical_data WHERE {where}
+            ORDER BY msg_key LIMIT :limit
+        """), params)
+    except Exception:
+        await conn.close()
+        raise
+
+    async def body():
+        try:
+            separator = b"," if fmt == 'json' else b"\n"
+            first = True
+            if fmt == 'json':
+                yield b"["
+            # One chunk per cursor round trip instead of one per row
+            async for rows in result.partitions(STREAM_BATCH_ROWS):
+                chunk = separator.join(
+                    json.dumps({c: _json_value(c, v) for c, v in zip(columns, row)},
+                               ensure_ascii=False).encode('utf-8')
+                    for row in rows)
+                yield chunk if first or fmt != 'json' else separator + chunk
+                if fmt != 'json':
+                    yield separator
+                first = False
+            if fmt == 'json':
+                yield b"]"
+        finally:
+            await conn.close()
+
+    headers = {}
+    if len(probe) == 2:
+        headers["X-Next-After"] = str(probe[0])
+        # Same fields, filters and format as this page; only the cursor moves
+        query = [(k, v) for k, v in query_params if k != 'after'] + [('after', probe[0])]
+        headers["Link"] = f'<?{urlencode(query)}>; rel="next"'
+    media_type = "application/json" if fmt == 'json' else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to the Medical Data Warehouse API"}
 
+@app.get("/health")
+async def health():
+    """Liveness: the process is up. Pool figures show how close requests are to queueing."""
+    return {"status": "ok", "pool": pool_status(), "cache": cache.stats}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape target: request, latency and cache metrics of this process."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: the database answers through the pool within 2s. A saturated pool
+    only fails this when requests can no longer get a connection in time.
+    """
+    error = await check_database()
+    pool = pool_status()
+    if error:
+        return JSONResponse(status_code=503, content={
+            "status": "unavailable", "database": error or "ok", "pool": pool})
+    return {"status": "ready", "database": "ok", "pool": pool}
+
 @app.get("/detections")
-def get_all_medical_data():
-    """Fetches all cleaned medical records from the refined layer."""
+async def get_all_medical_data(
+    request: Request,
+    after: int = Query(0, description="Return rows with msg_key above this cursor (see X-Next-After)"),
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description="Comma-separated columns, e.g. msg_key,channel_name,cleaned_content"),
+    channel: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    fmt: str = Query('json', alias='format', pattern='^(json|ndjson)$'),
+):
+    """Fetches cleaned medical records from the refined layer, one keyset page at a time."""
+    columns = _select_fields(fields)
     try:
-        query = "SELECT * FROM refined.medical_data"
-        df = pd.read_sql(query, engine)
-        
-        # Clean data for JSON compliance
-        df['image_path'] = df['image_path'].replace({0: "None", "0": "None"})
-        df = df.fillna(0)
-        
-        return df.to_dict(orient="records")
+        return await cache.respond(request, lambda: stream_page(
+            columns, False, after, limit, channel, date_from, date_to, fmt,
+            request.query_params.multi_items()))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/search/{keyword}")
-def search_medical_data(keyword: str):
-    """Search for specific medical terms using safe parameterized queries."""
-    try:
-        # Using sqlalchemy.text to prevent SQL Injection
-        query = text("SELECT * FROM refined.medical_data WHERE cleaned_content ILIKE :key")
-        df = pd.read_sql(query, engine, params={"key": f"%{keyword}%"})
-        
-        if df.empty:
+async def search_medical_data(
+    request: Request,
+    keyword: str,
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    fuzzy: bool = Query(False, description="Also match misspelt words by trigram similarity"),
+    unique: bool = Query(False, description="Leave out near-duplicate reposts of an earlier message"),
+):
+    """Ranked full-text and substring search with highlighted snippets (see src/search_index.py)."""
+    async def run_search():
+        # Keyword and pattern are bound parameters, never formatted into the SQL
+        async with engine.connect() as conn:
+            hits = await conn.run_sync(search_messages, keyword, limit=limit, offset=offset, fuzzy=fuzzy,
+                                      unique=unique)
+
+        if not hits:
             return {"message": f"No records found for: {keyword}"}
-        
-        # Replace image_path 0 with "None" and handle NaNs for JSON compliance
-        df['image_path'] = df['image_path'].replace({0: "None", "0": "None"})
-        df = df.fillna(0) 
-            
-        return df.to_dict(orient="records")
+
+        # Replace image_path 0 with "None" and NULLs with 0, as before
+        return [{c: _json_value(c, v) for c, v in hit.items()} for hit in hits]
+
+    try:
+        return await cache.respond(request, run_search)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/detections/confirmed")
-def get_confirmed_detections():
-    """Returns only records where YOLO detected medical objects."""
+async def get_confirmed_detections(
+    request: Request,
+    after: int = Query(0, description="Return rows with msg_key above this cursor (see X-Next-After)"),
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    channel: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    fmt: str = Query('json', alias='format', pattern='^(json|ndjson)$'),
+):
+    """Returns only records where YOLO detected medical objects, paged like /detections."""
+    columns = _select_fields(fields)
+    try:
+        return await cache.respond(request, lambda: stream_page(
+            columns, True, after, limit, channel, date_from, date_to, fmt,
+            request.query_params.multi_items()))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/reports/top-products")
+async def top_products(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100),
+    channel: Optional[str] = None,
+    language: Optional[str] = Query(None, description="Lexicon language code, e.g. en, am, ar"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """Most mentioned medical terms and products, from the agg_term_frequency mart."""
+    where, params = _mart_filters("mention_date", channel, date_from, date_to)
+    if language:
+        where += " AND language = :language"
+        params["language"] = language
+    params["limit"] = limit
+    try:
+        return await cache.respond(request, lambda: fetch_rows(f"""
+            SELECT term, language,
+                   SUM(mention_count)::BIGINT AS mentions,
+                   COUNT(DISTINCT channel_name) AS channels,
+                   SUM(total_views)::BIGINT AS total_views
+            FROM {MARTS_SCHEMA}.agg_term_frequency
+            WHERE {where}
+            GROUP BY term, language
+            ORDER BY mentions DESC, term
+            LIMIT :limit
+        """, params))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/channels/{name}/activity")
+async def channel_activity(
+    request: Request,
+    name: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """A channel's lifetime totals and its posting activity per day."""
+    where, params = _mart_filters("activity_date", name, date_from, date_to)
+
+    async def build():
+        channel = await fetch_rows(f"""
+            SELECT channel_name, first_post_date, last_post_date, active_days,
+                   total_posts, total_views, avg_views, image_posts
+            FROM {MARTS_SCHEMA}.dim_channels WHERE channel_name = :channel
+        """, {"channel": name})
+        if not channel:
+            raise HTTPException(status_code=404, detail=f"Unknown channel: {name}")
+        daily = await fetch_rows(f"""
+            SELECT activity_date, message_count, text_count, image_count,
+                   total_views, avg_views, total_forwards
+            FROM {MARTS_SCHEMA}.agg_daily_channel_activity
+            WHERE {where}
+            ORDER BY activity_date
+        """, params)
+        return {"channel": channel[0], "daily": daily}
+
+    try:
+        return await cache.respond(request, build)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/reports/visual-content")
+async def visual_content(
+    request: Request,
+    channel: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """Image posts per channel and the share in which YOLO detected objects."""
+    where, params = _mart_filters("activity_date", channel, date_from, date_to)
     try:
-        query = "SELECT * FROM refined.medical_data WHERE has_detection = TRUE"
-        df = pd.read_sql(query, engine)
-        
-        # Standard cleaning
-        df['image_path'] = df['image_path'].replace({0: "None", "0": "None"})
-        df = df.fillna(0)
-        
-        return df.to_dict(orient="records")
+        return await cache.respond(request, lambda: fetch_rows(f"""
+            SELECT channel_name,
+                   SUM(image_posts)::BIGINT AS image_posts,
+                   SUM(detected_posts)::BIGINT AS detected_posts,
+                   ROUND(SUM(detected_posts)::NUMERIC / NULLIF(SUM(image_posts), 0), 4) AS detection_share,
+                   SUM(total_detections)::BIGINT AS total_detections,
+                   MODE() WITHIN GROUP (ORDER BY top_class) AS top_class
+            FROM {MARTS_SCHEMA}.agg_visual_content
+            WHERE {where}
+            GROUP BY channel_name
+            ORDER BY image_posts DESC, channel_name
+        """, params))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,97 @@
+# Filename: bench_api_concurrency.py
+# Author: MAYSHLAMY
+# Problem: Requests/sec at 100 concurrent clients, sync pandas handlers vs the async pooled API
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.load_api import sync_engine, seed
+
+
+def add_legacy_routes(app, engine):
+    """The previous handler shape: sync def + pd.read_sql on a default-pool engine."""
+    import pandas as pd
+    from sqlalchemy import text
+
+    @app.get("/legacy/detections")
+    def legacy_page(after: int = 0, limit: int = 100):
+        df = pd.read_sql(text("SELECT * FROM refined.medical_data WHERE msg_key > :after ORDER BY msg_key LIMIT :limit"),
+                         engine, params={"after": after, "limit": limit})
+        df['image_path'] = df['image_path'].replace({0: "None", "0": "None"})
+        df = df.fillna(0)
+        return df.to_dict(orient="records")
+
+
+async def hammer(client, make_url, total, concurrency):
+    """`concurrency` clients issue `total` requests back to back; returns req/s and latencies."""
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.get(make_url())
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started), latencies, errors
+
+
+async def run(args):
+    import httpx
+    from api.main import app
+
+    add_legacy_routes(app, sync_engine())
+    rng = random.Random(5)
+    page = lambda: rng.randrange(0, max(1, args.rows - args.limit))
+    scenarios = [
+        ("sync + pandas (before)", lambda: f"/legacy/detections?after={page()}&limit={args.limit}"),
+        ("async pooled (after)", lambda: f"/detections?after={page()}&limit={args.limit}"),
+        ("async, fields=msg_key,channel_name", lambda: f"/detections?after={page()}&limit={args.limit}"
+                                                       f"&fields=msg_key,channel_name"),
+        ("GET /health (no database)", lambda: "/health"),
+    ]
+    transport = httpx.ASGITransport(app=app)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None, limits=limits) as client:
+        for label, make_url in scenarios:
+            # Warm the pools and the prepared statement caches
+            await hammer(client, make_url, args.concurrency, args.concurrency)
+            rate, latencies, errors = await hammer(client, make_url, args.requests, args.concurrency)
+            print(f"{label:<36} {rate:8.0f} req/s  p50 {np.percentile(latencies, 50) * 1000:7.1f} ms  "
+                  f"p99 {np.percentile(latencies, 99) * 1000:7.1f} ms  errors={errors}")
+        print((await client.get("/health")).json())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="API concurrency benchmark. Replaces refined.medical_data: point it at a scratch database.")
+    parser.add_argument('--database', default='medical_warehouse_bench')
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--limit', type=int, default=100, help="rows per page")
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--no-seed', action='store_true')
+    args = parser.parse_args()
+
+    # api.database builds its engine from the environment at import time
+    os.environ['DB_NAME'] = args.database
+    if not args.no_seed:
+        print(f"--- Seeding {args.rows} rows into refined.medical_data ---")
+        seed(sync_engine(), args.rows)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
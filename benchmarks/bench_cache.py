@@ -0,0 +1,94 @@
+# Filename: bench_cache.py
+# Author: MAYSHLAMY
+# Problem: Cost of repeated dashboard polling: uncached vs cache hit vs 304, and after a data version bump
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.load_api import sync_engine, seed
+
+# What a dashboard polls: a page, a filtered page, the confirmed feed and a search
+DASHBOARD_URLS = [
+    "/detections?limit=1000",
+    "/detections?limit=1000&channel=bench_channel_7&date_from=2026-01-10&date_to=2026-01-20",
+    "/detections/confirmed?limit=500&fields=msg_key,channel_name",
+    "/search/dose?limit=20",
+]
+
+
+async def poll(client, repeats, etags=None):
+    latencies, statuses = [], {}
+    for _ in range(repeats):
+        for url in DASHBOARD_URLS:
+            headers = {"If-None-Match": etags[url]} if etags and etags.get(url) else {}
+            started = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return latencies, statuses
+
+
+def report(label, latencies, statuses):
+    print(f"{label:<30} p50 {np.percentile(latencies, 50) * 1000:7.2f} ms  "
+          f"p99 {np.percentile(latencies, 99) * 1000:7.2f} ms  status={statuses}")
+
+
+async def run(args):
+    import httpx
+    import api.cache
+    from api.main import app, cache
+    from src.data_version import bump_data_version
+
+    if args.fakeredis:
+        import fakeredis
+        cache.tiers.append(api.cache.RedisCache(fakeredis.FakeAsyncRedis()))
+    # Re-read the version on every request so the bump below is seen at once
+    api.cache.DATA_VERSION_TTL = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        api.cache.CACHE_ENABLED = False
+        report("uncached", *await poll(client, args.repeats))
+        api.cache.CACHE_ENABLED = True
+
+        report("first poll (miss, fills)", *await poll(client, 1))
+        report("cache hit", *await poll(client, args.repeats))
+        etags = {url: (await client.get(url)).headers.get("ETag") for url in DASHBOARD_URLS}
+        report("If-None-Match (304)", *await poll(client, args.repeats, etags))
+
+        bump_data_version(sync_engine().raw_connection())
+        report("after bump, old ETags", *await poll(client, 1, etags))
+        report("after bump, cache hit", *await poll(client, args.repeats))
+        if args.fakeredis:
+            # A second worker with an empty LRU still answers from Redis
+            cache.tiers[0] = api.cache.LRUCache()
+            report("fresh LRU, Redis hit", *await poll(client, args.repeats))
+        print(f"Cache stats: {cache.stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Response cache benchmark. Replaces refined.medical_data: point it at a scratch database.")
+    parser.add_argument('--database', default='medical_warehouse_bench')
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--fakeredis', action='store_true', help="add an in-memory Redis tier (pip install fakeredis)")
+    parser.add_argument('--no-seed', action='store_true')
+    args = parser.parse_args()
+
+    # api.database builds its engine from the environment at import time
+    os.environ['DB_NAME'] = args.database
+    if not args.no_seed:
+        print(f"--- Seeding {args.rows} rows into refined.medical_data ---")
+        seed(sync_engine(), args.rows)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# Filename: bench_dbt.py
+# Author: MAYSHLAMY
+# Problem: dbt run time of a full rebuild vs an incremental run of the staging and fact models
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database_loader import (get_db_connection, ensure_schema, stage_rows, upsert_staged,
+                                 new_load_id, record_batch, _message_rows)
+
+DBT_PROJECT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'medical_warehouse')
+MODELS = 'stg_telegram_messages fact_medical_messages'
+# What orchestrator.py runs (DBT_BUILD), tests included
+DBT_BUILD = ['build']
+
+
+def seed_raw(conn, rows, channels=50):
+    """Replaces raw.telegram_messages with `rows` messages in one load committed now."""
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS raw.telegram_messages")
+    ensure_schema(cur)
+    load_id = new_load_id(cur)
+    cur.execute("""
+        INSERT INTO raw.telegram_messages
+            (channel_name, message_id, message_date, message_text, has_media, views, forwards, image_path,
+             loaded_at, load_id)
+        SELECT 'channel_' || (g %% %(channels)s), g,
+               (TIMESTAMP '2026-02-17' - (g %% 86400) * INTERVAL '1 minute')::TEXT,
+               CASE WHEN g %% 7 = 0 THEN NULL ELSE 'Paracetamol 500mg and insulin pens in stock, message ' || g END,
+               g %% 2 = 0, g %% 5000, g %% 200,
+               CASE WHEN g %% 2 = 0 THEN 'data/raw/media/objects/' || md5(g::TEXT) || '.jpg' END,
+               now(), %(load_id)s
+        FROM generate_series(1, %(rows)s) g;
+        ANALYZE raw.telegram_messages;
+    """, {"rows": rows, "channels": channels, "load_id": load_id})
+    record_batch(cur, load_id, 'telegram_messages', rows)
+    conn.commit()
+    cur.close()
+
+
+def new_batch(conn, rows, updates, start):
+    """Appends `rows` new messages and edits `updates` existing ones in one load. Returns its load_id."""
+    cur = conn.cursor()
+    load_id = new_load_id(cur)
+    cur.execute("""
+        INSERT INTO raw.telegram_messages
+            (channel_name, message_id, message_date, message_text, has_media, views, forwards, load_id)
+        SELECT 'channel_' || (g %% 50), g, TIMESTAMP '2026-02-18'::TEXT,
+               'New stock of amoxicillin syrup, message ' || g, FALSE, 0, 0, %(load_id)s
+        FROM generate_series(%(start)s, %(start)s + %(rows)s - 1) g;
+        UPDATE raw.telegram_messages SET views = views + 1, loaded_at = now(), load_id = %(load_id)s
+        WHERE id IN (SELECT id FROM raw.telegram_messages ORDER BY id LIMIT %(updates)s);
+    """, {"rows": rows, "updates": updates, "start": start, "load_id": load_id})
+    record_batch(cur, load_id, 'telegram_messages', rows + updates)
+    conn.commit()
+    cur.close()
+    return load_id
+
+
+def dbt_run(args, *extra):
+    """Runs the orchestrator's dbt command on MODELS. Returns (seconds, rows written per model)."""
+    command = [args.dbt, *DBT_BUILD, '--select', MODELS, *extra]
+    if args.profiles_dir:
+        command += ['--profiles-dir', args.profiles_dir]
+    started = time.perf_counter()
+    subprocess.run(command, cwd=DBT_PROJECT, check=True, stdout=subprocess.DEVNULL)
+    seconds = time.perf_counter() - started
+    with open(os.path.join(DBT_PROJECT, 'target', 'run_results.json')) as f:
+        results = json.load(f)['results']
+    written = {r['unique_id'].split('.')[-1]: r['adapter_response'].get('rows_affected', 0)
+               for r in results if r['unique_id'].startswith('model.')}
+    return seconds, written
+
+
+def overlapping_load(args, conn, message_id):
+    """
+    Writes one message through the loader's upsert but holds its commit while a
+    later load commits and dbt runs, as happens when backfill runs overlap. Then
+    commits it and runs dbt again. Returns whether the message reached the fact table.
+    """
+    held = get_db_connection(args.database)
+    cur = held.cursor()
+    ensure_schema(cur)
+    held.commit()
+    stage_rows(cur, _message_rows([{
+        "channel_name": "channel_overlap", "message_id": message_id, "message_date": "2026-02-19 08:00:00",
+        "message_text": "Late insulin pens delivery", "has_media": False, "views": 0, "forwards": 0,
+        "image_path": None}]))
+    load_id = new_load_id(cur)
+    upsert_staged(cur, load_id)
+    new_batch(conn, 10, 0, message_id + 1)
+    dbt_run(args)
+    record_batch(cur, load_id, 'telegram_messages', 1)
+    held.commit()
+    held.close()
+    dbt_run(args)
+
+    check = conn.cursor()
+    check.execute("SELECT COUNT(*) FROM staging.fact_medical_messages WHERE channel_name = 'channel_overlap' "
+                  "AND message_id = %s", (message_id,))
+    found = check.fetchone()[0] == 1
+    check.close()
+    conn.commit()
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="dbt incremental benchmark. Replaces raw.telegram_messages and the dbt models: "
+                    "point DB_NAME and the dbt profile at a scratch database.")
+    parser.add_argument('--database', default='medical_warehouse_bench')
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--batch', type=int, default=20_000, help="new messages per incremental load")
+    parser.add_argument('--updates', type=int, default=2_000, help="edited messages per incremental load")
+    parser.add_argument('--dbt', default='dbt')
+    parser.add_argument('--profiles-dir')
+    args = parser.parse_args()
+
+    conn = get_db_connection(args.database)
+    print(f"--- Seeding {args.rows} raw messages ---")
+    seed_raw(conn, args.rows)
+
+    def report(label, run):
+        seconds, written = run
+        rows = ', '.join(f"{model} {count}" for model, count in sorted(written.items()))
+        print(f"{label:<52} {seconds:7.1f}s   rows written: {rows}")
+        return written
+
+    report("Full rebuild (--full-refresh)", dbt_run(args, '--full-refresh'))
+    idle = report("Incremental, nothing new", dbt_run(args))
+    load_id = new_batch(conn, args.batch, args.updates, args.rows + 1)
+    batch = report(f"Incremental, {args.batch} new + {args.updates} edited", dbt_run(args))
+    report("Full rebuild again", dbt_run(args, '--full-refresh'))
+
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM raw.telegram_messages WHERE load_id = %s "
+                "AND (message_text IS NOT NULL OR has_media)", (load_id,))
+    assert not any(idle.values()), "an incremental run with nothing new rewrote rows"
+    assert batch['stg_telegram_messages'] == cur.fetchone()[0], "the new batch was not read exactly once"
+
+    cur.execute("""
+        SELECT (SELECT COUNT(*) FROM staging.fact_medical_messages),
+               (SELECT COUNT(*) FROM (SELECT 1 FROM staging.fact_medical_messages
+                                      GROUP BY channel_name, message_id HAVING COUNT(*) > 1) d)
+    """)
+    rows, duplicates = cur.fetchone()
+    cur.close()
+    # The held load's ensure_schema() waits for open transactions on raw.telegram_messages
+    conn.commit()
+    print(f"Fact rows: {rows}, duplicate (channel_name, message_id): {duplicates}")
+
+    # A load committing after a later one (and after dbt read its batch) gets the higher batch id
+    found = overlapping_load(args, conn, args.rows + args.batch + 1_000_000)
+    print(f"Overlapping load: {'picked up by the next run' if found else 'skipped for good'}")
+    assert found, "a load overlapping a dbt run never reached fact_medical_messages"
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# Filename: bench_dedup.py
+# Author: MAYSHLAMY
+# Problem: MinHash/LSH near-duplicate clustering vs pairwise comparison on a reposted-ads corpus
+
+import os
+import sys
+import time
+import random
+import resource
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import multilingual_text, FILLER_WORDS
+from src.text_classifier import load_lexicon
+from src.near_duplicates import NearDuplicateIndex, normalize, THRESHOLD, SHINGLE_SIZE
+
+
+def repost_corpus(n, repost_rate, seed=7):
+    """
+    n messages in msg_key order. A share are reposts of an earlier original
+    with 0-3 words swapped and sometimes a channel sign-off, the way pharmacy
+    channels copy each other's ads. Returns (texts, origin), origin being the
+    index of the original each message copies (its own index for originals).
+    """
+    rng = random.Random(seed)
+    lexicon = load_lexicon()
+    vocabulary = [w for words in FILLER_WORDS.values() for w in words]
+    texts, origin, originals = [], [], []
+    for i in range(n):
+        if originals and rng.random() < repost_rate:
+            # Popular ads are reposted far more often than the rest
+            source = originals[min(int(rng.paretovariate(1.2)) - 1, len(originals) - 1)
+                               if rng.random() < 0.5 else rng.randrange(len(originals))]
+            words = texts[source].split()
+            for _ in range(rng.randint(0, 3)):
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+            if rng.random() < 0.3:
+                words.append(f"@pharma_{rng.randint(1, 50)}")
+            texts.append(' '.join(words))
+            origin.append(source)
+        else:
+            texts.append(multilingual_text(rng, lexicon))
+            origin.append(i)
+            originals.append(i)
+    return texts, np.array(origin)
+
+
+def shingles(text):
+    text = normalize(text)
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a, b):
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate clustering benchmark")
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--repost-rate', type=float, default=0.3)
+    parser.add_argument('--chunksize', type=int, default=50000, help="batch size, as in the cleaner")
+    parser.add_argument('--pairwise-sample', type=int, default=5000,
+                        help="messages compared all-against-all to extrapolate the O(n²) baseline")
+    parser.add_argument('--quality-sample', type=int, default=5000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    # One extra batch arrives after the history is built, as in the next scheduled run
+    texts, origin = repost_corpus(args.messages + args.chunksize, args.repost_rate)
+    keys = np.arange(1, args.messages + args.chunksize + 1)
+    print(f"--- {args.messages} messages, {(origin != np.arange(len(origin))).mean():.0%} reposts "
+          f"(generated in {time.perf_counter() - started:.1f}s) ---")
+
+    index_path = os.path.join(tempfile.mkdtemp(prefix="bench_dedup_"), "near_duplicates.sqlite")
+    index = NearDuplicateIndex(index_path)
+    clusters = np.empty(len(keys), dtype=np.int64)
+    batch_seconds = []
+    for start in range(0, args.messages, args.chunksize):
+        stop = start + args.chunksize
+        batch_started = time.perf_counter()
+        clusters[start:stop], _ = index.assign(keys[start:stop], texts[start:stop])
+        index.commit()
+        batch_seconds.append(time.perf_counter() - batch_started)
+    index.close()
+    total = sum(batch_seconds)
+    duplicates = int((clusters[:args.messages] != keys[:args.messages]).sum())
+    print(f"{'MinHash/LSH, incremental batches':<40} {total:8.2f}s  {args.messages / total:9.0f} msg/s")
+    print(f"{'  first batch (empty history)':<40} {batch_seconds[0]:8.2f}s")
+    print(f"{'  last batch':<40} {batch_seconds[-1]:8.2f}s  "
+          f"(history of {args.messages - args.chunksize} messages)")
+    print(f"{'  clusters / near-duplicates':<40} {len(np.unique(clusters[:args.messages])):8}   "
+          f"{duplicates} flagged")
+    print(f"{'  index size':<40} {os.path.getsize(index_path) / 2**20:8.1f} MiB  "
+          f"peak RSS {peak_rss_mib():.0f} MiB")
+
+    # Next run: a new process opens the index, loads its buckets and checks one batch against history
+    started = time.perf_counter()
+    index = NearDuplicateIndex(index_path)
+    clusters[args.messages:], _ = index.assign(keys[args.messages:], texts[args.messages:])
+    index.commit()
+    index.close()
+    print(f"{'next run: open index + one new batch':<40} {time.perf_counter() - started:8.2f}s  "
+          f"{int((clusters[args.messages:] != keys[args.messages:]).sum())} of {args.chunksize} "
+          f"matched earlier posts")
+
+    # The O(n²) alternative: every pair's signatures compared, timed on a sample and scaled up
+    m = min(args.pairwise_sample, args.messages)
+    sample = NearDuplicateIndex(os.path.join(os.path.dirname(index_path), "pairwise.sqlite"))
+    signatures = sample.signatures([normalize(t) for t in texts[:m]])
+    pair_started = time.perf_counter()
+    similar_pairs = 0
+    for i in range(m - 1):
+        similar_pairs += int(((signatures[i + 1:] == signatures[i]).mean(axis=1) >= THRESHOLD).sum())
+    pair_seconds = time.perf_counter() - pair_started
+    sample.close()
+    projected = pair_seconds * (args.messages / m) ** 2
+    print(f"{f'pairwise signatures, {m} messages':<40} {pair_seconds:8.2f}s  "
+          f"({m * (m - 1) // 2} pairs, {similar_pairs} similar)")
+    print(f"{f'  projected to {args.messages} messages':<40} {projected:8.0f}s  "
+          f"({projected / total:.0f}x the LSH run)")
+
+    # Quality against exact shingle Jaccard similarity
+    rng = np.random.default_rng(11)
+    reposts = np.flatnonzero(origin != np.arange(len(origin)))
+    reposts = rng.choice(reposts, min(args.quality_sample, len(reposts)), replace=False)
+    similar = [i for i in reposts if jaccard(texts[i], texts[origin[i]]) >= THRESHOLD]
+    found = sum(clusters[i] == clusters[origin[i]] for i in similar)
+    flagged = np.flatnonzero(clusters != keys)
+    flagged = rng.choice(flagged, min(args.quality_sample, len(flagged)), replace=False)
+    close = sum(jaccard(texts[i], texts[clusters[i] - 1]) >= THRESHOLD - 0.1 for i in flagged)
+    print(f"{'recall (reposts with Jaccard >= ' + str(THRESHOLD) + ')':<40} "
+          f"{found / max(len(similar), 1):8.1%}  of {len(similar)} sampled")
+    print(f"{'precision (flagged, Jaccard >= ' + str(round(THRESHOLD - 0.1, 2)) + ')':<40} "
+          f"{close / max(len(flagged), 1):8.1%}  of {len(flagged)} sampled")
+
+
+if __name__ == '__main__':
+    main()
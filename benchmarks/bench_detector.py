@@ -0,0 +1,91 @@
+# Filename: bench_detector.py
+# Author: MAYSHLAMY
+# Problem: Images/sec and p95 per-image latency of the one-by-one YOLO loop vs the batch engine
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import cv2
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.stub_yolo import StubYOLO
+from src.object_detector import MedicalObjectDetector, iter_images
+
+
+class TimedModel:
+    """Wraps a model to record how long each call takes (one image per call in the legacy loop)."""
+
+    def __init__(self, model):
+        self.model = model
+        self.names = model.names
+        self.latencies = []
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.model(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def write_images(folder, count, seed=7, size=(720, 960)):
+    """Writes `count` random JPEGs shaped like channel photos."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        image = rng.integers(0, 256, size=(size[0] // 8, size[1] // 8, 3), dtype=np.uint8)
+        image = cv2.resize(image, (size[1], size[0]), interpolation=cv2.INTER_CUBIC)
+        cv2.imwrite(os.path.join(folder, f"{i:06d}.jpg"), image)
+
+
+def report(label, count, elapsed, latencies):
+    p95 = float(np.percentile(latencies, 95)) * 1000 if latencies else 0.0
+    print(f"{label:<28} {count / elapsed:9.1f} img/s  p95 {p95:8.1f} ms/img ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Object detector throughput benchmark")
+    parser.add_argument('--images', type=int, default=200, help="synthetic images to generate")
+    parser.add_argument('--image-dir', help="use an existing image folder instead")
+    parser.add_argument('--model', default='stub', help="'stub' or YOLO weights such as yolov8n.pt")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--prefetch-workers', type=int, default=4)
+    parser.add_argument('--shards', type=int, default=2)
+    args = parser.parse_args()
+
+    image_dir = args.image_dir or os.path.join(tempfile.mkdtemp(prefix="bench_detector_"), "images")
+    if not args.image_dir:
+        write_images(image_dir, args.images)
+    paths = list(iter_images(image_dir))
+    # The legacy loop saves annotated images into the working directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_detector_out_"))
+
+    factory = StubYOLO if args.model == 'stub' else None
+    detector = MedicalObjectDetector(args.model, model_factory=factory)
+    timed = TimedModel(detector.model)
+    detector.model = timed
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        detector.detect_in_folder(image_dir)
+    report("detect_in_folder (legacy)", len(paths), time.perf_counter() - started, timed.latencies)
+    detector.model = timed.model
+
+    runs = [("batched", 1, False), (f"batched x{args.shards} shards", args.shards, False),
+            ("batched + annotated", 1, True)]
+    for label, shards, save in runs:
+        started = time.perf_counter()
+        records = detector.detect_batched(paths, batch_size=args.batch_size,
+                                          prefetch_workers=args.prefetch_workers, shards=shards,
+                                          save_annotated=save, output_dir='detections')
+        report(label, len(records), time.perf_counter() - started, [r["latency"] for r in records])
+
+
+if __name__ == '__main__':
+    main()
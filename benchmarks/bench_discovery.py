@@ -0,0 +1,74 @@
+# Filename: bench_discovery.py
+# Author: MAYSHLAMY
+# Problem: Sequential uncached channel discovery vs concurrent, cached and ranked discovery
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from telethon import functions
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fake_telegram import FakeTelegramClient
+from src.channel_discovery import ChannelDiscovery, DiscoveryCache, KEYWORDS
+
+LEGACY_KEYWORDS = ['medicine', 'pharmacy', 'health', 'ethiopia medical']
+
+
+async def legacy_discovery(client):
+    """The previous get_discovered_channels(): four searches one after another, an unranked set."""
+    found = set()
+    for query in LEGACY_KEYWORDS:
+        result = await client(functions.contacts.SearchRequest(q=query, limit=20))
+        for chat in result.chats:
+            if getattr(chat, 'username', None) and getattr(chat, 'broadcast', False):
+                found.add(chat.username)
+    return list(found)
+
+
+def timed(label, client, coroutine):
+    before = client.calls["requests"] + client.calls["pages"]
+    started = time.perf_counter()
+    result = asyncio.run(coroutine)
+    elapsed = time.perf_counter() - started
+    requests = client.calls["requests"] + client.calls["pages"] - before
+    print(f"{label:<40} {elapsed:7.2f}s {requests:5} requests {len(result):4} channels to scrape")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Channel discovery benchmark against the offline fake client")
+    parser.add_argument('--discoverable', type=int, default=200, help="channels the fake search can return")
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds per simulated Telegram request")
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    client = FakeTelegramClient(latency=args.latency, discoverable_channels=args.discoverable)
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="bench_discovery_"), "discovery_cache.json")
+    print(f"--- {len(LEGACY_KEYWORDS)} legacy keywords vs {len(KEYWORDS)} keywords, "
+          f"{args.latency * 1000:.0f} ms per request ---")
+
+    timed("legacy: sequential, uncached, unranked", client, legacy_discovery(client))
+    discovery = lambda: ChannelDiscovery(client, cache=DiscoveryCache(cache_path), concurrency=args.concurrency)
+    cold = timed("concurrent, cold cache", client, _quiet(discovery().discover()))
+    ranked = timed("concurrent, warm cache (within TTL)", client, _quiet(discovery().discover()))
+    print("--- Top of the ranking ---")
+    for p in ranked[:5]:
+        print(f"{p['username']:<24} score {p['score']:.3f}  medical {p['medical_rate']:.0%}  "
+              f"{p['subscribers']:>7} subs  {p['posts_per_day']:.2f} posts/day")
+    assert [p["username"] for p in cold] == [p["username"] for p in ranked]
+
+
+async def _quiet(coroutine):
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        return await coroutine
+    finally:
+        sys.stdout = stdout
+
+
+if __name__ == '__main__':
+    main()
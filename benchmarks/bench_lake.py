@@ -0,0 +1,118 @@
+# Filename: bench_lake.py
+# Author: MAYSHLAMY
+# Problem: Size, scan speed and load speed of the Parquet lake vs the scraped JSON files
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from collections import Counter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import write_json_corpus
+from src.database_loader import get_db_connection, iter_json_files, load_json_to_postgres, load_parquet_to_postgres
+from src.lake import compact_json, iter_lake_files, query
+
+
+def timed(label, fn):
+    """Runs fn() with its progress prints silenced and prints the wall time."""
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+    finally:
+        sys.stdout = stdout
+    print(f"{label:<48} {elapsed:8.2f}s")
+    return result, elapsed
+
+
+def folder_bytes(paths):
+    return sum(os.path.getsize(p) for p in paths)
+
+
+def json_term_counts(base_path, term):
+    """Messages per channel mentioning `term`, the way an analysis over the raw files works today."""
+    counts = Counter()
+    for file_path in iter_json_files(base_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for msg in json.load(f):
+                if term in (msg["message_text"] or "").lower():
+                    counts[msg["channel_name"]] += 1
+    return counts
+
+
+def json_day_views(base_path, day):
+    totals = Counter()
+    for file_path in iter_json_files(base_path, dates=[day]):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for msg in json.load(f):
+                totals[msg["channel_name"]] += msg["views"]
+    return totals
+
+
+def reset_raw_schema(conn):
+    cur = conn.cursor()
+    cur.execute("DROP SCHEMA IF EXISTS raw CASCADE")
+    conn.commit()
+    cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parquet lake benchmark. With --database, also compares Postgres loads from JSON and "
+                    "Parquet; that drops and recreates the raw schema, so use a scratch database.")
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--database', help="scratch database for the load comparison")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_lake_")
+    base_path = os.path.join(workdir, "telegram_messages")
+    lake_dir = os.path.join(workdir, "lake")
+    try:
+        print(f"--- Writing {args.messages} synthetic messages to {base_path} ---")
+        json_files = write_json_corpus(base_path, args.messages, channels=args.channels, days=args.days)
+
+        totals, _ = timed("Compact JSON -> Parquet (zstd)", lambda: compact_json(base_path, lake_dir))
+        json_size, lake_size = folder_bytes(json_files), folder_bytes(iter_lake_files(lake_dir))
+        print(f"{'JSON size':<48} {json_size / 2**20:8.1f} MiB")
+        print(f"{'Parquet size':<48} {lake_size / 2**20:8.1f} MiB ({json_size / lake_size:.1f}x smaller)")
+        timed("Re-run compaction (all files up to date)", lambda: compact_json(base_path, lake_dir))
+
+        term = "paracetamol"
+        from_json, json_seconds = timed(f"'{term}' per channel: JSON files", lambda: json_term_counts(base_path, term))
+        from_lake, lake_seconds = timed(f"'{term}' per channel: DuckDB over lake", lambda: query(
+            "SELECT channel, COUNT(*) AS n FROM messages WHERE lower(message_text) LIKE ? GROUP BY 1",
+            [f"%{term}%"], lake_dir=lake_dir))
+        assert dict(zip(from_lake["channel"].to_pylist(), from_lake["n"].to_pylist())) == dict(from_json)
+        print(f"{'  speedup':<48} {json_seconds / lake_seconds:8.1f}x")
+
+        day = os.path.basename(os.path.dirname(json_files[0]))
+        _, json_seconds = timed(f"Views per channel on {day}: JSON files", lambda: json_day_views(base_path, day))
+        _, lake_seconds = timed(f"Views per channel on {day}: DuckDB (pruned)", lambda: query(
+            "SELECT channel, SUM(views) FROM messages WHERE date = CAST(? AS DATE) GROUP BY 1",
+            [day], lake_dir=lake_dir))
+        print(f"{'  speedup':<48} {json_seconds / lake_seconds:8.1f}x")
+
+        if args.database:
+            conn = get_db_connection(args.database)
+            reset_raw_schema(conn)
+            _, json_seconds = timed("Postgres load from JSON (COPY + upsert)",
+                                    lambda: load_json_to_postgres(base_path, conn=conn))
+            reset_raw_schema(conn)
+            _, lake_seconds = timed("Postgres load from Parquet (Arrow CSV COPY)",
+                                    lambda: load_parquet_to_postgres(lake_dir, conn=conn))
+            print(f"{'  speedup':<48} {json_seconds / lake_seconds:8.1f}x")
+            conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
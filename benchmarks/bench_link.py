@@ -0,0 +1,140 @@
+# Filename: bench_link.py
+# Author: MAYSHLAMY
+# Problem: Per-file LIKE updates vs the set-based detection linker
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+from psycopg2.extras import execute_values
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database_loader import get_db_connection, ensure_schema
+from src.detection_sink import ensure_detection_schema
+from src.link_detections import link_results
+
+
+def object_path(i):
+    sha = hashlib.sha256(str(i).encode()).hexdigest()
+    return os.path.join('data/raw/media', 'objects', sha[:2], f"{sha}.jpg"), sha
+
+
+def build_warehouse(conn, rows, detections, folder):
+    """raw + refined tables with `rows` messages (half with photos) and `detections` detected images."""
+    cur = conn.cursor()
+    cur.execute("DROP SCHEMA IF EXISTS raw CASCADE; DROP SCHEMA IF EXISTS refined CASCADE")
+    ensure_schema(cur)
+    execute_values(cur, """
+        INSERT INTO raw.telegram_messages (channel_name, message_id, message_date, message_text, has_media, image_path)
+        VALUES %s
+    """, [(f"bench_channel_{i % 50}", i, '2026-02-17 08:00:00+00:00', f"message {i}", i % 2 == 0,
+           object_path(i)[0] if i % 2 == 0 else None) for i in range(rows)], page_size=5000)
+    ensure_detection_schema(cur)
+
+    photo_ids = list(range(0, rows, 2))[:detections]
+    execute_values(cur, """
+        INSERT INTO refined.image_detections
+        (image_hash, image_path, channel_name, message_id, class_name, confidence, model_name)
+        VALUES %s
+    """, [(object_path(i)[1], object_path(i)[0], f"bench_channel_{i % 50}", i, 'bottle', 0.8, 'bench')
+          for i in photo_ids], page_size=5000)
+    conn.commit()
+    cur.close()
+
+    os.makedirs(folder, exist_ok=True)
+    for i in photo_ids:
+        open(os.path.join(folder, f"detected_{object_path(i)[1]}.jpg"), 'wb').close()
+
+
+def reset_refined(conn):
+    """A fresh, unlinked refined.medical_data, as data_cleaner.py's full mode leaves it."""
+    cur = conn.cursor()
+    cur.execute("""
+        DROP TABLE IF EXISTS refined.medical_data;
+        CREATE TABLE refined.medical_data AS
+        SELECT id AS msg_key, channel_name, message_text AS content, image_path, message_text AS cleaned_content
+        FROM raw.telegram_messages;
+    """)
+    conn.commit()
+    cur.close()
+
+
+def legacy_link(conn, folder, limit):
+    """The previous linker: one leading-wildcard LIKE update per detected file."""
+    cur = conn.cursor()
+    cur.execute("""
+        ALTER TABLE refined.medical_data
+        ADD COLUMN IF NOT EXISTS has_detection BOOLEAN DEFAULT FALSE,
+        ADD COLUMN IF NOT EXISTS detection_count INTEGER DEFAULT 0;
+    """)
+    conn.commit()
+    detected_files = [f for f in os.listdir(folder) if f.startswith('detected_')][:limit]
+    for file_name in detected_files:
+        original_name = file_name.replace('detected_', '')
+        cur.execute("UPDATE refined.medical_data SET has_detection = TRUE WHERE image_path LIKE %s",
+                    (f"%{original_name}%",))
+    conn.commit()
+    cur.close()
+    return len(detected_files)
+
+
+def flagged(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FILTER (WHERE has_detection), COALESCE(SUM(detection_count), 0) FROM refined.medical_data")
+    result = cur.fetchone()
+    cur.close()
+    return result
+
+
+def timed(label, conn, fn, detections):
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+    finally:
+        sys.stdout = stdout
+    rows, counted = flagged(conn)
+    print(f"{label:<28} {detections:>7} detections {elapsed:8.2f}s {detections / elapsed:10.0f} det/s "
+          f"flagged={rows} detection_count={counted}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Linker benchmark. Drops and recreates the raw and refined schemas: point it at a scratch database.")
+    parser.add_argument('--database', default='medical_warehouse_bench')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--detections', type=int, default=10_000)
+    parser.add_argument('--legacy-detections', type=int, default=1_000,
+                        help="cap for the per-file loop, which scans the table once per file")
+    args = parser.parse_args()
+
+    folder = os.path.join(tempfile.mkdtemp(prefix="bench_link_"), "detections")
+    conn = get_db_connection(args.database)
+    print(f"--- Building {args.rows} messages with {args.detections} detected images ---")
+    build_warehouse(conn, args.rows, args.detections, folder)
+
+    reset_refined(conn)
+    legacy_count = min(args.legacy_detections, args.detections)
+    legacy = timed("per-file LIKE (legacy)", conn, lambda: legacy_link(conn, folder, legacy_count), legacy_count)
+
+    reset_refined(conn)
+    table = timed("set-based, detections table", conn, lambda: link_results(source='table', conn=conn),
+                  args.detections)
+    # Nothing changed, so a second pass should touch no rows
+    timed("  re-run (already linked)", conn, lambda: link_results(source='table', conn=conn), args.detections)
+
+    reset_refined(conn)
+    timed("set-based, legacy folder", conn, lambda: link_results(folder, source='folder', conn=conn),
+          args.detections)
+
+    print(f"speedup (per detection) {legacy / legacy_count / (table / args.detections):.0f}x")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Filename: bench_loader.py
+# Author: MAYSHLAMY
+# Problem: Rows/sec of the per-row INSERT loader vs the bulk COPY + upsert loader
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import write_json_corpus
+from src.database_loader import get_db_connection, iter_json_files, load_json_to_postgres
+
+
+def reset_raw_schema(conn):
+    cur = conn.cursor()
+    cur.execute("DROP SCHEMA IF EXISTS raw CASCADE")
+    conn.commit()
+    cur.close()
+
+
+def legacy_load(conn, base_path, max_rows):
+    """The previous loader: one INSERT per message, one transaction, no key."""
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE SCHEMA IF NOT EXISTS raw;
+        CREATE TABLE raw.telegram_messages (
+            id SERIAL PRIMARY KEY, channel_name TEXT, message_id BIGINT, message_date TEXT,
+            message_text TEXT, has_media BOOLEAN, views INTEGER, forwards INTEGER, image_path TEXT
+        );
+    """)
+    conn.commit()
+    rows = 0
+    for file_path in iter_json_files(base_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for msg in json.load(f):
+                cur.execute("""
+                    INSERT INTO raw.telegram_messages
+                    (channel_name, message_id, message_date, message_text, has_media, views, forwards, image_path)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, (msg['channel_name'], msg['message_id'], msg['message_date'], msg['message_text'],
+                      msg['has_media'], msg['views'], msg['forwards'], msg['image_path']))
+                rows += 1
+                if rows >= max_rows:
+                    conn.commit()
+                    return rows
+    conn.commit()
+    return rows
+
+
+def timed(label, fn):
+    """Runs fn() with its progress prints silenced; fn returns the number of rows handled."""
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        started = time.perf_counter()
+        rows = fn()
+        elapsed = time.perf_counter() - started
+    finally:
+        sys.stdout = stdout
+    print(f"{label:<28} {rows:>10} rows {elapsed:8.1f}s {rows / elapsed:12.0f} rows/s")
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Loader benchmark. Drops and recreates the raw schema: point it at a scratch database.")
+    parser.add_argument('--database', default='medical_warehouse_bench')
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--legacy-rows', type=int, default=100_000,
+                        help="cap for the per-row loader, which is too slow for the full corpus")
+    args = parser.parse_args()
+
+    base_path = os.path.join(tempfile.mkdtemp(prefix="bench_loader_"), "telegram_messages")
+    print(f"--- Writing {args.messages} synthetic messages to {base_path} ---")
+    write_json_corpus(base_path, args.messages)
+
+    conn = get_db_connection(args.database)
+
+    reset_raw_schema(conn)
+    legacy = timed("per-row INSERT (legacy)", lambda: legacy_load(conn, base_path, args.legacy_rows))
+
+    rates = {}
+    for method in ('copy', 'values'):
+        reset_raw_schema(conn)
+        rates[method] = timed(f"bulk {method} + upsert",
+                              lambda: load_json_to_postgres(base_path, method=method, conn=conn)["rows"])
+
+    # A re-run should skip every file through the manifest
+    timed("re-run (manifest skip)", lambda: load_json_to_postgres(base_path, conn=conn)["rows"])
+    print(f"COPY speedup over per-row INSERT: {rates['copy'] / legacy:.1f}x")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
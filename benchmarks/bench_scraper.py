@@ -0,0 +1,60 @@
+# Filename: bench_scraper.py
+# Author: MAYSHLAMY
+# Problem: Serial vs concurrent scraping throughput against the offline fake client
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fake_telegram import FakeTelegramClient
+from src.scraper import Solution
+
+
+def run_once(channels, channel_concurrency, media_concurrency, args):
+    client = FakeTelegramClient(
+        messages_per_channel=args.messages,
+        latency=args.latency,
+        flood_wait_rate=args.flood_rate,
+        flood_wait_seconds=args.flood_seconds,
+    )
+    sol = Solution(client=client, channel_concurrency=channel_concurrency,
+                   media_concurrency=media_concurrency)
+    started = time.perf_counter()
+    asyncio.run(sol.scrape_all(channels))
+    elapsed = time.perf_counter() - started
+    messages = sum(s["messages"] for s in sol.stats.values())
+    size = sum(s["bytes"] for s in sol.stats.values())
+    return elapsed, messages, size, client.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs concurrent scraping benchmark")
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--channel-concurrency', type=int, default=4)
+    parser.add_argument('--media-concurrency', type=int, default=8)
+    parser.add_argument('--flood-rate', type=float, default=0.0)
+    parser.add_argument('--flood-seconds', type=int, default=1)
+    args = parser.parse_args()
+
+    channels = [f"fake_channel_{i}" for i in range(args.channels)]
+
+    for label, cc, mc in [("serial", 1, 1),
+                          ("concurrent", args.channel_concurrency, args.media_concurrency)]:
+        # The scraper writes relative to the working directory; a fresh one per run, or the
+        # second run would find every channel scraped and the photos stored already
+        os.chdir(tempfile.mkdtemp(prefix="bench_scraper_"))
+        elapsed, messages, size, calls = run_once(channels, cc, mc, args)
+        print(f"{label:<11} channels={cc:<3} media={mc:<3} {elapsed:7.2f}s "
+              f"{messages / elapsed:9.1f} msg/s {size / elapsed / 1024:10.1f} KiB/s "
+              f"flood_waits={calls['flood_waits']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# Filename: bench_search.py
+# Author: MAYSHLAMY
+# Problem: /search latency of the ILIKE full scan vs the GIN full-text + trigram index
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import multilingual_text
+from src.text_classifier import load_lexicon
+
+KEYWORDS = ['patient', 'dose guidelines', 'Marburg', 'ሐኪም', 'علاج', 'sarcoidosis']
+FUZZY_KEYWORDS = ['hospitl', 'medicaton']
+
+
+def seed(engine, rows, seed=11):
+    """Writes `rows` multilingual messages into a fresh refined.medical_data."""
+    rng = random.Random(seed)
+    lexicon = load_lexicon()
+    buffer = io.StringIO()
+    for key in range(1, rows + 1):
+        content = ' '.join(multilingual_text(rng, lexicon).split())
+        buffer.write(f"{key}\tbench_channel_{key % 50}\t{content}\t{content}\n")
+    buffer.seek(0)
+    raw_conn = engine.raw_connection()
+    try:
+        cur = raw_conn.cursor()
+        cur.execute("""
+            CREATE SCHEMA IF NOT EXISTS refined;
+            DROP TABLE IF EXISTS refined.medical_data;
+            CREATE TABLE refined.medical_data (
+                msg_key BIGINT PRIMARY KEY, channel_name TEXT, content TEXT,
+                message_timestamp TIMESTAMP DEFAULT '2026-02-17', view_count INTEGER DEFAULT 0,
+                forward_count INTEGER DEFAULT 0, image_path TEXT, cleaned_content TEXT,
+                has_detection BOOLEAN DEFAULT FALSE, detection_count INTEGER DEFAULT 0
+            );
+        """)
+        cur.copy_expert("COPY refined.medical_data (msg_key, channel_name, content, cleaned_content) FROM STDIN",
+                        buffer)
+        cur.execute("ANALYZE refined.medical_data")
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+
+def timed_runs(fn, repeats):
+    latencies, hits = [], 0
+    for _ in range(repeats):
+        started = time.perf_counter()
+        hits = fn()
+        latencies.append(time.perf_counter() - started)
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000, hits
+
+
+def check_trigram_branches(conn):
+    """
+    Both sides of the pg_trgm switch in src/search_index.py. Without the
+    extension a fuzzy search still answers from the full-text and substring
+    matches; with it a misspelling finds the word and the trigram index exists.
+    """
+    from sqlalchemy import text
+    import src.search_index as search_index
+    installed = search_index.has_trigram(conn, cached=False)
+    try:
+        search_index._trigram = False
+        assert search_index.search_messages(conn, 'hospital', fuzzy=True), "no hits without pg_trgm"
+        assert not search_index.search_messages(conn, 'hospitl', fuzzy=True), "fuzzy match without pg_trgm"
+        print("without pg_trgm: fuzzy=true falls back to full-text and substring matches")
+        if not installed:
+            print("with pg_trgm: skipped, the extension is not installed here")
+            return
+        search_index._trigram = True
+        assert conn.execute(text("SELECT to_regclass('refined.medical_data_trgm_idx')")).scalar(), \
+            "trigram index missing"
+        assert not search_index.search_messages(conn, 'hospitl'), "misspelling matched without fuzzy"
+        hits = search_index.search_messages(conn, 'hospitl', fuzzy=True)
+        assert hits and all('hospital' in hit['cleaned_content'].lower() for hit in hits), "fuzzy missed hospital"
+        print(f"with pg_trgm: trigram index built, fuzzy 'hospitl' finds {len(hits)} 'hospital' rows")
+    finally:
+        search_index._trigram = None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search benchmark. Replaces refined.medical_data: point it at a scratch database.")
+    parser.add_argument('--database', default='medical_warehouse_bench')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--no-seed', action='store_true')
+    args = parser.parse_args()
+
+    os.environ['DB_NAME'] = args.database
+    from sqlalchemy import text
+    from benchmarks.load_api import sync_engine
+    from src.search_index import ensure_search_index, search_messages
+
+    engine = sync_engine()
+    if not args.no_seed:
+        print(f"--- Seeding {args.rows} messages ---")
+        seed(engine, args.rows)
+
+    with engine.connect() as conn:
+        print("--- Before: ILIKE full scan (all matching rows, as the old endpoint) ---")
+        for keyword in KEYWORDS:
+            p50, p99, hits = timed_runs(lambda: len(conn.execute(
+                text("SELECT * FROM refined.medical_data WHERE cleaned_content ILIKE :key"),
+                {"key": f"%{keyword}%"}).fetchall()), args.repeats)
+            print(f"{keyword:<18} p50 {p50:9.1f} ms  p99 {p99:9.1f} ms  {hits:>8} rows")
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        ensure_search_index(conn)
+        conn.execute(text("ANALYZE refined.medical_data"))
+    print(f"--- Index build: {time.perf_counter() - started:.1f}s ---")
+
+    with engine.connect() as conn:
+        print("--- After: ranked search, first page of 20 with snippets ---")
+        for keyword in KEYWORDS:
+            p50, p99, hits = timed_runs(lambda: len(search_messages(conn, keyword)), args.repeats)
+            print(f"{keyword:<18} p50 {p50:9.1f} ms  p99 {p99:9.1f} ms  {hits:>8} rows")
+        p50, p99, hits = timed_runs(lambda: len(search_messages(conn, 'patient', offset=200)), args.repeats)
+        print(f"{'patient offset=200':<18} p50 {p50:9.1f} ms  p99 {p99:9.1f} ms  {hits:>8} rows")
+        for keyword in FUZZY_KEYWORDS:
+            p50, p99, hits = timed_runs(lambda: len(search_messages(conn, keyword, fuzzy=True)), args.repeats)
+            print(f"{keyword + ' (fuzzy)':<18} p50 {p50:9.1f} ms  p99 {p99:9.1f} ms  {hits:>8} rows")
+
+        print("--- pg_trgm branches ---")
+        check_trigram_branches(conn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Filename: bench_text_classifier.py
+# Author: MAYSHLAMY
+# Problem: Rows/sec of the per-row .apply cleaner vs the batch classifier, with output parity checks
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import multilingual_text
+from src.text_classifier import MedicalTextClassifier, load_lexicon
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden', 'clean_text.json')
+
+
+def legacy_clean_text(text):
+    """Verbatim copy of MedicalDataCleaner.clean_text before the batch classifier."""
+    if not text:
+        return ""
+    if re.search(r'[Ѐ-ӿ]', text):
+        return "FILTERED_NOISE"
+    noise_patterns = [
+        'منتخبنا', 'فوزه', 'كأس العالم', 'አዲስ ዓመት', 'እንኳን አደረሳችሁ',
+        'መልካም በዓል', 'мексика', 'сомбреро', 'travel', 'vlog', 't.me'
+    ]
+    if any(pattern in text for pattern in noise_patterns):
+        return "FILTERED_NOISE"
+    medical_keywords = [
+        'anemia', 'sarcoidosis', 'mri', 'pediatrics', 'urology', 'pharmacology',
+        'syndrome', 'patient', 'guidelines', 'hospital', 'medication', 'dose',
+        'መድሃኒት', 'ጤና', 'ሐኪም', 'ቫይረስ', 'ምርመራ', 'ህክምና', 'ኢንሱሊን', 'ቆሽት',
+        'صيدلة', 'طبية', 'علاج', 'أدوية', 'كيس', 'تشخيص', 'فحص'
+    ]
+    text_lower = text.lower()
+    has_medical_term = any(med in text_lower for med in medical_keywords)
+    if not has_medical_term and len(text.split()) < 15:
+        return "FILTERED_NOISE"
+    text = re.sub(r'http\S+|www\S+|https\S+|@\w+', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def sample_messages(n, seed=7):
+    """Realistic channel posts plus the golden inputs, so every rule gets exercised."""
+    with open(GOLDEN_PATH, 'r', encoding='utf-8') as f:
+        golden = [case['content'] for case in json.load(f)]
+    lexicon = load_lexicon()
+    rng = random.Random(seed)
+    return [rng.choice(golden) if rng.random() < 0.05 else multilingual_text(rng, lexicon) for _ in range(n)]
+
+
+def check_golden(classifier):
+    with open(GOLDEN_PATH, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    got = classifier.classify(pd.Series([c['content'] for c in cases]))['cleaned_content'].tolist()
+    mismatches = [(c['content'], c['cleaned_content'], g) for c, g in zip(cases, got) if c['cleaned_content'] != g]
+    for content, expected, actual in mismatches:
+        print(f"❌ {content!r}: expected {expected!r}, got {actual!r}")
+    print(f"golden set: {len(cases) - len(mismatches)}/{len(cases)} identical")
+    return not mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text cleaner benchmark")
+    parser.add_argument('--rows', type=int, default=500_000)
+    args = parser.parse_args()
+
+    classifier = MedicalTextClassifier()
+    ok = check_golden(classifier)
+
+    series = pd.Series(sample_messages(args.rows))
+
+    started = time.perf_counter()
+    legacy = series.apply(legacy_clean_text)
+    legacy_secs = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = classifier.classify(series)
+    batch_secs = time.perf_counter() - started
+
+    started = time.perf_counter()
+    classifier.classify(series, with_terms=False)
+    labels_secs = time.perf_counter() - started
+
+    identical = legacy.equals(batch['cleaned_content'].astype(legacy.dtype))
+    ok = ok and identical
+    print(f".apply(clean_text)   {args.rows / legacy_secs:12.0f} rows/s ({legacy_secs:.2f}s)")
+    print(f"classify(series)     {args.rows / batch_secs:12.0f} rows/s ({batch_secs:.2f}s)")
+    print(f"  without terms      {args.rows / labels_secs:12.0f} rows/s ({labels_secs:.2f}s)")
+    print(f"speedup {legacy_secs / batch_secs:.1f}x, outputs identical on sample: {identical}")
+    print(batch['label'].value_counts().to_string())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# Filename: corpus.py
+# Author: MAYSHLAMY
+# Problem: Synthetic Telegram messages for offline benchmarks
+
+import os
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+SAMPLE_TEXTS = [
+    "Paracetamol 500mg available now, call for delivery",
+    "ጤና ሚኒስቴር አዲስ የክትባት መመሪያ አውጥቷል",
+    "علاج جديد متوفر في صيدلية المدينة",
+    "Insulin pens back in stock at our Bole branch",
+    "Amoxicillin syrup for pediatrics, limited quantity",
+    "",
+]
+
+
+# Filler vocabulary for realistic message bodies; lexicon terms are sprinkled in
+FILLER_WORDS = {
+    "en": ("the price of new stock today call our shop open from morning to evening delivery "
+           "available across addis ababa contact us for more information quality products best "
+           "offer limited time only").split(),
+    "am": "ዋጋ አዲስ ምርት ዛሬ ይደውሉ ሱቃችን ክፍት ነው በሁሉም ቦታ እናደርሳለን".split(),
+    "ar": "السعر منتج جديد اليوم اتصل بنا متوفر التوصيل".split(),
+}
+
+
+def multilingual_text(rng, lexicon, medical_rate=0.3, noise_rate=0.05, cyrillic_rate=0.05):
+    """
+    A 3-80 word English/Amharic/Arabic message. `lexicon` is load_lexicon()'s dict;
+    a share of messages gets a medical term, a noise term or Cyrillic text, and
+    some carry links, @mentions and messy whitespace like real channel posts.
+    """
+    words = [rng.choice(FILLER_WORDS[rng.choice(("en", "am", "ar"))]) for _ in range(rng.randint(3, 80))]
+    roll = rng.random()
+    if roll < medical_rate:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(lexicon['medical']))
+    elif roll < medical_rate + noise_rate:
+        words.append(rng.choice(lexicon['noise']))
+    elif roll < medical_rate + noise_rate + cyrillic_rate:
+        words.append("Доставка")
+    if rng.random() < 0.2:
+        words.append(f"https://t.co/{rng.randint(1, 10**6)}")
+    if rng.random() < 0.1:
+        words.append(f"@shop_{rng.randint(1, 100)}")
+    if rng.random() < 0.1:
+        words.append("\n\n  ")
+    return ' '.join(words)
+
+
+def synthetic_image(seed, size=(720, 960), quality=85):
+    """
+    JPEG bytes shaped like a channel photo: a smooth background with a few boxes,
+    discs and a caption, so decoders and detectors see structure rather than noise.
+    The same seed always gives the same bytes, like a reposted photo.
+    """
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    height, width = size
+    image = rng.integers(0, 256, size=(height // 32, width // 32, 3), dtype=np.uint8)
+    image = cv2.resize(image, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(rng.integers(1, 6)):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        x, y = int(rng.integers(0, width * 3 // 4)), int(rng.integers(0, height * 3 // 4))
+        w, h = int(rng.integers(width // 10, width // 3)), int(rng.integers(height // 10, height // 3))
+        if rng.random() < 0.5:
+            cv2.rectangle(image, (x, y), (x + w, y + h), color, -1)
+        else:
+            cv2.circle(image, (x + w // 2, y + h // 2), min(w, h) // 2, color, -1)
+    cv2.putText(image, f"SALE {int(rng.integers(10, 90))}%", (width // 20, height - height // 20),
+                cv2.FONT_HERSHEY_SIMPLEX, width / 640, (255, 255, 255), 2)
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def synthetic_message(channel, message_id, rng, day=datetime(2026, 2, 17, tzinfo=timezone.utc)):
+    """One record in the scraper's JSON layout."""
+    has_media = rng.random() < 0.5
+    return {
+        "message_id": message_id,
+        "channel_name": channel,
+        "message_date": str(day - timedelta(minutes=message_id % 1440)),
+        "message_text": rng.choice(SAMPLE_TEXTS),
+        "has_media": has_media,
+        "views": rng.randint(0, 5000),
+        "forwards": rng.randint(0, 200),
+        "image_path": f"data/raw/media/objects/{message_id % 256:02x}/{message_id:064x}.jpg" if has_media else None,
+    }
+
+
+def write_json_corpus(base_path, total_messages, channels=50, days=10, seed=42):
+    """
+    Writes `total_messages` records as data/raw/telegram_messages/<date>/<channel>.json
+    files, spread evenly over `days` date folders and `channels` channels.
+    Returns the list of files written.
+    """
+    rng = random.Random(seed)
+    per_file = max(1, total_messages // (channels * days))
+    files = []
+    message_id = 0
+    for d in range(days):
+        day = datetime(2026, 2, 17, tzinfo=timezone.utc) - timedelta(days=d)
+        date_dir = os.path.join(base_path, day.strftime("%Y-%m-%d"))
+        os.makedirs(date_dir, exist_ok=True)
+        for c in range(channels):
+            records = []
+            for _ in range(per_file):
+                message_id += 1
+                records.append(synthetic_message(f"channel_{c}", message_id, rng, day))
+            path = os.path.join(date_dir, f"channel_{c}.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False)
+            files.append(path)
+    return files
@@ -0,0 +1,134 @@
+# Filename: fake_telegram.py
+# Author: MAYSHLAMY
+# Problem: Offline stand-in for telethon.TelegramClient so the scraper can be benchmarked
+
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from telethon.errors import FloodWaitError
+from benchmarks.corpus import SAMPLE_TEXTS
+
+
+class FakeTelegramClient:
+    """
+    Mimics the slice of the TelegramClient API used by src/scraper.py.
+
+    Every channel holds `messages_per_channel` synthetic messages. Network cost is
+    simulated with `latency` seconds per message page and per photo download, and
+    `flood_wait_rate` makes a fraction of calls raise FloodWaitError(`flood_wait_seconds`).
+    `text_factory(rng)` and `photo_factory(photo_id)` replace the canned texts and the
+    random photo bytes, e.g. with corpus.multilingual_text and corpus.synthetic_image.
+    With `discoverable_channels` > 0, keyword searches return a deterministic sample of
+    that many broadcast channels (found_channel_<n>), which can then be scraped too.
+    """
+
+    def __init__(self, messages_per_channel=100, photo_ratio=0.5, photo_pool=1000,
+                 photo_bytes=64 * 1024, latency=0.02, page_size=100, flood_wait_rate=0.0,
+                 flood_wait_seconds=1, seed=42, text_factory=None, photo_factory=None,
+                 discoverable_channels=0):
+        self.messages_per_channel = messages_per_channel
+        self.photo_ratio = photo_ratio
+        # Photos are drawn from a shared pool, so the same picture gets reposted
+        self.photo_pool = photo_pool
+        self.photo_bytes = photo_bytes
+        self.latency = latency
+        self.page_size = page_size
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.random = random.Random(seed)
+        self.text_factory = text_factory
+        self.photo_factory = photo_factory
+        self.discoverable_channels = discoverable_channels
+        self.calls = {"pages": 0, "downloads": 0, "flood_waits": 0, "requests": 0}
+
+    # --- Session lifecycle -------------------------------------------------
+    async def start(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def loop(self):
+        return asyncio.get_event_loop()
+
+    async def __call__(self, request):
+        self.calls["requests"] += 1
+        self._maybe_flood()
+        await asyncio.sleep(self.latency)
+        if hasattr(request, 'q'):
+            # contacts.SearchRequest: the same keyword always finds the same channels
+            hits = random.Random(request.q).sample(range(self.discoverable_channels),
+                                                   min(request.limit, self.discoverable_channels))
+            return SimpleNamespace(users=[], chats=[
+                SimpleNamespace(username=f"found_channel_{n}", broadcast=True,
+                                participants_count=random.Random(n).randint(100, 100_000))
+                for n in hits])
+        # channels.GetFullChannelRequest
+        n = int(request.channel.rsplit('_', 1)[-1]) if request.channel.startswith('found_channel_') else 0
+        return SimpleNamespace(full_chat=SimpleNamespace(participants_count=random.Random(n).randint(100, 100_000)))
+
+    # --- Data access --------------------------------------------------------
+    def _maybe_flood(self):
+        if self.flood_wait_rate and self.random.random() < self.flood_wait_rate:
+            self.calls["flood_waits"] += 1
+            raise FloodWaitError(request=None, capture=self.flood_wait_seconds)
+
+    def _message(self, channel, message_id):
+        rng = random.Random(f"{channel}:{message_id}")
+        has_photo = rng.random() < self.photo_ratio
+        photo = SimpleNamespace(id=rng.randint(1, self.photo_pool)) if has_photo else None
+        return SimpleNamespace(
+            id=message_id,
+            date=datetime(2026, 2, 17, tzinfo=timezone.utc) - timedelta(minutes=message_id),
+            text=self.text_factory(rng) if self.text_factory else rng.choice(SAMPLE_TEXTS),
+            media=photo,
+            photo=photo,
+            views=rng.randint(0, 5000),
+            forwards=rng.randint(0, 200),
+        )
+
+    async def get_messages(self, entity, ids):
+        """Messages by id, None for ids the channel does not have."""
+        self.calls["pages"] += 1
+        self._maybe_flood()
+        await asyncio.sleep(self.latency)
+        return [self._message(entity, i) if 0 < i <= self.messages_per_channel else None for i in ids]
+
+    async def iter_messages(self, entity, limit=None, offset_id=0, min_id=0, max_id=0, reverse=False):
+        newest = self.messages_per_channel
+        if reverse:
+            ids = range(max(min_id, offset_id) + 1, newest + 1)
+        else:
+            top = min(newest, offset_id - 1) if offset_id else newest
+            ids = range(top, min_id, -1)
+        if max_id:
+            ids = [i for i in ids if i < max_id]
+        ids = list(ids)[:limit] if limit is not None else list(ids)
+
+        for start in range(0, len(ids), self.page_size):
+            # Telethon fetches one page per request; that is where waits happen
+            self.calls["pages"] += 1
+            self._maybe_flood()
+            await asyncio.sleep(self.latency)
+            for message_id in ids[start:start + self.page_size]:
+                yield self._message(entity, message_id)
+
+    async def download_media(self, media, file=None):
+        self.calls["downloads"] += 1
+        self._maybe_flood()
+        await asyncio.sleep(self.latency)
+        # Same photo id -> same bytes, like a real repost
+        if self.photo_factory:
+            payload = self.photo_factory(media.id)
+        else:
+            payload = random.Random(media.id).randbytes(self.photo_bytes)
+        if file is bytes:
+            return payload
+        with open(file, 'wb') as f:
+            f.write(payload)
+        return file
@@ -0,0 +1,135 @@
+# Filename: load_api.py
+# Author: MAYSHLAMY
+# Problem: Latency and peak memory per request of the old full-table /detections vs keyset pages
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def sync_engine():
+    """Plain psycopg2 engine for seeding and for the legacy pandas handler."""
+    from sqlalchemy import create_engine
+    return create_engine(f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:"
+                         f"{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}")
+
+
+def seed(engine, rows):
+    """Writes `rows` synthetic refined.medical_data rows, 1 in 10 with a detection."""
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE SCHEMA IF NOT EXISTS refined;
+            DROP TABLE IF EXISTS refined.medical_data;
+            CREATE TABLE refined.medical_data AS
+            SELECT g AS msg_key,
+                   'bench_channel_' || (g % 50) AS channel_name,
+                   repeat('Patient dose guidelines for urology and pharmacology. ', 4) || g AS content,
+                   TIMESTAMP '2026-01-01' + (g % 60) * INTERVAL '1 day' AS message_timestamp,
+                   g % 1000 AS view_count,
+                   g % 10 AS forward_count,
+                   CASE WHEN g % 2 = 0 THEN 'data/raw/media/objects/ab/' || md5(g::text) || '.jpg' END AS image_path,
+                   repeat('Patient dose guidelines for urology and pharmacology. ', 4) || g AS cleaned_content,
+                   g % 10 = 0 AS has_detection,
+                   CASE WHEN g % 10 = 0 THEN 1 ELSE 0 END AS detection_count
+            FROM generate_series(1, :rows) g;
+            CREATE UNIQUE INDEX medical_data_msg_key_idx ON refined.medical_data (msg_key);
+            ANALYZE refined.medical_data;
+        """), {"rows": rows})
+
+
+def legacy_detections(engine):
+    """The previous /detections handler body: whole table through pandas."""
+    import pandas as pd
+    df = pd.read_sql("SELECT * FROM refined.medical_data", engine)
+    df['image_path'] = df['image_path'].replace({0: "None", "0": "None"})
+    df = df.fillna(0)
+    return df.to_dict(orient="records")
+
+
+async def measure(client, label, urls, with_memory):
+    latencies, peaks, sizes = [], [], []
+    for url in urls:
+        if with_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        response = await client.get(url)
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+        sizes.append(len(response.content))
+        if with_memory:
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        del response
+    line = (f"{label:<34} n={len(urls):<4} p50 {np.percentile(latencies, 50) * 1000:8.1f} ms "
+            f"p99 {np.percentile(latencies, 99) * 1000:8.1f} ms  {np.mean(sizes) / 1024:9.1f} KiB/resp")
+    if with_memory:
+        line += f"  peak {max(peaks) / 2**20:7.1f} MiB/req"
+    print(line)
+
+
+async def run(args):
+    import httpx
+    from api.main import app
+
+    engine = sync_engine()
+    app.get("/legacy/detections")(lambda: legacy_detections(engine))
+    transport = httpx.ASGITransport(app=app)
+
+    # Walk the first pages through the cursor, as a client would
+    page_urls, after = [], 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for _ in range(args.requests):
+            response = await client.get(f"/detections?after={after}&limit={args.page_size}")
+            page_urls.append(f"/detections?after={after}&limit={args.page_size}")
+            after = response.headers.get("X-Next-After")
+            if after is None:
+                break
+
+        scenarios = [
+            ("GET /detections (legacy, full table)", ["/legacy/detections"] * args.legacy_requests),
+            (f"GET /detections limit={args.page_size}", page_urls),
+            ("  fields=msg_key,cleaned_content", [f"{u}&fields=msg_key,cleaned_content" for u in page_urls]),
+            ("  format=ndjson limit=10000", [f"/detections?limit=10000&format=ndjson"] * args.requests),
+            ("  channel + date range", [f"{u}&channel=bench_channel_7&date_from=2026-01-10&date_to=2026-01-20"
+                                        for u in page_urls]),
+            ("GET /detections/confirmed", [u.replace("/detections", "/detections/confirmed") for u in page_urls]),
+        ]
+        print("--- Latency ---")
+        for label, urls in scenarios:
+            await measure(client, label, urls, with_memory=False)
+        print("--- Peak Python memory per request (tracemalloc, slower) ---")
+        tracemalloc.start()
+        for label, urls in scenarios:
+            await measure(client, label, urls[:args.memory_requests], with_memory=True)
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="API load test. Replaces refined.medical_data: point DB_NAME at a scratch database.")
+    parser.add_argument('--database', default='medical_warehouse_bench')
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--legacy-requests', type=int, default=5)
+    parser.add_argument('--memory-requests', type=int, default=3)
+    parser.add_argument('--no-seed', action='store_true')
+    args = parser.parse_args()
+
+    # api.database builds its engine from the environment at import time
+    os.environ['DB_NAME'] = args.database
+    if not args.no_seed:
+        print(f"--- Seeding {args.rows} rows into refined.medical_data ---")
+        seed(sync_engine(), args.rows)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# Filename: run_pipeline_bench.py
+# Author: MAYSHLAMY
+# Problem: Offline end-to-end benchmark: scrape -> load -> dbt -> clean -> detect -> link -> API, as JSON
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(REPO_ROOT)
+
+DBT_PROJECT = os.path.join(REPO_ROOT, 'medical_warehouse')
+STAGES = ['scrape', 'load', 'dbt', 'clean', 'detect', 'link', 'api']
+
+
+# --- Stages: each runs in a fresh process inside the work dir and returns rows processed ---
+
+def stage_scrape(opts):
+    from benchmarks.fake_telegram import FakeTelegramClient
+    from benchmarks.corpus import multilingual_text, synthetic_image
+    from src.text_classifier import load_lexicon
+    from src.scraper import Solution
+
+    lexicon = load_lexicon()
+    client = FakeTelegramClient(
+        messages_per_channel=opts['messages_per_channel'], photo_ratio=opts['photo_ratio'],
+        photo_pool=opts['photo_pool'], latency=0,
+        text_factory=lambda rng: multilingual_text(rng, lexicon),
+        photo_factory=lambda photo_id: synthetic_image(photo_id, size=tuple(opts['image_size'])))
+    sol = Solution(client=client)
+    sol.target_channels = [f"bench_channel_{i}" for i in range(opts['channels'])]
+    sol.limit = opts['messages_per_channel']
+    asyncio.run(sol.run())
+    return sum(s['messages'] for s in sol.stats.values())
+
+
+def stage_load(opts):
+    from src.database_loader import load_json_to_postgres
+    return load_json_to_postgres()["rows"]
+
+
+def stage_dbt(opts):
+    command = [opts['dbt'], 'build', '--exclude', 'agg_message_detections+', 'agg_term_frequency']
+    if opts['profiles_dir']:
+        command += ['--profiles-dir', opts['profiles_dir']]
+    subprocess.run(command, cwd=DBT_PROJECT, check=True, stdout=subprocess.DEVNULL)
+    return _count("SELECT COUNT(*) FROM staging.fact_medical_messages")
+
+
+def stage_clean(opts):
+    from src.data_cleaner import MedicalDataCleaner
+    read = MedicalDataCleaner().run_incremental(workers=opts['clean_workers'])["read"]
+    # The term mart counts the refined rows, so it is built after the cleaner, as in orchestrator.py
+    command = [opts['dbt'], 'build', '--select', 'agg_term_frequency']
+    if opts['profiles_dir']:
+        command += ['--profiles-dir', opts['profiles_dir']]
+    subprocess.run(command, cwd=DBT_PROJECT, check=True, stdout=subprocess.DEVNULL)
+    return read
+
+
+def stage_detect(opts):
+    from src.object_detector import MedicalObjectDetector, iter_images
+    from src.detection_sink import write_detections
+
+    factory = None
+    if opts['model'] == 'stub':
+        from benchmarks.stub_yolo import StubYOLO
+        factory = StubYOLO
+    detector = MedicalObjectDetector(opts['model'], model_factory=factory)
+    records = detector.detect_batched(iter_images('data/raw/media/objects'))
+    write_detections(records, detector.model_name, detector.model_version)
+    return len(records)
+
+
+def stage_link(opts):
+    from src.link_detections import link_results
+    link_results(source='table')
+    return _count("SELECT COUNT(*) FROM refined.medical_data")
+
+
+def stage_api(opts):
+    import httpx
+    from api.main import app
+
+    urls = [
+        "/detections?limit=1000",
+        "/detections?limit=1000&fields=msg_key,channel_name,cleaned_content",
+        "/detections/confirmed?limit=500",
+        "/search/patient",
+        "/search/ጤና",
+        "/reports/top-products",
+        "/channels/bench_channel_0/activity",
+    ]
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for i in range(opts['api_requests']):
+                url = urls[i % len(urls)]
+                response = await client.get(url)
+                # httpx errors do not pickle back to the parent process
+                if response.status_code != 200:
+                    raise RuntimeError(f"GET {url} -> {response.status_code}: {response.text[:200]}")
+
+    asyncio.run(run())
+    return opts['api_requests']
+
+
+def _count(query):
+    from src.database_loader import get_db_connection
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query)
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _run_stage(name, workdir, opts):
+    """Runs one stage in this (fresh) process; peak RSS covers it and anything it spawned."""
+    os.chdir(workdir)
+    started = time.perf_counter()
+    rows = globals()[f"stage_{name}"](opts)
+    seconds = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {
+        "stage": name,
+        "seconds": round(seconds, 3),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "peak_rss_mib": round(peak / 1024, 1),
+    }
+
+
+def reset_database():
+    """Drops everything the pipeline builds, so every run starts from an empty warehouse."""
+    from src.database_loader import get_db_connection
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("DROP SCHEMA IF EXISTS raw, staging, refined CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    """Prints each stage's wall time next to a previous report's."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    baseline = {s["stage"]: s for s in previous["stages"]}
+    print(f"--- Compared with {baseline_path} ({previous.get('git_commit')}) ---")
+    if previous.get("config") != report["config"]:
+        print("⚠️ The baseline ran with a different configuration; timings are not comparable")
+    for stage in report["stages"]:
+        before = baseline.get(stage["stage"])
+        if not before:
+            continue
+        change = (stage["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0.0
+        flag = "  ⚠️ slower" if change > 10 else ""
+        print(f"{stage['stage']:<8} {before['seconds']:9.2f}s -> {stage['seconds']:9.2f}s  {change:+7.1f}%  "
+              f"rss {before['peak_rss_mib']:7.1f} -> {stage['peak_rss_mib']:7.1f} MiB{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end pipeline benchmark on a synthetic corpus. Drops and rebuilds the raw, "
+                    "staging and refined schemas: point DB_NAME and the dbt profile at a scratch database.")
+    parser.add_argument('--database', default='medical_warehouse_bench')
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--messages-per-channel', type=int, default=500)
+    parser.add_argument('--photo-ratio', type=float, default=0.5)
+    parser.add_argument('--photo-pool', type=int, default=500, help="distinct photos; the rest are reposts")
+    parser.add_argument('--image-size', type=int, nargs=2, default=[720, 960], metavar=('H', 'W'))
+    parser.add_argument('--model', default='stub', help="'stub' or YOLO weights such as yolov8n.pt")
+    parser.add_argument('--clean-workers', type=int, default=0)
+    parser.add_argument('--api-requests', type=int, default=200)
+    parser.add_argument('--dbt', default='dbt')
+    parser.add_argument('--profiles-dir')
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma-separated subset, in pipeline order")
+    parser.add_argument('--workdir', help="where data/ is written (default: a temp dir, removed afterwards)")
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--baseline', help="a previous JSON report to compare against")
+    args = parser.parse_args()
+
+    # Stage processes inherit the environment; the API's cache would hide query cost
+    os.environ['DB_NAME'] = args.database
+    os.environ['API_CACHE_ENABLED'] = '0'
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pipeline_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    opts = {k: v for k, v in vars(args).items() if k not in ('stages', 'workdir', 'output', 'baseline')}
+    if args.profiles_dir:
+        opts['profiles_dir'] = os.path.abspath(args.profiles_dir)
+
+    reset_database()
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": opts,
+        "stages": [],
+    }
+    context = multiprocessing.get_context('spawn')
+    try:
+        for name in [s for s in STAGES if s in args.stages.split(',')]:
+            print(f"--- Stage: {name} ---")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(_run_stage, name, workdir, opts).result()
+            report["stages"].append(result)
+            print(f"✅ {name:<8} {result['seconds']:9.2f}s  {result['rows']:>9} rows  "
+                  f"{result['rows_per_sec'] or 0:>10.1f} rows/s  peak {result['peak_rss_mib']:7.1f} MiB")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report["total_seconds"] = round(sum(s["seconds"] for s in report["stages"]), 3)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"--- Report written to {args.output} ---")
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.baseline:
+        compare(report, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Filename: stub_yolo.py
+# Author: MAYSHLAMY
+# Problem: A tiny YOLO-compatible model so detector benchmarks run without weights or torch
+
+import time
+import cv2
+import numpy as np
+
+NAMES = {0: 'person', 39: 'bottle', 41: 'cup', 67: 'cell phone'}
+
+
+class StubBox:
+    def __init__(self, cls, conf, xyxy):
+        # Same indexing as ultralytics Boxes: box.cls[0], box.conf[0], box.xyxy[0]
+        self.cls = [cls]
+        self.conf = [conf]
+        self.xyxy = [xyxy]
+
+
+class StubResult:
+    def __init__(self, image, boxes):
+        self.orig_img = image
+        self.boxes = boxes
+
+    def save(self, filename):
+        annotated = self.orig_img.copy()
+        for box in self.boxes:
+            x1, y1, x2, y2 = (int(v) for v in box.xyxy[0])
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.imwrite(filename, annotated)
+
+
+class StubYOLO:
+    """
+    Mimics `YOLO(...)(source)`: accepts a path or a list of BGR arrays and
+    returns one result per image. Every call pays a fixed overhead (what a real
+    model spends on setup and dispatch), every image a 640x640 letterbox resize
+    and a reduction, so batching and sharding behave roughly like the real thing.
+    """
+
+    names = NAMES
+
+    def __init__(self, model_name='stub', call_overhead=0.01):
+        self.model_name = model_name
+        self.call_overhead = call_overhead
+
+    def __call__(self, source, verbose=True):
+        images = [cv2.imread(source)] if isinstance(source, str) else list(source)
+        time.sleep(self.call_overhead)
+        return [self._predict(image) for image in images]
+
+    def _predict(self, image):
+        h, w = image.shape[:2]
+        resized = cv2.resize(image, (640, 640)).astype(np.float32) / 255.0
+        score = float(resized.mean())
+        boxes = []
+        # Deterministic "detections" derived from the pixels
+        if score > 0.4:
+            cls = sorted(NAMES)[int(score * 100) % len(NAMES)]
+            boxes.append(StubBox(cls, min(score + 0.3, 0.99), [w * 0.1, h * 0.1, w * 0.6, h * 0.7]))
+        return StubResult(image, boxes)
@@ -0,0 +1,18 @@
+{% macro ensure_index(columns, unique=false) %}
+{#-
+    Post-hook: indexes {{ this }} on `columns` unless it already has an index with
+    exactly those columns. Postgres picks a free name, so a full refresh never
+    collides with the indexes of the table it replaces.
+-#}
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE schemaname = '{{ this.schema }}'
+          AND tablename = '{{ this.identifier }}'
+          AND indexdef LIKE '%({{ columns | join(", ") }})'
+    ) THEN
+        CREATE {% if unique %}UNIQUE {% endif %}INDEX ON {{ this }} ({{ columns | join(", ") }});
+    END IF;
+END $$
+{% endmacro %}
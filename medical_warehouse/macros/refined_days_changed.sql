@@ -0,0 +1,15 @@
+{% macro refined_days_changed(date_column) %}
+{#-
+    (day, channel_name) pairs whose refined messages the cleaner wrote or deleted
+    since {{ this }} was last built, by the refine_id it stamps on both.
+-#}
+SELECT CAST(message_timestamp AS DATE) AS {{ date_column }}, channel_name
+FROM {{ source('refined_data', 'medical_data') }}
+WHERE message_timestamp IS NOT NULL
+  AND refine_id > (SELECT COALESCE(MAX(refine_id), 0) FROM {{ this }})
+UNION
+SELECT CAST(message_timestamp AS DATE), channel_name
+FROM {{ source('refined_data', 'medical_data_deletions') }}
+WHERE message_timestamp IS NOT NULL
+  AND refine_id > (SELECT COALESCE(MAX(refine_id), 0) FROM {{ this }})
+{% endmacro %}
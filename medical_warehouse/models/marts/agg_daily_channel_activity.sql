@@ -0,0 +1,40 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['activity_date', 'channel_name'],
+    incremental_strategy='delete+insert'
+) }}
+
+-- Posts, views and images per channel per day. Incremental runs rebuild only the
+-- days that got load batches since the last run, however old: backfills,
+-- late and edited messages land in past days.
+WITH messages AS (
+    SELECT s.*
+    FROM {{ ref('stg_telegram_messages') }} s
+    {% if is_incremental() %}
+    JOIN (
+        SELECT DISTINCT CAST(message_timestamp AS DATE) AS activity_date, channel_name
+        FROM {{ ref('stg_telegram_messages') }}
+        WHERE message_timestamp IS NOT NULL
+          AND batch_id > (SELECT COALESCE(MAX(batch_id), 0) FROM {{ this }})
+    ) affected
+      ON s.channel_name = affected.channel_name
+     AND s.message_timestamp >= affected.activity_date
+     AND s.message_timestamp < affected.activity_date + 1
+    {% endif %}
+    WHERE s.message_timestamp IS NOT NULL
+)
+
+SELECT
+    CAST(message_timestamp AS DATE) AS activity_date,
+    TO_CHAR(message_timestamp, 'YYYYMMDD')::INTEGER AS date_key,
+    channel_name,
+    COUNT(*) AS message_count,
+    COUNT(*) FILTER (WHERE content IS NOT NULL AND content != '') AS text_count,
+    COUNT(*) FILTER (WHERE image_path IS NOT NULL) AS image_count,
+    SUM(view_count) AS total_views,
+    ROUND(AVG(view_count), 2) AS avg_views,
+    SUM(forward_count) AS total_forwards,
+    -- Last load batch read (every stg row with a timestamp lands in a day): the next run's watermark
+    MAX(batch_id) AS batch_id
+FROM messages
+GROUP BY 1, 2, 3
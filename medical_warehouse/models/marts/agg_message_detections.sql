@@ -0,0 +1,33 @@
+{{ config(materialized='table') }}
+
+-- Per-message detection summary built from refined.image_detections
+WITH per_class AS (
+    SELECT
+        channel_name,
+        message_id,
+        class_name,
+        COUNT(*) AS boxes,
+        MAX(confidence) AS max_confidence,
+        MAX(COALESCE(b.batch_id, 0)) AS batch_id
+    FROM {{ source('refined_data', 'image_detections') }} d
+    LEFT JOIN {{ source('raw_data', 'load_batches') }} b ON b.load_id = d.load_id
+    WHERE message_id IS NOT NULL
+    GROUP BY channel_name, message_id, class_name
+)
+
+SELECT
+    m.msg_key,
+    p.channel_name,
+    p.message_id,
+    SUM(p.boxes) AS detection_count,
+    COUNT(*) AS distinct_classes,
+    -- Most frequent class first; ties go to the more confident one
+    (ARRAY_AGG(p.class_name ORDER BY p.boxes DESC, p.max_confidence DESC))[1] AS top_class,
+    ARRAY_TO_STRING((ARRAY_AGG(p.class_name ORDER BY p.boxes DESC, p.max_confidence DESC))[1:3], ', ') AS top_classes,
+    MAX(p.max_confidence) AS max_confidence,
+    -- Batch that last wrote the message's boxes (agg_visual_content's watermark)
+    MAX(p.batch_id) AS batch_id
+FROM per_class p
+LEFT JOIN {{ ref('stg_telegram_messages') }} m
+    ON m.channel_name = p.channel_name AND m.message_id = p.message_id
+GROUP BY m.msg_key, p.channel_name, p.message_id
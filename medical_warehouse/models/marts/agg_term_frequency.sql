@@ -0,0 +1,56 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['mention_date', 'channel_name'],
+    incremental_strategy='delete+insert',
+    pre_hook=[
+        "{% if is_incremental() %}
+        DELETE FROM {{ this }} t
+        USING ({{ refined_days_changed('mention_date') }}) affected
+        WHERE t.mention_date = affected.mention_date AND t.channel_name = affected.channel_name
+        {% endif %}"
+    ]
+) }}
+
+-- Daily mentions of the cleaner's medical lexicon terms per channel, counted over
+-- refined.medical_data, so the noise and Cyrillic rows the cleaner drops are left out.
+-- Matching is case-insensitive substring, as in src/text_classifier.py. Incremental
+-- runs rebuild every term of the days the cleaner wrote or deleted rows in since the
+-- last run. The pre-hook clears those days first: delete+insert alone would keep the
+-- old rows of a day that no longer mentions any term.
+WITH messages AS (
+    SELECT
+        CAST(r.message_timestamp AS DATE) AS mention_date,
+        r.channel_name,
+        LOWER(r.content) AS content,
+        r.view_count
+    FROM {{ source('refined_data', 'medical_data') }} r
+    {% if is_incremental() %}
+    JOIN ({{ refined_days_changed('mention_date') }}) affected
+      ON r.channel_name = affected.channel_name
+     AND r.message_timestamp >= affected.mention_date
+     AND r.message_timestamp < affected.mention_date + 1
+    {% endif %}
+    WHERE r.message_timestamp IS NOT NULL
+),
+
+terms AS (
+    SELECT term, language
+    FROM {{ ref('medical_lexicon') }}
+    WHERE category = 'medical'
+)
+
+SELECT
+    m.mention_date,
+    m.channel_name,
+    t.term,
+    t.language,
+    COUNT(*) AS mention_count,
+    SUM(m.view_count) AS total_views,
+    -- Last refinement read, on every row written: the next run's watermark
+    GREATEST(
+        (SELECT MAX(refine_id) FROM {{ source('refined_data', 'medical_data') }}),
+        (SELECT MAX(refine_id) FROM {{ source('refined_data', 'medical_data_deletions') }})
+    ) AS refine_id
+FROM messages m
+JOIN terms t ON POSITION(LOWER(t.term) IN m.content) > 0
+GROUP BY 1, 2, 3, 4
@@ -0,0 +1,62 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['activity_date', 'channel_name'],
+    incremental_strategy='delete+insert'
+) }}
+
+-- Share of each channel's image posts per day in which YOLO found something.
+-- Incremental runs rebuild the days that got image posts in a load batch, or
+-- detections written, since the last run.
+WITH detections AS (
+    SELECT msg_key, detection_count, top_class, batch_id
+    FROM {{ ref('agg_message_detections') }}
+),
+
+{% if is_incremental() %}
+affected AS (
+    SELECT CAST(message_timestamp AS DATE) AS activity_date, channel_name
+    FROM {{ ref('stg_telegram_messages') }}
+    WHERE image_path IS NOT NULL
+      AND message_timestamp IS NOT NULL
+      AND batch_id > (SELECT COALESCE(MAX(batch_id), 0) FROM {{ this }})
+    UNION
+    SELECT CAST(s.message_timestamp AS DATE), s.channel_name
+    FROM detections d
+    JOIN {{ ref('stg_telegram_messages') }} s ON s.msg_key = d.msg_key
+    WHERE s.message_timestamp IS NOT NULL
+      AND d.batch_id > (SELECT COALESCE(MAX(detection_batch_id), 0) FROM {{ this }})
+),
+{% endif %}
+
+images AS (
+    SELECT
+        CAST(s.message_timestamp AS DATE) AS activity_date,
+        s.channel_name,
+        d.detection_count,
+        d.top_class
+    FROM {{ ref('stg_telegram_messages') }} s
+    {% if is_incremental() %}
+    JOIN affected a
+      ON s.channel_name = a.channel_name
+     AND s.message_timestamp >= a.activity_date
+     AND s.message_timestamp < a.activity_date + 1
+    {% endif %}
+    LEFT JOIN detections d ON d.msg_key = s.msg_key
+    WHERE s.image_path IS NOT NULL
+      AND s.message_timestamp IS NOT NULL
+)
+
+SELECT
+    activity_date,
+    channel_name,
+    COUNT(*) AS image_posts,
+    COUNT(detection_count) AS detected_posts,
+    ROUND(COUNT(detection_count)::NUMERIC / COUNT(*), 4) AS detection_share,
+    COALESCE(SUM(detection_count), 0) AS total_detections,
+    MODE() WITHIN GROUP (ORDER BY top_class) AS top_class,
+    -- Watermarks of the next run: the last load and detection batches read. Days without
+    -- image posts write nothing, so they are stamped on every row rather than per day.
+    (SELECT MAX(batch_id) FROM {{ ref('stg_telegram_messages') }}) AS batch_id,
+    (SELECT MAX(batch_id) FROM detections) AS detection_batch_id
+FROM images
+GROUP BY activity_date, channel_name
@@ -0,0 +1,15 @@
+{{ config(materialized='table') }}
+
+-- Built from the daily mart rather than the messages, so it stays cheap as volume grows
+SELECT
+    MD5(channel_name) AS channel_key,
+    channel_name,
+    MIN(activity_date) AS first_post_date,
+    MAX(activity_date) AS last_post_date,
+    COUNT(*) AS active_days,
+    SUM(message_count)::BIGINT AS total_posts,
+    SUM(total_views)::BIGINT AS total_views,
+    ROUND(SUM(total_views)::NUMERIC / NULLIF(SUM(message_count), 0), 2) AS avg_views,
+    SUM(image_count)::BIGINT AS image_posts
+FROM {{ ref('agg_daily_channel_activity') }}
+GROUP BY channel_name
@@ -0,0 +1,22 @@
+{{ config(materialized='table') }}
+
+-- One row per calendar day the channels cover, so reports can show days without posts
+WITH bounds AS (
+    SELECT
+        MIN(activity_date) AS first_day,
+        MAX(activity_date) AS last_day
+    FROM {{ ref('agg_daily_channel_activity') }}
+)
+
+SELECT
+    TO_CHAR(d, 'YYYYMMDD')::INTEGER AS date_key,
+    d::DATE AS full_date,
+    EXTRACT(YEAR FROM d)::INTEGER AS year,
+    EXTRACT(QUARTER FROM d)::INTEGER AS quarter,
+    EXTRACT(MONTH FROM d)::INTEGER AS month,
+    TRIM(TO_CHAR(d, 'Month')) AS month_name,
+    EXTRACT(WEEK FROM d)::INTEGER AS iso_week,
+    EXTRACT(ISODOW FROM d)::INTEGER AS day_of_week,
+    TRIM(TO_CHAR(d, 'Day')) AS day_name,
+    EXTRACT(ISODOW FROM d) IN (6, 7) AS is_weekend
+FROM bounds, GENERATE_SERIES(bounds.first_day, bounds.last_day, INTERVAL '1 day') AS d
@@ -1,12 +1,30 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_name', 'message_id'],
+    incremental_strategy='delete+insert',
+    post_hook=[
+        "{{ ensure_index(['channel_name', 'message_id'], unique=true) }}",
+        "{{ ensure_index(['msg_key'], unique=true) }}",
+        "{{ ensure_index(['message_timestamp']) }}",
+        "{{ ensure_index(['channel_name', 'message_timestamp']) }}",
+        "{{ ensure_index(['image_path']) }}",
+        "{{ ensure_index(['batch_id']) }}"
+    ]
+) }}
 
 SELECT
     msg_key,
     channel_name,
+    message_id,
     content,
     message_timestamp,
     view_count,
     forward_count,
-    image_path
+    image_path,
+    loaded_at,
+    batch_id
 FROM {{ ref('stg_telegram_messages') }}
-WHERE content IS NOT NULL AND content != ''
\ No newline at end of file
+WHERE content IS NOT NULL AND content != ''
+{% if is_incremental() %}
+  AND batch_id > (SELECT COALESCE(MAX(batch_id), 0) FROM {{ this }})
+{% endif %}
@@ -1,7 +1,25 @@
-{{ config(materialized='view') }}
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_name', 'message_id'],
+    incremental_strategy='delete+insert',
+    post_hook=[
+        "{{ ensure_index(['channel_name', 'message_id'], unique=true) }}",
+        "{{ ensure_index(['msg_key']) }}",
+        "{{ ensure_index(['message_timestamp']) }}",
+        "{{ ensure_index(['batch_id']) }}"
+    ]
+) }}
 
 WITH raw_data AS (
-    SELECT * FROM {{ source('raw_data', 'telegram_messages') }}
+    SELECT t.*, COALESCE(b.batch_id, 0) AS batch_id
+    FROM {{ source('raw_data', 'telegram_messages') }} t
+    LEFT JOIN {{ source('raw_data', 'load_batches') }} b ON b.load_id = t.load_id
+    {% if is_incremental() %}
+    -- Only loads committed since the last run. Batch ids are handed out in commit order
+    -- (record_batch in src/database_loader.py), so a load still running now gets a
+    -- higher id than anything read here and is picked up by the next run.
+    WHERE b.batch_id > (SELECT COALESCE(MAX(batch_id), 0) FROM {{ this }})
+    {% endif %}
 )
 
 SELECT
@@ -15,6 +33,8 @@ SELECT
     has_media,
     COALESCE(views, 0) AS view_count,
     COALESCE(forwards, 0) AS forward_count,
-    image_path
+    image_path,
+    loaded_at,
+    batch_id
 FROM raw_data
-WHERE message_text IS NOT NULL OR has_media = True
\ No newline at end of file
+WHERE message_text IS NOT NULL OR has_media = True
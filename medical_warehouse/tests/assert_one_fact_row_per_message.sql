@@ -0,0 +1,8 @@
+-- The incremental key: a message may appear only once per channel
+SELECT
+    channel_name,
+    message_id,
+    COUNT(*) AS copies
+FROM {{ ref('fact_medical_messages') }}
+GROUP BY channel_name, message_id
+HAVING COUNT(*) > 1
@@ -1,53 +1,178 @@
-from dagster import asset, Definitions, AssetIn
-import subprocess
+from dagster import (asset, Definitions, AssetExecutionContext, AssetKey, MaterializeResult,
+                     DailyPartitionsDefinition, MultiPartitionsDefinition, MultiPartitionKey,
+                     StaticPartitionsDefinition, multiprocess_executor)
+from dagster_dbt import DbtCliResource, DbtProject, DagsterDbtTranslator, dbt_assets
 import os
 
+from src.database_loader import load_json_to_postgres, load_parquet_to_postgres, iter_json_files
+# Each step's counters, histogram counts and duration become its materialization metadata
+from src.instrumentation import collect
+
+# Daily partitions follow the scraper's data/raw/telegram_messages/<YYYY-MM-DD> folders
+RAW_JSON_DIR = 'data/raw/telegram_messages'
+PARTITION_START_DATE = os.getenv('PIPELINE_START_DATE', '2026-01-01')
+# Optional second dimension, e.g. PIPELINE_CHANNELS=CheMed123,tikvahpharma,lobelia4cosmetics
+PARTITION_CHANNELS = [c for c in os.getenv('PIPELINE_CHANNELS', '').split(',') if c]
+# Steps of one run executing at once; backfill runs in parallel are capped in dagster.yaml
+MAX_CONCURRENT_STEPS = int(os.getenv('PIPELINE_MAX_CONCURRENT_STEPS', os.cpu_count() or 4))
+CLEAN_WORKERS = int(os.getenv('PIPELINE_CLEAN_WORKERS', 0))
+# 'lake' loads Postgres from the Parquet lake, 'json' straight from the scraped files
+LOAD_SOURCE = os.getenv('PIPELINE_LOAD_SOURCE', 'lake')
+
+daily_partitions = DailyPartitionsDefinition(start_date=PARTITION_START_DATE)
+if PARTITION_CHANNELS:
+    message_partitions = MultiPartitionsDefinition({
+        "date": daily_partitions,
+        "channel": StaticPartitionsDefinition(PARTITION_CHANNELS),
+    })
+else:
+    message_partitions = daily_partitions
+
+def partition_slice(context):
+    """The (dates, channels) a partitioned run covers; channels is None without a channel dimension."""
+    key = context.partition_key
+    if isinstance(key, MultiPartitionKey):
+        return [key.keys_by_dimension["date"]], [key.keys_by_dimension["channel"]]
+    return [key], None
+
+# --- dbt project: an explicit project dir, so no os.chdir between steps ---
+dbt_project = DbtProject(
+    project_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'medical_warehouse'),
+    profiles_dir=os.getenv('DBT_PROFILES_DIR'),
+)
+# Parses the project into target/manifest.json under `dagster dev`
+dbt_project.prepare_if_dev()
+
+class WarehouseDbtTranslator(DagsterDbtTranslator):
+    """Maps the dbt sources onto the Python assets that fill them, so the graph is one lineage."""
+    SOURCE_ASSETS = {
+        ('raw_data', 'telegram_messages'): AssetKey('raw_postgres_table'),
+        ('refined_data', 'image_detections'): AssetKey('yolo_detections'),
+        ('refined_data', 'medical_data'): AssetKey('refined_messages'),
+    }
+
+    def get_asset_key(self, dbt_resource_props):
+        if dbt_resource_props["resource_type"] == "source":
+            key = (dbt_resource_props["source_name"], dbt_resource_props["name"])
+            if key in self.SOURCE_ASSETS:
+                return self.SOURCE_ASSETS[key]
+        return super().get_asset_key(dbt_resource_props)
+
+    def get_group_name(self, dbt_resource_props):
+        return "transformation"
+
 # --- 1. Extraction Asset ---
 @asset(group_name="ingestion")
-def telegram_raw_data():
-    """Runs the Telethon scraper to fetch JSON and Images."""
-    # We call your existing script
-    subprocess.run(["python", "src/scraper.py"], check=True)
-    return "Data Scraped Successfully"
+def telegram_raw_data(context: AssetExecutionContext):
+    """Runs the Telethon scraper to fetch JSON and Images (incremental per channel, not partitioned)."""
+    from src.scraper import Solution
+    sol = Solution()
+    with collect("scrape") as stage_metrics, sol.client:
+        sol.client.loop.run_until_complete(sol.run())
+    return MaterializeResult(metadata={"channels": len(sol.stats), **stage_metrics})
+
+# --- 1b. Parquet Lake Asset ---
+@asset(deps=[telegram_raw_data], group_name="ingestion", partitions_def=message_partitions)
+def telegram_lake(context: AssetExecutionContext):
+    """Compacts one partition's JSON files into date/channel-partitioned Parquet (src/lake.py)."""
+    from src.lake import compact_json
+    dates, channels = partition_slice(context)
+    with collect("compact") as stage_metrics:
+        totals = compact_json(RAW_JSON_DIR, dates=dates, channels=channels)
+    return MaterializeResult(metadata={**totals, **stage_metrics})
 
 # --- 2. Load Asset ---
-@asset(deps=[telegram_raw_data], group_name="ingestion")
-def raw_postgres_table():
-    """Loads raw JSON data into the PostgreSQL raw schema."""
-    subprocess.run(["python", "src/database_loader.py"], check=True)
-    return "Database Loaded"
-
-# --- 3. Transformation Asset (dbt) ---
-@asset(deps=[raw_postgres_table], group_name="transformation")
-def dbt_medical_marts():
-    """Triggers dbt run to build staging and fact tables."""
-    # Change directory to your dbt project and run
-    os.chdir("medical_warehouse")
-    subprocess.run(["dbt", "run"], check=True)
-    os.chdir("..")
-    return "dbt Models Built"
+@asset(deps=[telegram_lake], group_name="ingestion", partitions_def=message_partitions)
+def raw_postgres_table(context: AssetExecutionContext):
+    """Loads one day's (and optionally one channel's) messages into the PostgreSQL raw schema."""
+    dates, channels = partition_slice(context)
+    with collect("load") as stage_metrics:
+        if LOAD_SOURCE == 'lake':
+            totals = load_parquet_to_postgres(dates=dates, channels=channels)
+        else:
+            totals = load_json_to_postgres(RAW_JSON_DIR, dates=dates, channels=channels)
+    return MaterializeResult(metadata={**totals, **stage_metrics})
+
+# --- 3. Transformation Assets (dbt) ---
+# Not partitioned: the staging and fact models are incremental on the loader's commit-ordered
+# batch ids (raw.load_batches), so one dbt run after any number of loaded partitions picks
+# up exactly the batches committed since the last one, even while backfills keep loading.
+# The "dbt" pool keeps overlapping runs from merging into the same tables at once.
+DBT_BUILD = ["build"]
+
+@dbt_assets(manifest=dbt_project.manifest_path, exclude="agg_message_detections+ agg_term_frequency",
+            dagster_dbt_translator=WarehouseDbtTranslator(), name="dbt_medical_marts", pool="dbt")
+def dbt_medical_marts(context: AssetExecutionContext, dbt: DbtCliResource):
+    """Seeds the lexicon, then builds and tests staging, fact and the analytical marts."""
+    yield from dbt.cli(DBT_BUILD, context=context).stream()
 
 # --- 4. AI Enrichment Asset ---
-@asset(deps=[dbt_medical_marts], group_name="enrichment")
-def yolo_detections():
-    """Runs YOLOv8 object detection on scraped images."""
-    subprocess.run(["python", "src/object_detector.py"], check=True)
-    return "Objects Detected"
-
-# --- 5. Final Linking Asset ---
-@asset(deps=[yolo_detections], group_name="enrichment")
-def refined_warehouse():
+@asset(deps=[telegram_raw_data], group_name="enrichment", partitions_def=message_partitions)
+def yolo_detections(context: AssetExecutionContext):
+    """Runs YOLOv8 on the images of one partition's messages and stores every box in refined.image_detections."""
+    # Imported here so only the steps that need the model pay for loading it
+    from src.object_detector import MedicalObjectDetector, iter_message_images
+    from src.detection_sink import write_detections
+
+    dates, channels = partition_slice(context)
+    with collect("detect") as stage_metrics:
+        detector = MedicalObjectDetector()
+        records = detector.detect_batched(iter_message_images(iter_json_files(RAW_JSON_DIR, dates, channels)))
+        write_detections(records, detector.model_name, detector.model_version)
+    return MaterializeResult(metadata={
+        "images": len(records),
+        "images_with_objects": sum(1 for r in records if r["detections"]),
+        **stage_metrics,
+    })
+
+@dbt_assets(manifest=dbt_project.manifest_path, select="agg_message_detections+",
+            dagster_dbt_translator=WarehouseDbtTranslator(), name="detection_marts", pool="dbt")
+def detection_marts(context: AssetExecutionContext, dbt: DbtCliResource):
+    """Aggregates the stored boxes into per-message counts, top classes and the visual content share."""
+    yield from dbt.cli(DBT_BUILD, context=context).stream()
+
+# --- 5. Refinement and Linking Assets ---
+@asset(deps=[AssetKey("fact_medical_messages")], group_name="enrichment", pool="refined")
+def refined_messages(context: AssetExecutionContext):
+    """Cleans fact rows above the last watermark into refined.medical_data."""
+    from src.data_cleaner import MedicalDataCleaner
+    with collect("clean") as stage_metrics:
+        totals = MedicalDataCleaner().run_incremental(workers=CLEAN_WORKERS)
+    return MaterializeResult(metadata={**totals, **stage_metrics})
+
+@asset(deps=[refined_messages, yolo_detections], group_name="enrichment", pool="refined")
+def refined_warehouse(context: AssetExecutionContext):
     """Links detection results back to the refined database layer."""
-    subprocess.run(["python", "src/link_detections.py"], check=True)
-    return "Warehouse Refined"
+    from src.link_detections import link_results
+    from src.data_version import bump_data_version
+    with collect("link") as stage_metrics:
+        linked = link_results(source='table')
+    # New data version: API responses cached from the previous run stop matching
+    version = bump_data_version()
+    return MaterializeResult(metadata={"linked_messages": linked, "data_version": version, **stage_metrics})
+
+# Counted over the cleaner's output. In the "refined" pool, so the cleaner never commits
+# between the model's pre-hook clearing the changed days and the model rebuilding them.
+@dbt_assets(manifest=dbt_project.manifest_path, select="agg_term_frequency",
+            dagster_dbt_translator=WarehouseDbtTranslator(), name="term_marts", pool="refined")
+def term_marts(context: AssetExecutionContext, dbt: DbtCliResource):
+    """Counts the medical lexicon terms of the refined messages per channel per day."""
+    yield from dbt.cli(DBT_BUILD, context=context).stream()
 
 # --- Dagster Definitions ---
 defs = Definitions(
     assets=[
-        telegram_raw_data, 
-        raw_postgres_table, 
-        dbt_medical_marts, 
-        yolo_detections, 
+        telegram_raw_data,
+        telegram_lake,
+        raw_postgres_table,
+        dbt_medical_marts,
+        yolo_detections,
+        detection_marts,
+        refined_messages,
+        term_marts,
         refined_warehouse
-    ]
-)
\ No newline at end of file
+    ],
+    resources={"dbt": DbtCliResource(project_dir=dbt_project)},
+    # Independent steps (e.g. loading and YOLO of the same day) run in separate processes
+    executor=multiprocess_executor.configured({"max_concurrent": MAX_CONCURRENT_STEPS}),
+)
@@ -1,23 +1,27 @@
 import os
-from telethon import TelegramClient, functions, types
+import sys
+from telethon import TelegramClient
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.channel_discovery import ChannelDiscovery
+
 load_dotenv()
 API_ID = os.getenv('TG_API_ID')
 API_HASH = os.getenv('TG_API_HASH')
 
-async def get_discovered_channels(client):
+async def get_discovered_channels(client, exclude=()):
     """
     Pass the existing client to this function to find channels.
+    Returns usernames ranked by relevance, capped at DISCOVERY_MAX_CHANNELS;
+    searches and samples are cached (see src/channel_discovery.py).
     """
-    keywords = ['medicine', 'pharmacy', 'health', 'ethiopia medical']
-    found_channels = set()
+    ranked = await ChannelDiscovery(client).discover(exclude=set(exclude))
+    return [channel["username"] for channel in ranked]
 
-    for query in keywords:
-        result = await client(functions.contacts.SearchRequest(q=query, limit=20))
-        for chat in result.chats:
-            if hasattr(chat, 'username') and chat.username:
-                if isinstance(chat, types.Channel) and chat.broadcast:
-                    found_channels.add(chat.username)
-    
-    return list(found_channels)
\ No newline at end of file
+if __name__ == '__main__':
+    # Prints the current ranking without scraping anything
+    client = TelegramClient('scraping_session', API_ID, API_HASH)
+    with client:
+        client.loop.run_until_complete(get_discovered_channels(client))
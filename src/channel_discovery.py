@@ -0,0 +1,203 @@
+# Filename: channel_discovery.py
+# Author: MAYSHLAMY
+# Problem: Concurrent, cached and relevance-ranked discovery of new Telegram channels
+
+import os
+import sys
+import json
+import time
+import math
+import asyncio
+from datetime import datetime, timezone
+from telethon import functions
+from telethon.errors import FloodWaitError
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.text_classifier import MedicalTextClassifier, MEDICAL
+from src.instrumentation import metrics, span
+
+load_dotenv()
+
+DEFAULT_KEYWORDS = [
+    'medicine', 'pharmacy', 'health', 'ethiopia medical', 'pharmaceutical', 'drug store',
+    'medical supplies', 'clinic', 'hospital', 'cosmetics', 'ፋርማሲ', 'መድሃኒት', 'ጤና', 'صيدلية',
+]
+# Comma-separated, e.g. DISCOVERY_KEYWORDS="pharmacy,ፋርማሲ,medical equipment"
+KEYWORDS = [k.strip() for k in os.getenv('DISCOVERY_KEYWORDS', ','.join(DEFAULT_KEYWORDS)).split(',') if k.strip()]
+# Searches / channel samples in flight at once
+DISCOVERY_CONCURRENCY = int(os.getenv('DISCOVERY_CONCURRENCY', 4))
+SEARCH_LIMIT = int(os.getenv('DISCOVERY_SEARCH_LIMIT', 20))
+# Search results and channel profiles are reused for this long
+CACHE_TTL_HOURS = float(os.getenv('DISCOVERY_CACHE_TTL_HOURS', 24))
+# Recent posts read per candidate to measure its post rate and medical share
+SAMPLE_POSTS = int(os.getenv('DISCOVERY_SAMPLE_POSTS', 50))
+# Candidates below this share of medical posts are never scraped
+MIN_MEDICAL_RATE = float(os.getenv('DISCOVERY_MIN_MEDICAL_RATE', 0.2))
+MAX_CHANNELS = int(os.getenv('DISCOVERY_MAX_CHANNELS', 10))
+
+class DiscoveryCache:
+    """
+    JSON-backed TTL store for keyword search results ("searches") and channel
+    profiles ("profiles"). Saved with an atomic rename like ScrapeState, so a
+    crashed run never leaves a half-written cache.
+    """
+
+    def __init__(self, path='data/state/discovery_cache.json', ttl_hours=CACHE_TTL_HOURS, clock=time.time):
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.clock = clock
+        self.entries = {"searches": {}, "profiles": {}}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                self.entries.update({section: loaded[section] for section in self.entries
+                                     if isinstance(loaded.get(section), dict)})
+            except (OSError, ValueError, AttributeError) as e:
+                # Only a cache: a damaged file costs one run of fresh requests
+                print(f"⚠️ Ignoring unreadable discovery cache {path}: {e}")
+
+    def get(self, section, key):
+        """The cached value, or None when missing or older than the TTL."""
+        entry = self.entries[section].get(key)
+        if entry is None or self.clock() - entry["fetched_at"] > self.ttl:
+            return None
+        return entry["value"]
+
+    def put(self, section, key, value):
+        self.entries[section][key] = {"fetched_at": self.clock(), "value": value}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+def score_channels(profiles):
+    """
+    Adds a score to each profile and returns them best first:
+        medical_rate * (0.5 + 0.3 * reach + 0.2 * activity)
+    reach and activity are log-scaled subscribers and posts per day relative
+    to the best candidate, so relevance dominates and size only breaks ties.
+    """
+    top_subscribers = max((p["subscribers"] for p in profiles), default=0)
+    top_rate = max((p["posts_per_day"] for p in profiles), default=0.0)
+    for p in profiles:
+        reach = math.log1p(p["subscribers"]) / math.log1p(top_subscribers) if top_subscribers else 0.0
+        activity = math.log1p(p["posts_per_day"]) / math.log1p(top_rate) if top_rate else 0.0
+        p["score"] = round(p["medical_rate"] * (0.5 + 0.3 * reach + 0.2 * activity), 4)
+    return sorted(profiles, key=lambda p: (-p["score"], p["username"]))
+
+class ChannelDiscovery:
+    """
+    Finds broadcast channels by keyword search and ranks them for the scraper.
+    Searches and per-channel samples run concurrently (bounded by a semaphore)
+    and are cached with a TTL, so a run within the TTL makes no requests at all.
+    """
+
+    def __init__(self, client, keywords=None, cache=None, concurrency=DISCOVERY_CONCURRENCY,
+                 max_channels=MAX_CHANNELS, min_medical_rate=MIN_MEDICAL_RATE, classifier=None):
+        self.client = client
+        self.keywords = keywords or KEYWORDS
+        self.cache = cache or DiscoveryCache()
+        self.slots = asyncio.Semaphore(max(1, concurrency))
+        self.max_channels = max_channels
+        self.min_medical_rate = min_medical_rate
+        self.classifier = classifier or MedicalTextClassifier()
+
+    async def search(self, keyword):
+        """Broadcast channels (username, subscribers) matching one keyword."""
+        cached = self.cache.get("searches", keyword)
+        if cached is not None:
+            metrics.inc("discovery_requests_total", kind="search", source="cache")
+            return cached
+        async with self.slots:
+            try:
+                result = await self.client(functions.contacts.SearchRequest(q=keyword, limit=SEARCH_LIMIT))
+            except FloodWaitError as e:
+                # Discovery is optional; the required channels are scraped regardless
+                print(f"⏳ FloodWait on search '{keyword}' ({e.seconds}s); skipping it this run")
+                metrics.inc("discovery_requests_total", kind="search", source="flood_wait")
+                return []
+            except Exception as e:
+                # One failed keyword must not abort the gather over all of them
+                print(f"⚠️ Search '{keyword}' failed: {e}")
+                metrics.inc("discovery_requests_total", kind="search", source="error")
+                return []
+        metrics.inc("discovery_requests_total", kind="search", source="telegram")
+        channels = [{"username": chat.username, "subscribers": getattr(chat, 'participants_count', None)}
+                    for chat in result.chats
+                    # Broadcast channels only; groups and megagroups are not scraped
+                    if getattr(chat, 'username', None) and getattr(chat, 'broadcast', False)]
+        self.cache.put("searches", keyword, channels)
+        return channels
+
+    async def profile(self, candidate):
+        """Subscribers, posts per day and medical share of a candidate's recent posts."""
+        username = candidate["username"]
+        cached = self.cache.get("profiles", username)
+        if cached is not None:
+            metrics.inc("discovery_requests_total", kind="profile", source="cache")
+            return cached
+        async with self.slots:
+            try:
+                subscribers = candidate["subscribers"]
+                if subscribers is None:
+                    full = await self.client(functions.channels.GetFullChannelRequest(channel=username))
+                    subscribers = full.full_chat.participants_count
+                posts = [m async for m in self.client.iter_messages(username, limit=SAMPLE_POSTS)]
+            except FloodWaitError as e:
+                print(f"⏳ FloodWait sampling {username} ({e.seconds}s); skipping it this run")
+                metrics.inc("discovery_requests_total", kind="profile", source="flood_wait")
+                return None
+            except Exception as e:
+                print(f"⚠️ Could not sample {username}: {e}")
+                metrics.inc("discovery_requests_total", kind="profile", source="error")
+                return None
+        metrics.inc("discovery_requests_total", kind="profile", source="telegram")
+
+        texts = [m.text for m in posts if m.text]
+        medical = int((self.classifier.classify(texts, with_terms=False)['label'] == MEDICAL).sum()) if texts else 0
+        if posts:
+            # Over the window from the oldest sampled post until now, so dormant channels rate low
+            days = (datetime.now(timezone.utc) - min(m.date for m in posts)).total_seconds() / 86400
+            posts_per_day = len(posts) / max(days, 1.0)
+        else:
+            posts_per_day = 0.0
+        profile = {
+            "username": username,
+            "subscribers": subscribers or 0,
+            "posts_per_day": round(posts_per_day, 3),
+            "medical_rate": round(medical / len(texts), 3) if texts else 0.0,
+            "sampled_posts": len(posts),
+        }
+        self.cache.put("profiles", username, profile)
+        return profile
+
+    async def discover(self, exclude=()):
+        """
+        Runs every keyword search, samples each new candidate once, drops those
+        below min_medical_rate and returns up to max_channels profiles, best first.
+        """
+        with span("discover", keywords=len(self.keywords)) as info:
+            results = await asyncio.gather(*(self.search(k) for k in self.keywords))
+            candidates = {}
+            for channels in results:
+                for channel in channels:
+                    if channel["username"] not in exclude:
+                        candidates.setdefault(channel["username"], channel)
+            profiles = await asyncio.gather(*(self.profile(c) for c in candidates.values()))
+            self.cache.save()
+
+            relevant = [p for p in profiles if p and p["medical_rate"] >= self.min_medical_rate]
+            ranked = score_channels(relevant)[:self.max_channels]
+            info.update(candidates=len(candidates), relevant=len(relevant), selected=len(ranked))
+        print(f"--- Discovery: {len(candidates)} candidates, {len(relevant)} relevant, "
+              f"{len(ranked)} selected ---")
+        for p in ranked:
+            print(f"🔎 {p['username']:<30} score {p['score']:.3f}  medical {p['medical_rate']:.0%}  "
+                  f"{p['subscribers']:>8} subs  {p['posts_per_day']:.1f} posts/day")
+        return ranked
@@ -3,91 +3,429 @@
 # Problem: Task 3 - Final Medical Refinement for Multi-language Data
 
 import pandas as pd
-import re
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from psycopg2.extras import execute_values
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 from dotenv import load_dotenv
+import argparse
 import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.text_classifier import MedicalTextClassifier, FILTERED_NOISE
+from src.search_index import ensure_search_index
+from src.near_duplicates import NearDuplicateIndex
+from src.data_version import bump_data_version
+from src.instrumentation import metrics, span
 
 load_dotenv()
 
+# Columns of the stable refined table; detection columns are owned by link_detections.py
+FACT_COLUMNS = ['msg_key', 'channel_name', 'content', 'message_timestamp',
+                'view_count', 'forward_count', 'image_path']
+REFINED_COLUMNS = FACT_COLUMNS + ['cleaned_content', 'dup_cluster_id', 'is_canonical']
+CHUNK_SIZE = int(os.getenv('REFINE_CHUNK_SIZE', 50000))
+
+# Per-process classifier for pool workers, built on first use
+_worker_classifier = None
+
+def _refine_chunk(df, classifier=None):
+    """
+    Cleans one chunk and drops its noise rows; runs in the parent (with its
+    classifier) or a pool worker. Also returns the msg_keys of the noise rows,
+    so an edit that turned a message into noise removes it, the chunk's last
+    (batch_id, msg_key) and how many rows each rule filtered.
+    """
+    global _worker_classifier
+    if classifier is None:
+        if _worker_classifier is None:
+            _worker_classifier = MedicalTextClassifier()
+        classifier = _worker_classifier
+    labels = classifier.classify(df['content'], with_terms=False)
+    df = df.assign(cleaned_content=labels['cleaned_content'])
+    noise = df['cleaned_content'] == FILTERED_NOISE
+    reasons = labels['label'][noise.to_numpy()].value_counts().to_dict()
+    last = (df['batch_id'].iloc[-1], df['msg_key'].iloc[-1])
+    return df[~noise], df.loc[noise, 'msg_key'].tolist(), len(df), last, reasons
+
 class MedicalDataCleaner:
     def __init__(self):
         # Using SQLAlchemy for database connection
         self.db_url = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
         self.engine = create_engine(self.db_url)
-
-    def load_data(self):
-        query = "SELECT * FROM staging.fact_medical_messages"
-        return pd.read_sql(query, self.engine)
+        # Noise/medical lexicon compiled once for every batch
+        self.classifier = MedicalTextClassifier()
+        # Near-duplicate index, opened on first use
+        self.dedup = None
 
     def clean_text(self, text):
-        if not text:
-            return ""
-        
-        # 1. Block Russian/Cyrillic entirely
-        if re.search(r'[\u0400-\u04FF]', text):
-            return "FILTERED_NOISE"
-
-        # 2. Kill Football, Holiday, and Travel Noise
-        # Patterns found in your specific data sample
-        noise_patterns = [
-            'منتخبنا', 'فوزه', 'كأس العالم', 'አዲስ ዓመት', 'እንኳን አደረሳችሁ', 
-            'መልካም በዓል', 'мексика', 'сомбреро', 'travel', 'vlog', 't.me'
-        ]
-        if any(pattern in text for pattern in noise_patterns):
-            return "FILTERED_NOISE"
-
-        # 3. Medical Relevance Check (English, Amharic, Arabic)
-        medical_keywords = [
-        # English
-        'anemia', 'sarcoidosis', 'mri', 'pediatrics', 'urology', 'pharmacology', 
-        'syndrome', 'patient', 'guidelines', 'hospital', 'medication', 'dose',
-        # Amharic (Medical & Health)
-        'መድሃኒት', 'ጤና', 'ሐኪም', 'ቫይረስ', 'ምርመራ', 'ህክምና', 'ኢንሱሊን', 'ቆሽት',
-        # Arabic (Medical)
-        'صيدلة', 'طبية', 'علاج', 'أدوية', 'كيس', 'تشخيص', 'فحص'
-        ]
-        
-        text_lower = text.lower()
-        has_medical_term = any(med in text_lower for med in medical_keywords)
-        
-        # If no medical keywords are found and the message is short, it's junk
-        if not has_medical_term and len(text.split()) < 15:
-            return "FILTERED_NOISE"
-
-        # 4. Standard Cleaning (URLs and Whitespace)
-        text = re.sub(r'http\S+|www\S+|https\S+|@\w+', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        return text
-
-    def save_data(self, df):
-        print("--- Saving cleaned data to refined.medical_data ---")
-        # Overwrite with the professional, noise-free version
-        df.to_sql('medical_data', self.engine, schema='refined', if_exists='replace', index=False)
-        print("✅ Data successfully saved to refined.medical_data!")
-
-    def run_pipeline(self):
-        print("--- Loading data from Warehouse ---")
-        df = self.load_data()
-        
-        print("--- Cleaning text and applying Medical Filters ---")
-        df['cleaned_content'] = df['content'].apply(self.clean_text)
-        
-        # REMOVE the noise rows so they don't appear in our final table
-        initial_count = len(df)
-        df = df[df['cleaned_content'] != "FILTERED_NOISE"]
-        final_count = len(df)
-        
-        print(f"--- Filtered out {initial_count - final_count} noise/ad messages ---")
-        print(f"--- Final medical record count: {final_count} ---")
-        
-        print("\nSample of Cleaned Data:")
-        print(df[['content', 'cleaned_content']].head())
-        
-        self.save_data(df)
-        return df
+        """
+        Removes Cyrillic, holiday/football/travel noise and short non-medical
+        messages, then strips URLs, @mentions and extra whitespace.
+        Rules and terms live in MedicalTextClassifier / the lexicon file.
+        """
+        return self.classifier.clean_one(text)
+
+    def mark_duplicates(self, df):
+        """
+        Adds dup_cluster_id (msg_key of the cluster's first post) and is_canonical
+        from the near-duplicate index, so reposted ads can be counted once
+        (see src/near_duplicates.py). Runs after clean_text, on cleaned_content.
+        """
+        if self.dedup is None:
+            self.dedup = NearDuplicateIndex()
+        clusters, canonical = self.dedup.assign(df['msg_key'].to_numpy(), df['cleaned_content'].tolist())
+        return df.assign(dup_cluster_id=clusters, is_canonical=canonical)
+
+    def seed_duplicates(self, chunksize=CHUNK_SIZE):
+        """
+        Fills an empty near-duplicate index (first incremental run, or the SQLite
+        file was lost) from the rows already in refined.medical_data, in msg_key
+        order, and writes their cluster ids back. Otherwise every earlier post is
+        forgotten and the next repost of an old ad is marked canonical.
+        The index is committed once at the end, so an interrupted seed starts over.
+        """
+        if self.dedup is None:
+            self.dedup = NearDuplicateIndex()
+        if self.dedup.canonical_count():
+            return 0
+        query = text("SELECT msg_key, cleaned_content FROM refined.medical_data ORDER BY msg_key")
+        seeded = 0
+        with self.engine.connect().execution_options(stream_results=True) as conn:
+            for chunk in pd.read_sql(query, conn, chunksize=chunksize):
+                if not len(chunk):
+                    continue
+                chunk = self.mark_duplicates(chunk)
+                raw_conn = self.engine.raw_connection()
+                try:
+                    cur = raw_conn.cursor()
+                    execute_values(cur, """
+                        UPDATE refined.medical_data r
+                        SET dup_cluster_id = v.dup_cluster_id, is_canonical = v.is_canonical
+                        FROM (VALUES %s) v (msg_key, dup_cluster_id, is_canonical)
+                        WHERE r.msg_key = v.msg_key
+                          AND (r.dup_cluster_id, r.is_canonical) IS DISTINCT FROM (v.dup_cluster_id, v.is_canonical)
+                    """, [(int(k), int(c), bool(f)) for k, c, f in
+                          zip(chunk['msg_key'], chunk['dup_cluster_id'], chunk['is_canonical'])], page_size=1000)
+                    raw_conn.commit()
+                finally:
+                    raw_conn.close()
+                seeded += len(chunk)
+        self.dedup.commit()
+        if seeded:
+            print(f"--- Seeded the near-duplicate index with {seeded} refined messages "
+                  f"({self.dedup.canonical_count()} clusters) ---")
+        return seeded
+
+    def run_pipeline(self, chunksize=CHUNK_SIZE, workers=0):
+        """
+        Rebuilds refined.medical_data from the whole fact table: forgets the
+        watermark and the near-duplicate history, then refines every row the way
+        run_incremental does, so the key, indexes and detection flags stay.
+        Refined rows whose fact row is gone are removed.
+        """
+        with span("clean") as info:
+            totals = self._refine_new_rows(chunksize, workers, rebuild=True)
+            info.update(totals)
+        return totals
+
+    def profile_lake(self, dates=None, channels=None):
+        """
+        Labels messages straight from the Parquet lake (src/lake.py) through
+        DuckDB, with no PostgreSQL round trip, so a lexicon change can be
+        checked against the whole history in one pass. Returns message counts
+        per channel and label.
+        """
+        from src.lake import query
+        where, params = [], []
+        if dates:
+            where.append(f"CAST(date AS VARCHAR) IN ({', '.join('?' * len(dates))})")
+            params += list(dates)
+        if channels:
+            where.append(f"channel IN ({', '.join('?' * len(channels))})")
+            params += list(channels)
+        table = query(f"SELECT channel, message_text FROM messages {'WHERE ' + ' AND '.join(where) if where else ''}",
+                      params)
+        labels = self.classifier.classify(table['message_text'], with_terms=False)
+        return pd.crosstab(table['channel'].to_pandas(), labels['label'])
+
+    def ensure_refined_table(self):
+        """Creates the stable refined table, its search index and the watermark of what has been refined."""
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                CREATE SCHEMA IF NOT EXISTS refined;
+                CREATE TABLE IF NOT EXISTS refined.medical_data (
+                    msg_key BIGINT PRIMARY KEY,
+                    channel_name TEXT,
+                    content TEXT,
+                    message_timestamp TIMESTAMP,
+                    view_count INTEGER,
+                    forward_count INTEGER,
+                    image_path TEXT,
+                    cleaned_content TEXT,
+                    dup_cluster_id BIGINT,
+                    is_canonical BOOLEAN DEFAULT TRUE,
+                    has_detection BOOLEAN DEFAULT FALSE,
+                    detection_count INTEGER DEFAULT 0
+                );
+                -- Tables written by the full-replace mode have no key yet
+                CREATE UNIQUE INDEX IF NOT EXISTS medical_data_msg_key_idx ON refined.medical_data (msg_key);
+                -- Keyset pages of the API filtered by channel
+                CREATE INDEX IF NOT EXISTS medical_data_channel_idx ON refined.medical_data (channel_name, msg_key);
+                ALTER TABLE refined.medical_data
+                    ADD COLUMN IF NOT EXISTS has_detection BOOLEAN DEFAULT FALSE,
+                    ADD COLUMN IF NOT EXISTS detection_count INTEGER DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS dup_cluster_id BIGINT,
+                    ADD COLUMN IF NOT EXISTS is_canonical BOOLEAN DEFAULT TRUE;
+                -- All copies of a reposted message
+                CREATE INDEX IF NOT EXISTS medical_data_dup_cluster_idx ON refined.medical_data (dup_cluster_id);
+                -- The upsert that last changed a row, and the rows deleted as noise: dbt's
+                -- agg_term_frequency rebuilds the days touched above its last refine_id
+                CREATE SEQUENCE IF NOT EXISTS refined.refine_id_seq;
+                ALTER TABLE refined.medical_data ADD COLUMN IF NOT EXISTS refine_id BIGINT;
+                CREATE INDEX IF NOT EXISTS medical_data_refine_id_idx ON refined.medical_data (refine_id);
+                CREATE TABLE IF NOT EXISTS refined.medical_data_deletions (
+                    msg_key BIGINT NOT NULL,
+                    channel_name TEXT,
+                    message_timestamp TIMESTAMP,
+                    refine_id BIGINT NOT NULL,
+                    deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+                CREATE INDEX IF NOT EXISTS medical_data_deletions_refine_id_idx
+                    ON refined.medical_data_deletions (refine_id);
+                CREATE TABLE IF NOT EXISTS refined.refinement_state (
+                    pipeline TEXT PRIMARY KEY,
+                    last_msg_key BIGINT NOT NULL,
+                    last_batch_id BIGINT,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+                -- States written before the load batch watermark have none; the next run re-reads everything
+                ALTER TABLE refined.refinement_state ADD COLUMN IF NOT EXISTS last_batch_id BIGINT;
+            """))
+            ensure_search_index(conn)
+
+    def get_watermark(self):
+        """(batch_id, msg_key) of the last fact row refined, or None when no load batch was recorded yet."""
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT last_batch_id, last_msg_key FROM refined.refinement_state "
+                "WHERE pipeline = 'medical_data' AND last_batch_id IS NOT NULL"
+            )).first()
+        return tuple(row) if row else None
+
+    def upsert_chunk(self, df, last, dropped=()):
+        """
+        Upserts cleaned rows on msg_key (detection flags are left alone), deletes
+        re-refined messages that are now noise and moves the watermark to `last`
+        (batch_id, msg_key) in the same transaction, so a crash never skips a chunk.
+        Rows that come out the same are not rewritten; written and deleted rows
+        get the chunk's refine_id. Returns how many refined rows were written
+        and how many deleted.
+        """
+        rows = df[REFINED_COLUMNS].astype(object).where(df[REFINED_COLUMNS].notna(), None)
+        updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in REFINED_COLUMNS[1:])
+        raw_conn = self.engine.raw_connection()
+        try:
+            cur = raw_conn.cursor()
+            refine_id = self._next_refine_id(cur)
+            written = len(execute_values(cur, f"""
+                INSERT INTO refined.medical_data ({', '.join(REFINED_COLUMNS)}, refine_id) VALUES %s
+                ON CONFLICT (msg_key) DO UPDATE SET {updates}, refine_id = EXCLUDED.refine_id
+                WHERE ({', '.join(f'refined.medical_data.{c}' for c in REFINED_COLUMNS[1:])})
+                      IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in REFINED_COLUMNS[1:])})
+                RETURNING 1
+            """, list(rows.itertuples(index=False, name=None)), page_size=1000, fetch=True,
+                template=f"({', '.join(['%s'] * len(REFINED_COLUMNS))}, {int(refine_id)})"))
+            removed = self._delete_refined(cur, dropped, refine_id) if dropped else 0
+            cur.execute("""
+                INSERT INTO refined.refinement_state (pipeline, last_msg_key, last_batch_id)
+                VALUES ('medical_data', %s, %s)
+                ON CONFLICT (pipeline) DO UPDATE SET last_msg_key = EXCLUDED.last_msg_key,
+                    last_batch_id = EXCLUDED.last_batch_id, updated_at = now()
+            """, (int(last[1]), int(last[0])))
+            raw_conn.commit()
+        finally:
+            raw_conn.close()
+        return written, removed
+
+    @staticmethod
+    def _next_refine_id(cur):
+        """
+        Id of one refinement transaction. Chunks commit one after another, so ids
+        follow commit order and a reader that sees one has seen every lower one.
+        """
+        cur.execute("SELECT nextval('refined.refine_id_seq')")
+        return cur.fetchone()[0]
+
+    def _delete_refined(self, cur, msg_keys, refine_id):
+        """
+        Deletes refined rows inside the caller's transaction and logs them in
+        refined.medical_data_deletions under `refine_id`. A deleted canonical
+        hands its cluster to the earliest remaining copy, in the table and in the
+        near-duplicate index; otherwise unique=True searches would hide every copy
+        and later reposts would join a message that is gone. The index is
+        committed first, as in run_incremental, and its changes are idempotent,
+        so a failed commit is simply redone by the retried chunk.
+        Returns how many rows were deleted.
+        """
+        cur.execute("""
+            WITH gone AS (
+                DELETE FROM refined.medical_data WHERE msg_key = ANY(%s)
+                RETURNING msg_key, is_canonical, channel_name, message_timestamp
+            ), logged AS (
+                INSERT INTO refined.medical_data_deletions (msg_key, channel_name, message_timestamp, refine_id)
+                SELECT msg_key, channel_name, message_timestamp, %s FROM gone
+            )
+            SELECT msg_key, is_canonical FROM gone
+        """, ([int(k) for k in msg_keys], int(refine_id)))
+        deleted = cur.fetchall()
+        orphaned = [key for key, canonical in deleted if canonical]
+        if orphaned:
+            cur.execute("""
+                WITH heirs AS (
+                    SELECT DISTINCT ON (dup_cluster_id) dup_cluster_id AS cluster_id, msg_key, cleaned_content
+                    FROM refined.medical_data
+                    WHERE dup_cluster_id = ANY(%s)
+                    ORDER BY dup_cluster_id, msg_key
+                ), moved AS (
+                    UPDATE refined.medical_data r
+                    SET dup_cluster_id = h.msg_key, is_canonical = (r.msg_key = h.msg_key)
+                    FROM heirs h
+                    WHERE r.dup_cluster_id = h.cluster_id
+                )
+                SELECT msg_key, cleaned_content FROM heirs
+            """, (orphaned,))
+            heirs = cur.fetchall()
+            if self.dedup is None:
+                self.dedup = NearDuplicateIndex()
+            self.dedup.replace_canonicals(orphaned, [k for k, _ in heirs], [t for _, t in heirs])
+            self.dedup.commit()
+        return len(deleted)
+
+    def iter_new_chunks(self, since, chunksize=CHUNK_SIZE):
+        """
+        Streams fact rows after the watermark through a server-side cursor, in
+        (batch_id, msg_key) order. batch_id is the commit-ordered load batch
+        (raw.load_batches) that last wrote the row, so an edited message comes
+        back with a higher one and every row is read once per change.
+        """
+        query = text(f"""
+            SELECT {', '.join(FACT_COLUMNS)}, batch_id
+            FROM staging.fact_medical_messages
+            WHERE (batch_id, msg_key) > (:batch_id, :msg_key)
+            ORDER BY batch_id, msg_key
+        """)
+        batch_id, msg_key = since if since is not None else (-1, -1)
+        params = {"batch_id": int(batch_id), "msg_key": int(msg_key)}
+        with self.engine.connect().execution_options(stream_results=True) as conn:
+            for chunk in pd.read_sql(query, conn, params=params, chunksize=chunksize):
+                # Nothing new still yields one empty frame
+                if len(chunk):
+                    yield chunk
+
+    def run_incremental(self, chunksize=CHUNK_SIZE, workers=0):
+        """
+        Refines only fact rows loaded since the last run, chunk by chunk.
+        With workers > 0 chunks are cleaned in a process pool; at most 2 * workers
+        chunks are in flight, so memory stays bounded whatever the backlog.
+        """
+        with span("clean") as info:
+            totals = self._refine_new_rows(chunksize, workers)
+            info.update(totals)
+        return totals
+
+    def reset_refinement(self):
+        """Forgets the watermark and every near-duplicate cluster, so the next run re-reads everything."""
+        if self.dedup is None:
+            self.dedup = NearDuplicateIndex()
+        self.dedup.reset()
+        self.dedup.commit()
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM refined.refinement_state WHERE pipeline = 'medical_data'"))
+
+    def _refine_new_rows(self, chunksize, workers, rebuild=False):
+        self.ensure_refined_table()
+        if rebuild:
+            # Every row is clustered again, so the history starts empty
+            self.reset_refinement()
+        else:
+            self.seed_duplicates(chunksize)
+        since = self.get_watermark()
+        print(f"--- Refining messages loaded after batch {since[0] if since else 'none'} "
+              f"in chunks of {chunksize} ---")
+
+        totals = {"read": 0, "kept": 0, "duplicates": 0, "written": 0, "removed": 0}
+
+        def finish(result):
+            kept, dropped, read, last, reasons = result
+            # In the parent and in load order: each chunk is matched against every earlier one
+            kept = self.mark_duplicates(kept)
+            # Index first: a chunk whose upsert fails gets the same cluster ids when retried
+            self.dedup.commit()
+            with span("clean", batch=True, rows=read, kept=len(kept)):
+                written, removed = self.upsert_chunk(kept, last, dropped)
+            totals["read"] += read
+            totals["kept"] += len(kept)
+            totals["duplicates"] += int((~kept['is_canonical']).sum())
+            totals["written"] += written
+            totals["removed"] += removed
+            metrics.inc("rows_refined_total", len(kept))
+            for reason, count in reasons.items():
+                metrics.inc("rows_filtered_total", count, reason=reason)
+            print(f"✅ Refined {len(kept)}/{read} messages loaded up to batch {last[0]}")
+
+        if workers > 0:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                in_flight = deque()
+                for chunk in self.iter_new_chunks(since, chunksize):
+                    in_flight.append(pool.submit(_refine_chunk, chunk))
+                    if len(in_flight) >= 2 * workers:
+                        # Results are applied in load order, so the watermark never jumps a gap
+                        finish(in_flight.popleft().result())
+                while in_flight:
+                    finish(in_flight.popleft().result())
+        else:
+            for chunk in self.iter_new_chunks(since, chunksize):
+                finish(_refine_chunk(chunk, self.classifier))
+
+        if rebuild:
+            raw_conn = self.engine.raw_connection()
+            try:
+                cur = raw_conn.cursor()
+                cur.execute("""
+                    SELECT r.msg_key FROM refined.medical_data r
+                    WHERE NOT EXISTS (SELECT 1 FROM staging.fact_medical_messages f WHERE f.msg_key = r.msg_key)
+                """)
+                orphans = [row[0] for row in cur.fetchall()]
+                if orphans:
+                    totals["removed"] += self._delete_refined(cur, orphans, self._next_refine_id(cur))
+                raw_conn.commit()
+            finally:
+                raw_conn.close()
+
+        print(f"--- Filtered out {totals['read'] - totals['kept']} noise/ad messages ---")
+        print(f"--- New or changed medical records: {totals['kept']} ({totals['duplicates']} near-duplicates) ---")
+        # Re-refined rows that came out the same leave cached responses valid
+        if totals["written"] or totals["removed"]:
+            bump_data_version()
+        return totals
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean staging messages into refined.medical_data")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only refine messages loaded or changed since the last run (default: re-refine all)")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=0, help="process pool size for cleaning chunks")
+    parser.add_argument('--lake-report', action='store_true',
+                        help="only print label counts per channel, read from the Parquet lake")
+    args = parser.parse_args()
+
     cleaner = MedicalDataCleaner()
-    cleaned_df = cleaner.run_pipeline()
\ No newline at end of file
+    if args.lake_report:
+        print(cleaner.profile_lake().to_string())
+    elif args.incremental:
+        cleaner.run_incremental(chunksize=args.chunksize, workers=args.workers)
+    else:
+        cleaner.run_pipeline(chunksize=args.chunksize, workers=args.workers)
\ No newline at end of file
@@ -0,0 +1,49 @@
+# Filename: data_version.py
+# Author: MAYSHLAMY
+# Problem: A warehouse-wide version number that API caches are keyed on
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database_loader import get_db_connection
+
+def ensure_data_version_table(cur):
+    """Single-row table holding the current version of the refined layer."""
+    cur.execute("""
+        CREATE SCHEMA IF NOT EXISTS refined;
+        CREATE TABLE IF NOT EXISTS refined.data_version (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        INSERT INTO refined.data_version (version) VALUES (1) ON CONFLICT (id) DO NOTHING;
+    """)
+
+def bump_data_version(conn=None):
+    """
+    Marks the refined layer as changed; every cached API response keyed on the
+    old version becomes unreachable. Call once at the end of a pipeline run.
+    Returns the new version.
+    """
+    own_conn = conn is None
+    conn = conn or get_db_connection()
+    try:
+        cur = conn.cursor()
+        ensure_data_version_table(cur)
+        cur.execute("""
+            UPDATE refined.data_version SET version = version + 1, updated_at = now()
+            RETURNING version
+        """)
+        version = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    finally:
+        if own_conn:
+            conn.close()
+    print(f"✅ Refined data version is now {version}")
+    return version
+
+if __name__ == "__main__":
+    bump_data_version()
@@ -2,70 +2,334 @@
 # Author: MAYSHLAMY
 # Problem: Loading scraped JSON data into PostgreSQL Raw Schema
 
+import io
 import os
+import sys
 import json
 import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
-from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.instrumentation import metrics, span
 
 load_dotenv()
 
-def get_db_connection():
+COLUMNS = ['channel_name', 'message_id', 'message_date', 'message_text',
+           'has_media', 'views', 'forwards', 'image_path']
+# Rows per COPY / execute_values round trip
+BATCH_ROWS = int(os.getenv('LOAD_BATCH_ROWS', 50000))
+
+def get_db_connection(database=None):
     return psycopg2.connect(
         host=os.getenv('DB_HOST'),
-        database=os.getenv('DB_NAME'),
+        database=database or os.getenv('DB_NAME'),
         user=os.getenv('DB_USER'),
         password=os.getenv('DB_PASSWORD'),
         port=os.getenv('DB_PORT')
     )
 
-def load_json_to_postgres():
-    base_path = 'data/raw/telegram_messages'
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    print("--- Starting Data Load to PostgreSQL ---")
-    
-    # Iterate through date folders (e.g., 2026-02-17)
-    for date_folder in os.listdir(base_path):
+def ensure_schema(cur):
+    """Creates the raw table, its (channel_name, message_id) key and the load manifest."""
+    cur.execute("""
+        CREATE SCHEMA IF NOT EXISTS raw;
+        CREATE TABLE IF NOT EXISTS raw.telegram_messages (
+            id SERIAL PRIMARY KEY,
+            channel_name TEXT,
+            message_id BIGINT,
+            message_date TEXT,
+            message_text TEXT,
+            has_media BOOLEAN,
+            views INTEGER,
+            forwards INTEGER,
+            image_path TEXT
+        );
+        -- When the row last arrived or changed, and the load that wrote it (see record_batch)
+        ALTER TABLE raw.telegram_messages ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        ALTER TABLE raw.telegram_messages ADD COLUMN IF NOT EXISTS load_id BIGINT;
+        CREATE INDEX IF NOT EXISTS telegram_messages_loaded_at_idx ON raw.telegram_messages (loaded_at);
+        CREATE INDEX IF NOT EXISTS telegram_messages_load_id_idx ON raw.telegram_messages (load_id);
+        CREATE TABLE IF NOT EXISTS raw.load_manifest (
+            file_path TEXT PRIMARY KEY,
+            file_size BIGINT NOT NULL,
+            file_mtime DOUBLE PRECISION NOT NULL,
+            row_count INTEGER NOT NULL,
+            loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    ensure_batch_log(cur)
+    cur.execute("SELECT to_regclass('raw.telegram_messages_channel_message_key')")
+    if cur.fetchone()[0] is None:
+        # Earlier loads appended duplicates; keep the first copy before adding the key
+        print("--- Removing duplicate messages before adding the upsert key ---")
+        cur.execute("""
+            DELETE FROM raw.telegram_messages a
+            USING raw.telegram_messages b
+            WHERE a.channel_name = b.channel_name
+              AND a.message_id = b.message_id
+              AND a.id > b.id
+        """)
+        cur.execute("""
+            CREATE UNIQUE INDEX telegram_messages_channel_message_key
+            ON raw.telegram_messages (channel_name, message_id)
+        """)
+    # Per-transaction landing area; emptied automatically on every commit
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS telegram_messages_stage (
+            channel_name TEXT,
+            message_id BIGINT,
+            message_date TEXT,
+            message_text TEXT,
+            has_media BOOLEAN,
+            views INTEGER,
+            forwards INTEGER,
+            image_path TEXT
+        ) ON COMMIT DELETE ROWS
+    """)
+
+def ensure_batch_log(cur):
+    """
+    raw.load_batches numbers every committed load in commit order. Rows carry the
+    load_id they were written with; downstream readers keep the last batch_id they
+    processed and read only later batches, so nothing is re-read and nothing is missed.
+    """
+    cur.execute("""
+        CREATE SCHEMA IF NOT EXISTS raw;
+        CREATE SEQUENCE IF NOT EXISTS raw.load_id_seq;
+        CREATE TABLE IF NOT EXISTS raw.load_batches (
+            batch_id BIGSERIAL PRIMARY KEY,
+            load_id BIGINT NOT NULL UNIQUE,
+            source TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            committed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+def new_load_id(cur):
+    """Id to stamp a load's rows with; it is not ordered, record_batch() orders it."""
+    cur.execute("SELECT nextval('raw.load_id_seq')")
+    return cur.fetchone()[0]
+
+def record_batch(cur, load_id, source, row_count):
+    """
+    Gives the load its batch_id; call it last, right before COMMIT. The lock is
+    held until the commit, so batch ids are handed out in commit order: any
+    reader that sees batch N also sees every batch below it, and a load that
+    commits later always gets a higher number. Returns the batch_id.
+    """
+    cur.execute("LOCK TABLE raw.load_batches IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("""
+        INSERT INTO raw.load_batches (load_id, source, row_count) VALUES (%s, %s, %s)
+        RETURNING batch_id
+    """, (load_id, source, row_count))
+    return cur.fetchone()[0]
+
+def _copy_value(value):
+    """Encodes one value for COPY's text format."""
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def _message_rows(messages):
+    for msg in messages:
+        yield tuple(msg[column] for column in COLUMNS)
+
+def _batches(rows, size=BATCH_ROWS):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def stage_rows(cur, rows, method='copy'):
+    """Streams rows into the temp staging table with COPY FROM STDIN or execute_values."""
+    staged = 0
+    for batch in _batches(rows):
+        if method == 'copy':
+            buffer = io.StringIO()
+            for row in batch:
+                buffer.write('\t'.join(_copy_value(v) for v in row))
+                buffer.write('\n')
+            buffer.seek(0)
+            cur.copy_expert(f"COPY telegram_messages_stage ({', '.join(COLUMNS)}) FROM STDIN", buffer)
+        else:
+            execute_values(cur, f"INSERT INTO telegram_messages_stage ({', '.join(COLUMNS)}) VALUES %s",
+                           batch, page_size=1000)
+        staged += len(batch)
+    return staged
+
+def stage_table(cur, table):
+    """
+    Streams an Arrow table into the temp staging table as CSV COPY. Arrow
+    writes the CSV in C++ (nulls unquoted, empty strings quoted), so no
+    Python code runs per row.
+    """
+    options = pa_csv.WriteOptions(include_header=False)
+    for offset in range(0, table.num_rows, BATCH_ROWS):
+        buffer = io.BytesIO()
+        pa_csv.write_csv(table.slice(offset, BATCH_ROWS).select(COLUMNS), buffer, options)
+        buffer.seek(0)
+        cur.copy_expert(f"COPY telegram_messages_stage ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                        buffer)
+    return table.num_rows
+
+def _stage(cur, messages, method):
+    """Stages a JSON file's records or a lake file's Arrow table."""
+    if isinstance(messages, pa.Table):
+        if method == 'copy':
+            return stage_table(cur, messages)
+        messages = messages.select(COLUMNS).to_pylist()
+    return stage_rows(cur, _message_rows(messages), method)
+
+def upsert_staged(cur, load_id):
+    """
+    Moves the staged rows into raw.telegram_messages, one row per (channel_name, message_id).
+    New and changed rows are stamped with `load_id`; record_batch() before the
+    commit makes them visible to the incremental models and the cleaner.
+    """
+    columns = ', '.join(COLUMNS)
+    updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in COLUMNS[2:])
+    cur.execute(f"""
+        INSERT INTO raw.telegram_messages ({columns}, loaded_at, load_id)
+        SELECT DISTINCT ON (channel_name, message_id) {columns}, now(), %s
+        FROM telegram_messages_stage
+        ORDER BY channel_name, message_id
+        ON CONFLICT (channel_name, message_id) DO UPDATE SET {updates}, loaded_at = now(), load_id = EXCLUDED.load_id
+        WHERE ({', '.join(f'raw.telegram_messages.{c}' for c in COLUMNS[2:])})
+              IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in COLUMNS[2:])})
+    """, (load_id,))
+    return cur.rowcount
+
+def _already_loaded(cur, file_path, size, mtime):
+    cur.execute("SELECT file_size, file_mtime FROM raw.load_manifest WHERE file_path = %s", (file_path,))
+    row = cur.fetchone()
+    return row is not None and row[0] == size and row[1] == mtime
+
+def _record_loaded(cur, file_path, size, mtime, row_count):
+    cur.execute("""
+        INSERT INTO raw.load_manifest (file_path, file_size, file_mtime, row_count)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (file_path) DO UPDATE SET
+            file_size = EXCLUDED.file_size,
+            file_mtime = EXCLUDED.file_mtime,
+            row_count = EXCLUDED.row_count,
+            loaded_at = now()
+    """, (file_path, size, mtime, row_count))
+
+def iter_json_files(base_path, dates=None, channels=None):
+    # Iterate through date folders (e.g., 2026-02-17), then the JSON files in each;
+    # dates / channels restrict the walk to one partition's slice
+    for date_folder in sorted(os.listdir(base_path)):
+        if dates is not None and date_folder not in dates:
+            continue
         date_path = os.path.join(base_path, date_folder)
-        
         if os.path.isdir(date_path):
-            # Iterate through JSON files in each date folder
-            for json_file in os.listdir(date_path):
-                if json_file.endswith('.json'):
-                    file_path = os.path.join(date_path, json_file)
-                    
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        try:
-                            messages = json.load(f)
-                            for msg in messages:
-                                # Prepare the SQL Insert
-                                insert_query = """
-                                INSERT INTO raw.telegram_messages 
-                                (channel_name, message_id, message_date, message_text, has_media, views, forwards, image_path)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                                """
-                                values = (
-                                    msg['channel_name'],
-                                    msg['message_id'],
-                                    msg['message_date'],
-                                    msg['message_text'],
-                                    msg['has_media'],
-                                    msg['views'],
-                                    msg['forwards'],
-                                    msg['image_path']
-                                )
-                                cur.execute(insert_query, values)
-                            
-                            print(f"✅ Loaded {len(messages)} messages from {json_file}")
-                        except Exception as e:
-                            print(f"❌ Error loading {json_file}: {e}")
- 
+            for json_file in sorted(os.listdir(date_path)):
+                if not json_file.endswith('.json'):
+                    continue
+                if channels is not None and json_file[:-len('.json')] not in channels:
+                    continue
+                yield os.path.join(date_path, json_file)
+
+def load_json_to_postgres(base_path='data/raw/telegram_messages', method='copy', conn=None,
+                          dates=None, channels=None):
+    """
+    Bulk-loads every new or changed JSON file: rows are streamed into a staging
+    table and upserted on (channel_name, message_id). Files whose path, size and
+    mtime match the load manifest are skipped. Each file commits on its own, so
+    a failed file never leaves partial rows behind. `dates` (YYYY-MM-DD folder
+    names) and `channels` limit the load to those files.
+    """
+    with span("load", source="json") as info:
+        totals = _load_files(base_path, iter_json_files(base_path, dates, channels), _read_json, method, conn)
+        info.update(totals)
+    return totals
+
+def load_parquet_to_postgres(lake_dir=None, method='copy', conn=None, dates=None, channels=None):
+    """
+    Same load as load_json_to_postgres(), read from the Parquet lake
+    (src/lake.py) instead: whole files go to COPY as Arrow-written CSV, and
+    the manifest tracks the Parquet files, so each one is loaded once.
+    """
+    from src.lake import LAKE_DIR, iter_lake_files, read_messages
+    lake_dir = lake_dir or LAKE_DIR
+    with span("load", source="lake") as info:
+        files = iter_lake_files(lake_dir, dates, channels)
+        totals = _load_files(lake_dir, files, lambda path: read_messages(path, COLUMNS), method, conn)
+        info.update(totals)
+    return totals
+
+def _read_json(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _load_files(base_path, files, read, method, conn):
+    own_conn = conn is None
+    conn = conn or get_db_connection()
+    cur = conn.cursor()
+
+    print("--- Starting Data Load to PostgreSQL ---")
+    ensure_schema(cur)
     conn.commit()
+
+    totals = {"files": 0, "skipped": 0, "rows": 0, "upserted": 0}
+    for file_path in files:
+        file_name = os.path.relpath(file_path, base_path)
+        stat = os.stat(file_path)
+        if _already_loaded(cur, file_path, stat.st_size, stat.st_mtime):
+            totals["skipped"] += 1
+            continue
+
+        try:
+            with span("load", batch=True, file=file_name) as batch:
+                messages = read(file_path)
+                try:
+                    staged = _stage(cur, messages, method)
+                except psycopg2.Error as e:
+                    if method != 'copy':
+                        raise
+                    # e.g. COPY blocked by a proxy or missing privileges
+                    print(f"⚠️ COPY failed ({e}); falling back to execute_values")
+                    conn.rollback()
+                    method = 'values'
+                    staged = _stage(cur, messages, method)
+                load_id = new_load_id(cur)
+                upserted = upsert_staged(cur, load_id)
+                _record_loaded(cur, file_path, stat.st_size, stat.st_mtime, staged)
+                if upserted:
+                    record_batch(cur, load_id, 'telegram_messages', upserted)
+                conn.commit()
+                batch.update(rows=staged, upserted=upserted)
+            metrics.inc("rows_staged_total", staged)
+            metrics.inc("rows_upserted_total", upserted)
+
+            totals["files"] += 1
+            totals["rows"] += staged
+            totals["upserted"] += upserted
+            print(f"✅ Loaded {staged} messages from {file_name} ({upserted} new or changed)")
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error loading {file_name}: {e}")
+
     cur.close()
-    conn.close()
-    print("--- All data successfully loaded! ---")
+    if own_conn:
+        conn.close()
+    print(f"--- Loaded {totals['rows']} rows from {totals['files']} files "
+          f"({totals['upserted']} upserted, {totals['skipped']} unchanged files skipped) ---")
+    return totals
 
 if __name__ == "__main__":
-    load_json_to_postgres()
\ No newline at end of file
+    # --from-lake loads the Parquet files written by `python src/lake.py compact`
+    if '--from-lake' in sys.argv:
+        load_parquet_to_postgres()
+    else:
+        load_json_to_postgres()
@@ -0,0 +1,117 @@
+# Filename: detection_sink.py
+# Author: MAYSHLAMY
+# Problem: Persisting YOLO boxes as warehouse rows instead of annotated file names
+
+import os
+import sys
+from psycopg2.extras import execute_values
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database_loader import get_db_connection, ensure_batch_log, new_load_id, record_batch
+from src.media_store import MediaStore
+
+DETECTION_COLUMNS = ['image_hash', 'image_path', 'channel_name', 'message_id', 'class_name',
+                     'confidence', 'x1', 'y1', 'x2', 'y2', 'model_name', 'model_version']
+
+def ensure_detection_schema(cur):
+    """Creates refined.image_detections: one row per box per message showing the image."""
+    cur.execute("""
+        CREATE SCHEMA IF NOT EXISTS refined;
+        CREATE TABLE IF NOT EXISTS refined.image_detections (
+            id BIGSERIAL PRIMARY KEY,
+            image_hash TEXT,
+            image_path TEXT NOT NULL,
+            channel_name TEXT,
+            message_id BIGINT,
+            class_name TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+            model_name TEXT NOT NULL,
+            model_version TEXT,
+            detected_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        -- The write that stored the row; see record_batch in src/database_loader.py
+        ALTER TABLE refined.image_detections ADD COLUMN IF NOT EXISTS load_id BIGINT;
+        CREATE INDEX IF NOT EXISTS image_detections_message_idx
+            ON refined.image_detections (channel_name, message_id);
+        CREATE INDEX IF NOT EXISTS image_detections_path_idx ON refined.image_detections (image_path);
+        CREATE INDEX IF NOT EXISTS image_detections_class_idx
+            ON refined.image_detections (class_name, confidence);
+        CREATE TEMP TABLE IF NOT EXISTS image_detections_stage (
+            image_hash TEXT,
+            image_path TEXT,
+            channel_name TEXT,
+            message_id BIGINT,
+            class_name TEXT,
+            confidence REAL,
+            x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+            model_name TEXT,
+            model_version TEXT
+        ) ON COMMIT DELETE ROWS;
+    """)
+
+def image_hash_of(image_path):
+    """Media store objects are named <sha256>.jpg; other files have no hash."""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return stem if len(stem) == 64 and all(c in '0123456789abcdef' for c in stem) else None
+
+def detection_rows(records, model_name, model_version, media_store):
+    """
+    Expands detector records into table rows. A hashed image fans out to every
+    message that posted it; an image the media store does not know keeps a
+    NULL message key and is matched on image_path downstream.
+    """
+    for record in records:
+        image_path = record["image_path"]
+        sha = image_hash_of(image_path)
+        messages = media_store.messages_for(sha) if sha and media_store else []
+        for channel_name, message_id in messages or [(None, None)]:
+            for detection in record["detections"]:
+                x1, y1, x2, y2 = detection["bbox"]
+                yield (sha, image_path, channel_name, message_id, detection["class_name"],
+                       detection["confidence"], x1, y1, x2, y2, model_name, model_version)
+
+def write_detections(records, model_name, model_version=None, media_store=None, conn=None):
+    """
+    Bulk-writes one run's detections. Rows already stored for the scanned
+    images are replaced, so re-running detection never double counts.
+    Returns the number of rows written.
+    """
+    records = list(records)
+    own_conn = conn is None
+    conn = conn or get_db_connection()
+    own_store = media_store is None and os.path.exists('data/raw/media/index.sqlite')
+    media_store = media_store or (MediaStore() if own_store else None)
+    cur = conn.cursor()
+    try:
+        ensure_detection_schema(cur)
+        ensure_batch_log(cur)
+        load_id = new_load_id(cur)
+        execute_values(cur, f"INSERT INTO image_detections_stage ({', '.join(DETECTION_COLUMNS)}) VALUES %s",
+                       detection_rows(records, model_name, model_version, media_store), page_size=1000)
+        # Every scanned image is replaced, including those where nothing was found this time
+        execute_values(cur, """
+            DELETE FROM refined.image_detections d
+            USING (VALUES %s) AS scanned (image_path)
+            WHERE d.image_path = scanned.image_path
+        """, [(r["image_path"],) for r in records], page_size=1000)
+        cur.execute(f"""
+            INSERT INTO refined.image_detections ({', '.join(DETECTION_COLUMNS)}, load_id)
+            SELECT {', '.join(DETECTION_COLUMNS)}, %s FROM image_detections_stage
+        """, (load_id,))
+        written = cur.rowcount
+        if records:
+            record_batch(cur, load_id, 'image_detections', written)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        if own_conn:
+            conn.close()
+        if own_store:
+            media_store.close()
+    print(f"✅ Stored {written} detections from {len(records)} images in refined.image_detections")
+    return written
@@ -0,0 +1,176 @@
+# Filename: instrumentation.py
+# Author: MAYSHLAMY
+# Problem: Shared timing spans, counters, histograms and JSON logs for every pipeline stage
+
+import os
+import sys
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# PIPELINE_LOG_FORMAT=json writes one JSON object per span/event to stderr;
+# the emoji progress lines on stdout are unchanged
+LOG_FORMAT = os.getenv('PIPELINE_LOG_FORMAT', 'text')
+METRICS_PREFIX = 'medical_pipeline'
+# Seconds; cover a sub-millisecond cache hit up to a multi-minute dbt build
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+HELP = {
+    "stage_duration_seconds": "Wall time of one pipeline stage run",
+    "batch_duration_seconds": "Wall time of one batch inside a stage",
+    "discovery_requests_total": "Channel discovery searches and samples, by kind and source",
+    "messages_scraped_total": "Messages saved to the raw JSON files",
+    "rows_compacted_total": "Messages rewritten from JSON into the Parquet lake",
+    "media_bytes_downloaded_total": "Photo bytes downloaded from Telegram",
+    "rows_staged_total": "Rows copied into the raw staging table",
+    "rows_upserted_total": "Raw rows inserted or changed by the upsert",
+    "rows_refined_total": "Fact rows kept in refined.medical_data",
+    "rows_filtered_total": "Fact rows dropped by the cleaner, by reason",
+    "near_duplicates_total": "Refined messages clustered under an earlier post",
+    "dedup_candidate_pairs_total": "LSH candidate pairs checked on their signatures, by result",
+    "images_inferred_total": "Images run through the detection model",
+    "detections_total": "Bounding boxes returned by the detection model",
+    "image_inference_seconds": "Model time per image (batch time divided by batch size)",
+    "messages_linked_total": "Refined messages newly flagged with detections",
+    "api_requests_total": "API requests, by route and status",
+    "api_request_seconds": "API time to the first response byte, by route",
+    "api_cache_requests_total": "API cache lookups, by result",
+}
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+class Metrics:
+    """
+    In-process counters and histograms. Thread-safe, no dependencies, and
+    rendered in the Prometheus text format by render(). Process pool workers
+    have their own registry, so stages count in the parent from what the
+    workers return.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                hist["buckets"][index] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def snapshot(self):
+        """Flat {series: value} of every counter plus histogram counts and sums."""
+        with self._lock:
+            values = {f"{name}{_format_labels(key)}": v for (name, key), v in self._counters.items()}
+            for (name, key), hist in self._histograms.items():
+                values[f"{name}_count{_format_labels(key)}"] = hist["count"]
+                values[f"{name}_sum{_format_labels(key)}"] = round(hist["sum"], 6)
+        return values
+
+    def render(self):
+        """Prometheus text exposition (version 0.0.4) of the whole registry."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, dict(v, buckets=list(v["buckets"]))) for k, v in self._histograms.items())
+        seen = set()
+        for (name, key), value in counters:
+            full = f"{METRICS_PREFIX}_{name}"
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {full} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {full} counter")
+            lines.append(f"{full}{_format_labels(key)} {value}")
+        for (name, key), hist in histograms:
+            full = f"{METRICS_PREFIX}_{name}"
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {full} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {full} histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist["buckets"]):
+                cumulative += count
+                lines.append(f"{full}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{full}_bucket{_format_labels(key, [('le', '+Inf')])} {hist['count']}")
+            lines.append(f"{full}_sum{_format_labels(key)} {hist['sum']}")
+            lines.append(f"{full}_count{_format_labels(key)} {hist['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+# Process-wide registry used by every module
+metrics = Metrics()
+
+def log_event(event, **fields):
+    """Writes one structured log line when PIPELINE_LOG_FORMAT=json."""
+    if LOG_FORMAT != 'json':
+        return
+    record = {"ts": datetime.now(timezone.utc).isoformat(), "event": event, "pid": os.getpid(), **fields}
+    print(json.dumps(record, ensure_ascii=False, default=str), file=sys.stderr, flush=True)
+
+@contextmanager
+def span(stage, batch=False, **fields):
+    """
+    Times a stage (or, with batch=True, one batch of it) into the
+    stage_/batch_duration_seconds histogram and logs it. The yielded dict can
+    be filled with counts (rows, images...) that go into the log line.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.observe("batch_duration_seconds" if batch else "stage_duration_seconds", seconds, stage=stage)
+        log_event("batch" if batch else "stage", stage=stage, seconds=round(seconds, 6), status=status, **fields)
+
+@contextmanager
+def collect(stage):
+    """
+    Yields a dict that, once the block exits, holds what the block added to
+    the registry (counter increments, histogram counts and sums) plus its wall
+    time; Dagster assets attach it as materialization metadata. The library
+    functions open their own spans, so this one does not.
+    """
+    before = metrics.snapshot()
+    started = time.perf_counter()
+    collected = {}
+    yield collected
+    for series, value in metrics.snapshot().items():
+        delta = value - before.get(series, 0)
+        if delta:
+            collected[series] = round(delta, 6) if isinstance(delta, float) else delta
+    collected["duration_seconds"] = round(time.perf_counter() - started, 3)
+    log_event("collected", stage=stage, **collected)
@@ -0,0 +1,143 @@
+# Filename: lake.py
+# Author: MAYSHLAMY
+# Problem: Columnar Parquet lake between the scraped JSON files and PostgreSQL
+
+import os
+import sys
+import json
+import argparse
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database_loader import iter_json_files
+from src.instrumentation import metrics, span
+
+try:
+    import duckdb
+except ImportError:  # Only the SQL query path needs DuckDB; compaction and loading use pyarrow alone
+    duckdb = None
+
+load_dotenv()
+
+RAW_JSON_DIR = 'data/raw/telegram_messages'
+# Hive layout: <LAKE_DIR>/date=YYYY-MM-DD/channel=<name>/part-0.parquet
+LAKE_DIR = os.getenv('LAKE_DIR', 'data/lake/telegram_messages')
+LAKE_COMPRESSION = os.getenv('LAKE_COMPRESSION', 'zstd')
+
+# The scraper's JSON record; date and channel also come back as partition columns
+MESSAGE_SCHEMA = pa.schema([
+    ('channel_name', pa.string()),
+    ('message_id', pa.int64()),
+    ('message_date', pa.string()),
+    ('message_text', pa.string()),
+    ('has_media', pa.bool_()),
+    ('views', pa.int64()),
+    ('forwards', pa.int64()),
+    ('image_path', pa.string()),
+    ('image_hash', pa.string()),
+])
+
+def partition_path(date, channel, lake_dir=LAKE_DIR):
+    return os.path.join(lake_dir, f"date={date}", f"channel={channel}", "part-0.parquet")
+
+def iter_lake_files(lake_dir=LAKE_DIR, dates=None, channels=None):
+    """Yields the lake's Parquet files in date, then channel order, limited to `dates` / `channels`."""
+    if not os.path.isdir(lake_dir):
+        return
+    for date_folder in sorted(os.listdir(lake_dir)):
+        if not date_folder.startswith('date=') or (dates is not None and date_folder[5:] not in dates):
+            continue
+        date_path = os.path.join(lake_dir, date_folder)
+        for channel_folder in sorted(os.listdir(date_path)):
+            if not channel_folder.startswith('channel=') or (channels is not None and channel_folder[8:] not in channels):
+                continue
+            channel_path = os.path.join(date_path, channel_folder)
+            for file_name in sorted(os.listdir(channel_path)):
+                if file_name.endswith('.parquet'):
+                    yield os.path.join(channel_path, file_name)
+
+def read_messages(parquet_path, columns=None):
+    """One lake file as an Arrow table."""
+    return pq.read_table(parquet_path, columns=columns)
+
+def compact_json(base_path=RAW_JSON_DIR, lake_dir=LAKE_DIR, dates=None, channels=None):
+    """
+    Rewrites each <date>/<channel>.json file as one Parquet file in the lake.
+    The scraper merges every batch of a day into that day's JSON file, so the
+    matching Parquet file is replaced whole; files already newer than their
+    JSON are skipped. Each file is written under a temporary name and renamed,
+    so readers never see half a file.
+    """
+    with span("compact") as info:
+        totals = {"files": 0, "skipped": 0, "rows": 0, "json_bytes": 0, "parquet_bytes": 0}
+        for json_path in iter_json_files(base_path, dates, channels):
+            date = os.path.basename(os.path.dirname(json_path))
+            channel = os.path.basename(json_path)[:-len('.json')]
+            target = partition_path(date, channel, lake_dir)
+            if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(json_path):
+                totals["skipped"] += 1
+                continue
+
+            with open(json_path, 'r', encoding='utf-8') as f:
+                table = pa.Table.from_pylist(json.load(f), schema=MESSAGE_SCHEMA)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            pq.write_table(table, target + '.tmp', compression=LAKE_COMPRESSION)
+            os.replace(target + '.tmp', target)
+
+            json_bytes, parquet_bytes = os.path.getsize(json_path), os.path.getsize(target)
+            totals["files"] += 1
+            totals["rows"] += table.num_rows
+            totals["json_bytes"] += json_bytes
+            totals["parquet_bytes"] += parquet_bytes
+            print(f"✅ Compacted {table.num_rows} messages from {date}/{channel}.json "
+                  f"({json_bytes / 1024:.0f} KiB -> {parquet_bytes / 1024:.0f} KiB)")
+        info.update(totals)
+    metrics.inc("rows_compacted_total", totals["rows"])
+    ratio = totals["json_bytes"] / totals["parquet_bytes"] if totals["parquet_bytes"] else 0.0
+    print(f"--- Compacted {totals['rows']} rows from {totals['files']} files "
+          f"({ratio:.1f}x smaller, {totals['skipped']} up-to-date files skipped) ---")
+    return totals
+
+def connect(lake_dir=LAKE_DIR):
+    """
+    An in-memory DuckDB connection with a `messages` view over the whole lake.
+    The view carries the Hive partition columns `date` and `channel`, and
+    filters on them prune files before anything is read.
+    """
+    if duckdb is None:
+        raise RuntimeError("DuckDB is not installed: pip install duckdb")
+    if next(iter_lake_files(lake_dir), None) is None:
+        raise FileNotFoundError(f"No Parquet files under {lake_dir}; run `python src/lake.py compact` first")
+    pattern = os.path.join(lake_dir, '*', '*', '*.parquet').replace("'", "''")
+    con = duckdb.connect()
+    con.execute(f"""
+        CREATE VIEW messages AS
+        SELECT * FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)
+    """)
+    return con
+
+def query(sql, params=None, lake_dir=LAKE_DIR):
+    """Runs SQL against the lake's `messages` view without touching PostgreSQL; returns an Arrow table."""
+    con = connect(lake_dir)
+    try:
+        return con.execute(sql, params or []).to_arrow_table()
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parquet lake of the scraped Telegram messages")
+    commands = parser.add_subparsers(dest='command', required=True)
+    compact = commands.add_parser('compact', help="convert new or changed JSON files to Parquet")
+    compact.add_argument('--date', action='append', dest='dates', help="YYYY-MM-DD folder; repeatable")
+    compact.add_argument('--channel', action='append', dest='channels', help="repeatable")
+    sql = commands.add_parser('query', help="run SQL against the `messages` view with DuckDB")
+    sql.add_argument('sql', help="e.g. \"SELECT channel, COUNT(*) FROM messages GROUP BY 1\"")
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        compact_json(dates=args.dates, channels=args.channels)
+    else:
+        print(query(args.sql).to_pandas().to_string(index=False))
@@ -3,14 +3,100 @@
 # Problem: Linking image detection results back to the database with schema protection
 
 import os
+import sys
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.detection_sink import image_hash_of
+from src.instrumentation import metrics, span
+
 load_dotenv()
 
-def link_results():
+def ensure_link_schema(cur):
+    """Detection columns plus the exact keys the linking UPDATE joins on."""
+    # This prevents the "UndefinedColumn" error if the table was recently replaced
+    cur.execute("""
+        ALTER TABLE refined.medical_data
+        ADD COLUMN IF NOT EXISTS has_detection BOOLEAN DEFAULT FALSE,
+        ADD COLUMN IF NOT EXISTS detection_count INTEGER DEFAULT 0;
+        CREATE UNIQUE INDEX IF NOT EXISTS medical_data_msg_key_idx ON refined.medical_data (msg_key);
+        CREATE INDEX IF NOT EXISTS medical_data_image_path_idx ON refined.medical_data (image_path);
+    """)
+
+def stage_from_table(cur):
+    """
+    Per-message box counts from refined.image_detections (src/detection_sink.py).
+    Boxes carry (channel_name, message_id), which the raw table's unique key
+    turns into msg_key; boxes without a message key match on the exact image_path.
+    """
+    cur.execute("""
+        INSERT INTO linked_messages (msg_key, detection_count)
+        SELECT msg_key, SUM(boxes)
+        FROM (
+            SELECT t.id AS msg_key, COUNT(*) AS boxes
+            FROM refined.image_detections d
+            JOIN raw.telegram_messages t
+              ON t.channel_name = d.channel_name AND t.message_id = d.message_id
+            GROUP BY t.id
+            UNION ALL
+            SELECT r.msg_key, COUNT(*)
+            FROM refined.image_detections d
+            JOIN refined.medical_data r ON r.image_path = d.image_path
+            WHERE d.message_id IS NULL
+            GROUP BY r.msg_key
+        ) keyed
+        GROUP BY msg_key
+    """)
+
+def stage_from_folder(cur, detection_folder):
+    """
+    Legacy source: annotated 'detected_<file>' images. Their names are
+    bulk-loaded and matched on the exact file name, never a substring, so
+    '1.jpg' no longer flags '11.jpg'. The folder carries no box counts.
+    """
+    detected_files = [f for f in os.listdir(detection_folder) if f.startswith('detected_')]
+    cur.execute("CREATE TEMP TABLE detected_files (image_path TEXT PRIMARY KEY) ON COMMIT DROP")
+    # Hash-named files are looked up by their full object path, which is indexed
+    hashed = [(os.path.join('data/raw/media', 'objects', sha[:2], f"{sha}.jpg"),)
+              for sha in (image_hash_of(f.replace('detected_', '', 1)) for f in detected_files) if sha]
+    execute_values(cur, "INSERT INTO detected_files (image_path) VALUES %s ON CONFLICT DO NOTHING",
+                   hashed, page_size=1000)
+    cur.execute("""
+        INSERT INTO linked_messages (msg_key, detection_count)
+        SELECT DISTINCT r.msg_key, 1
+        FROM refined.medical_data r
+        JOIN detected_files f ON f.image_path = r.image_path
+    """)
+    others = [(f.replace('detected_', '', 1),) for f in detected_files
+              if not image_hash_of(f.replace('detected_', '', 1))]
+    if others:
+        # Older per-channel file names: compare the last path segment exactly
+        cur.execute("CREATE TEMP TABLE detected_names (file_name TEXT PRIMARY KEY) ON COMMIT DROP")
+        execute_values(cur, "INSERT INTO detected_names (file_name) VALUES %s ON CONFLICT DO NOTHING",
+                       others, page_size=1000)
+        cur.execute(r"""
+            INSERT INTO linked_messages (msg_key, detection_count)
+            SELECT DISTINCT r.msg_key, 1
+            FROM refined.medical_data r
+            JOIN detected_names n ON n.file_name = regexp_replace(r.image_path, '^.*[\\/]', '')
+            ON CONFLICT (msg_key) DO NOTHING
+        """)
+    return len(detected_files)
+
+def link_results(detection_folder='data/detections', source='auto', conn=None):
+    with span("link", source=source) as info:
+        linked = _link(detection_folder, source, conn)
+        info["linked"] = linked
+    metrics.inc("messages_linked_total", linked)
+    return linked
+
+def _link(detection_folder, source, conn):
     # 1. Establish connection to the medical warehouse
-    conn = psycopg2.connect(
+    own_conn = conn is None
+    conn = conn or psycopg2.connect(
         host=os.getenv('DB_HOST'),
         database=os.getenv('DB_NAME'),
         user=os.getenv('DB_USER'),
@@ -18,46 +104,59 @@ def link_results():
         port=os.getenv('DB_PORT')
     )
     cur = conn.cursor()
-    
-    # 2. SCHEMA PROTECTION: Ensure columns exist in the refined table
-    # This prevents the "UndefinedColumn" error if the table was recently replaced
+
+    # 2. SCHEMA PROTECTION: Ensure columns and join keys exist in the refined table
     print("--- Checking Database Schema ---")
-    cur.execute("""
-        ALTER TABLE refined.medical_data 
-        ADD COLUMN IF NOT EXISTS has_detection BOOLEAN DEFAULT FALSE,
-        ADD COLUMN IF NOT EXISTS detection_count INTEGER DEFAULT 0;
-    """)
+    ensure_link_schema(cur)
     conn.commit()
 
-    # 3. Identify detected images
-    detection_folder = 'data/detections'
-    if not os.path.exists(detection_folder):
-        print(f"❌ Error: Folder {detection_folder} not found!")
-        return
+    # 3. Collect the detected messages into a temp table, from the detections
+    # table when the detector has written one, otherwise from the annotated files
+    cur.execute("""
+        CREATE TEMP TABLE linked_messages (
+            msg_key BIGINT PRIMARY KEY,
+            detection_count INTEGER NOT NULL
+        ) ON COMMIT DROP
+    """)
+    if source == 'auto':
+        cur.execute("SELECT to_regclass('refined.image_detections')")
+        source = 'table' if cur.fetchone()[0] else 'folder'
+    if source == 'table':
+        stage_from_table(cur)
+    else:
+        if not os.path.exists(detection_folder):
+            print(f"❌ Error: Folder {detection_folder} not found!")
+            conn.rollback()
+            return 0
+        print(f"--- Linking {stage_from_folder(cur, detection_folder)} detected files ---")
 
-    detected_files = [f for f in os.listdir(detection_folder) if f.startswith('detected_')]
-    
-    print(f"--- Linking {len(detected_files)} detections to Database ---")
-    
-    # 4. Link results using fuzzy matching on the image path
-    for file_name in detected_files:
-        # Extract the original filename (e.g., 'detected_9075.jpg' -> '9075.jpg')
-        original_name = file_name.replace('detected_', '')
-        
-        query = """
-            UPDATE refined.medical_data 
-            SET has_detection = TRUE
-            WHERE image_path LIKE %s
-        """
-        # We use % wrapping to match the filename within the full system path string
-        cur.execute(query, (f"%{original_name}%",))
-    
+    # 4. One join-based UPDATE; rows already linked with the same count are left alone.
+    # Images are content-addressed, so one detected image flags every message
+    # that reposted the same photo. The staged set is every current detection, so a
+    # flagged message missing from it (its boxes were re-scanned away) is cleared.
+    cur.execute("""
+        UPDATE refined.medical_data r
+        SET has_detection = s.detection_count IS NOT NULL,
+            detection_count = COALESCE(s.detection_count, 0)
+        FROM (
+            SELECT m.msg_key, l.detection_count
+            FROM refined.medical_data m
+            LEFT JOIN linked_messages l ON l.msg_key = m.msg_key
+            WHERE m.has_detection OR l.msg_key IS NOT NULL
+        ) s
+        WHERE r.msg_key = s.msg_key
+          AND (r.has_detection, r.detection_count)
+              IS DISTINCT FROM (s.detection_count IS NOT NULL, COALESCE(s.detection_count, 0))
+    """)
+    linked = cur.rowcount
     conn.commit()
-    print("✅ Database updated with AI detection flags!")
-    
+    print(f"✅ Database updated with AI detection flags! ({linked} messages newly linked, updated or cleared)")
+
     # 5. Cleanup
     cur.close()
-    conn.close()
+    if own_conn:
+        conn.close()
+    return linked
 
 if __name__ == '__main__':
-    link_results()
\ No newline at end of file
+    link_results(source=sys.argv[1] if len(sys.argv) > 1 else 'auto')
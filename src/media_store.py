@@ -0,0 +1,120 @@
+# Filename: media_store.py
+# Author: MAYSHLAMY
+# Problem: Content-addressed image store so reposted photos are downloaded, stored and scanned once
+
+import os
+import hashlib
+import sqlite3
+import threading
+
+
+class MediaStore:
+    """
+    Stores every image once under objects/<sha[:2]>/<sha>.jpg, keyed by the
+    SHA-256 of its bytes. A small SQLite index next to the objects keeps:
+      - photos:   Telegram photo id -> sha256 (lets the scraper skip a download)
+      - pointers: (channel_name, message_id) -> sha256 (which messages show the image)
+      - failed_photos: messages saved without their photo, retried on later runs
+    """
+
+    def __init__(self, root='data/raw/media'):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite'))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS photos (
+                photo_id INTEGER PRIMARY KEY,
+                sha256   TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pointers (
+                channel_name TEXT NOT NULL,
+                message_id   INTEGER NOT NULL,
+                sha256       TEXT NOT NULL,
+                PRIMARY KEY (channel_name, message_id)
+            );
+            CREATE INDEX IF NOT EXISTS pointers_sha256 ON pointers (sha256);
+            CREATE TABLE IF NOT EXISTS failed_photos (
+                channel_name TEXT NOT NULL,
+                message_id   INTEGER NOT NULL,
+                photo_id     INTEGER NOT NULL,
+                attempts     INTEGER NOT NULL,
+                last_error   TEXT,
+                PRIMARY KEY (channel_name, message_id)
+            );
+        """)
+
+    def object_path(self, sha):
+        return os.path.join(self.objects_dir, sha[:2], f"{sha}.jpg")
+
+    def lookup_photo(self, photo_id):
+        """Returns the hash of an already stored Telegram photo, or None."""
+        row = self.db.execute("SELECT sha256 FROM photos WHERE photo_id = ?", (photo_id,)).fetchone()
+        if row and os.path.exists(self.object_path(row[0])):
+            return row[0]
+        return None
+
+    def put(self, data, photo_id=None):
+        """Writes `data` unless identical bytes are already stored; returns its hash."""
+        sha = self.write_object(data)
+        if photo_id is not None:
+            self.record_photo(photo_id, sha)
+        return sha
+
+    def write_object(self, data):
+        """
+        Hashes and writes `data` unless identical bytes are already stored;
+        returns its hash. Touches no SQLite state, so it may run in a worker thread.
+        """
+        sha = hashlib.sha256(data).hexdigest()
+        path = self.object_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Per-thread temporary name: two threads may write the same bytes at once
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return sha
+
+    def record_photo(self, photo_id, sha):
+        """Records that Telegram photo `photo_id` is stored as `sha`."""
+        self.db.execute("INSERT OR REPLACE INTO photos (photo_id, sha256) VALUES (?, ?)",
+                        (photo_id, sha))
+
+    def link(self, channel_name, message_id, sha):
+        """Records that a message shows the image `sha`."""
+        self.db.execute("INSERT OR REPLACE INTO pointers (channel_name, message_id, sha256) VALUES (?, ?, ?)",
+                        (channel_name, message_id, sha))
+
+    def record_failure(self, channel_name, message_id, photo_id, error):
+        """Counts a failed download of a message's photo; returns the attempts so far."""
+        self.db.execute("""
+            INSERT INTO failed_photos (channel_name, message_id, photo_id, attempts, last_error)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (channel_name, message_id)
+            DO UPDATE SET attempts = attempts + 1, photo_id = excluded.photo_id, last_error = excluded.last_error
+        """, (channel_name, message_id, photo_id, str(error)))
+        return self.db.execute("SELECT attempts FROM failed_photos WHERE channel_name = ? AND message_id = ?",
+                               (channel_name, message_id)).fetchone()[0]
+
+    def clear_failure(self, channel_name, message_id):
+        self.db.execute("DELETE FROM failed_photos WHERE channel_name = ? AND message_id = ?",
+                        (channel_name, message_id))
+
+    def failed_photos(self, channel_name, max_attempts):
+        """Message ids of the channel whose photo failed fewer than `max_attempts` times."""
+        return [row[0] for row in self.db.execute(
+            "SELECT message_id FROM failed_photos WHERE channel_name = ? AND attempts < ? ORDER BY message_id",
+            (channel_name, max_attempts))]
+
+    def messages_for(self, sha):
+        return self.db.execute("SELECT channel_name, message_id FROM pointers WHERE sha256 = ?",
+                               (sha,)).fetchall()
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
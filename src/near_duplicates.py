@@ -0,0 +1,327 @@
+# Filename: near_duplicates.py
+# Author: MAYSHLAMY
+# Problem: Cluster reposted (near-duplicate) messages with MinHash/LSH instead of pairwise comparison
+
+import os
+import sys
+import sqlite3
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.instrumentation import metrics, span
+
+load_dotenv()
+
+DEDUP_INDEX_PATH = os.getenv('DEDUP_INDEX_PATH', 'data/state/near_duplicates.sqlite')
+# Character shingles survive a changed price, phone number or emoji better than word shingles
+SHINGLE_SIZE = int(os.getenv('DEDUP_SHINGLE_SIZE', 5))
+# NUM_PERM hash functions split into BANDS bands of NUM_PERM / BANDS rows each
+NUM_PERM = int(os.getenv('DEDUP_NUM_PERM', 64))
+BANDS = int(os.getenv('DEDUP_BANDS', 16))
+# Estimated Jaccard similarity at which two messages count as the same post
+THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0.8))
+# Shorter texts ("call now", empty captions) are never clustered
+MIN_CHARS = int(os.getenv('DEDUP_MIN_CHARS', 20))
+# Texts hashed at once: ~50k shingles keep the 64 passes over them in CPU cache (2-3x faster than 20k texts)
+SIGNATURE_BATCH = 256
+# Candidate pairs compared at once
+VERIFY_BATCH = 100000
+
+_SEED = 20240611
+_NO_MATCH = np.iinfo(np.int64).max
+
+def normalize(text):
+    """Lower-cased with whitespace collapsed, so spacing and case never split a cluster."""
+    return ' '.join(str(text).lower().split()) if text else ''
+
+def shingle_hashes(texts, k=SHINGLE_SIZE):
+    """
+    64-bit polynomial hashes of every k-character shingle of `texts` (each at
+    least k characters), computed for the whole list in a few array passes.
+    Returns (hashes, owner), owner being the index of each shingle's text.
+    """
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    windows = len(codes) - k + 1
+    hashes = np.zeros(windows, dtype=np.uint64)
+    for j in range(k):
+        # Wraps modulo 2**64 by design
+        hashes *= np.uint64(1000003)
+        hashes += codes[j:j + windows]
+
+    # Keep only the windows that lie inside one text
+    counts = lengths - k + 1
+    owner = np.repeat(np.arange(len(texts)), counts)
+    firsts = np.cumsum(counts) - counts
+    positions = np.arange(counts.sum()) - np.repeat(firsts - (np.cumsum(lengths) - lengths), counts)
+    return hashes[positions], owner
+
+class NearDuplicateIndex:
+    """
+    Persistent MinHash/LSH index of each cluster's canonical (first) message.
+    A small SQLite file, like MediaStore's, keeps one row per canonical:
+    msg_key -> MinHash signature. Their band hashes are computed once per
+    process into one sorted array per band (the LSH buckets).
+    assign() clusters a batch against itself by sorting its band hashes and
+    against history by binary search in those arrays, then verifies every
+    candidate pair on its signatures, so the cost grows with the batch, not
+    with n².
+    """
+
+    def __init__(self, path=DEDUP_INDEX_PATH, num_perm=NUM_PERM, bands=BANDS, threshold=THRESHOLD,
+                 shingle_size=SHINGLE_SIZE, min_chars=MIN_CHARS):
+        if num_perm % bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) must be a multiple of DEDUP_BANDS ({bands})")
+        self.num_perm, self.bands, self.rows = num_perm, bands, num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.min_chars = max(min_chars, shingle_size)
+        rng = np.random.default_rng(_SEED)
+        # Multiply-add hash functions (a * x + b mod 2**64, odd a); a signature keeps the top 32 bits of each minimum
+        self.a = rng.integers(0, 2**64, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**64, num_perm, dtype=np.uint64)
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS settings (
+                name  TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS canonicals (
+                msg_key   INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL
+            );
+        """)
+        self._check_settings()
+        # Per band: (sorted band hashes, canonical msg_key of each), built on first use
+        self.buckets = None
+
+    def _check_settings(self):
+        """Signatures made with other settings can't be compared; refuse instead of silently missing matches."""
+        current = {"num_perm": str(self.num_perm), "bands": str(self.bands),
+                   "shingle_size": str(self.shingle_size), "seed": str(_SEED)}
+        stored = dict(self.db.execute("SELECT name, value FROM settings").fetchall())
+        if not stored:
+            self.db.executemany("INSERT INTO settings (name, value) VALUES (?, ?)", current.items())
+            self.db.commit()
+        elif stored != current:
+            raise ValueError(f"{self.path} was built with {stored}, not {current}; "
+                             f"rebuild it with `python src/near_duplicates.py --reset`")
+
+    def signatures(self, texts):
+        """MinHash signatures (uint32, one row of num_perm per text) of normalized texts."""
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(texts), SIGNATURE_BATCH):
+            hashes, owner = shingle_hashes(texts[start:start + SIGNATURE_BATCH], self.shingle_size)
+            firsts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+            mixed = np.empty_like(hashes)
+            block = signatures[start:start + SIGNATURE_BATCH]
+            for p in range(self.num_perm):
+                np.multiply(hashes, self.a[p], out=mixed)
+                mixed += self.b[p]
+                # The shift commutes with the minimum, so it runs on one value per text
+                block[:, p] = np.minimum.reduceat(mixed, firsts) >> np.uint64(32)
+        return signatures
+
+    def band_hashes(self, signatures):
+        """One 64-bit hash per band (as int64, SQLite's INTEGER); equal hashes make a candidate pair."""
+        rows = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        hashes = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        for r in range(self.rows):
+            hashes *= np.uint64(0x9E3779B97F4A7C15)
+            hashes += rows[:, :, r]
+        return hashes.view(np.int64)
+
+    def assign(self, msg_keys, texts):
+        """
+        Returns (dup_cluster_id, is_canonical) arrays aligned with the input.
+        A cluster's id is the msg_key of its first indexed message, its
+        canonical; messages matching no earlier one are their own cluster.
+        New canonicals are added to the index but not committed. Commit before
+        storing the batch: if storing fails, the retried batch finds its own
+        canonicals in the index and gets the same ids.
+        """
+        msg_keys = np.asarray(msg_keys, dtype=np.int64)
+        texts = [normalize(t) for t in texts]
+        clusters = msg_keys.copy()
+        with span("dedup", batch=True, rows=len(msg_keys)) as info:
+            # In msg_key order, so the earliest post of a cluster becomes its canonical
+            order = np.argsort(msg_keys, kind='stable')
+            order = order[np.fromiter((len(texts[i]) >= self.min_chars for i in order), dtype=bool,
+                                      count=len(order))]
+            if len(order):
+                signatures = self.signatures([texts[i] for i in order])
+                clusters[order] = self._cluster(msg_keys[order], signatures)
+            canonical = clusters == msg_keys
+            info.update(indexed=len(order), duplicates=int((~canonical).sum()))
+        metrics.inc("near_duplicates_total", int((~canonical).sum()))
+        return clusters, canonical
+
+    def _cluster(self, keys, signatures):
+        bands = self.band_hashes(signatures)
+        n = len(keys)
+
+        # Within the batch: every member of a bucket is paired with its first member
+        left, right = [], []
+        for band in range(self.bands):
+            by_hash = np.argsort(bands[:, band], kind='stable')
+            sorted_hashes = bands[by_hash, band]
+            starts = np.r_[True, sorted_hashes[1:] != sorted_hashes[:-1]]
+            heads = by_hash[np.flatnonzero(starts)[np.cumsum(starts) - 1]]
+            follower = ~starts
+            left.append(heads[follower])
+            right.append(by_hash[follower])
+        pairs = np.unique(np.concatenate(left) * n + np.concatenate(right))
+        left, right = self._verified(pairs // n, signatures, pairs % n, signatures)
+
+        # Connected components: propagate the smallest row index until stable
+        labels = np.arange(n)
+        while len(left):
+            previous = labels
+            lowest = np.minimum(labels[left], labels[right])
+            labels = labels.copy()
+            np.minimum.at(labels, left, lowest)
+            np.minimum.at(labels, right, lowest)
+            labels = labels[labels]
+            if np.array_equal(labels, previous):
+                break
+
+        # Against history: the earliest canonical each row matches
+        matched = self._history_matches(bands, signatures)
+        component_match = np.full(n, _NO_MATCH, dtype=np.int64)
+        np.minimum.at(component_match, labels, matched)
+        component_match = component_match[labels]
+        clusters = np.where(component_match != _NO_MATCH, component_match, keys[labels])
+
+        new = np.flatnonzero(clusters == keys)
+        self.db.executemany("INSERT OR IGNORE INTO canonicals (msg_key, signature) VALUES (?, ?)",
+                            ((int(keys[i]), signatures[i].tobytes()) for i in new))
+        self._add_to_buckets(keys[new], bands[new])
+        return clusters
+
+    def _verified(self, left, left_signatures, right, right_signatures):
+        """The candidate pairs whose signatures agree on at least `threshold` of their hashes."""
+        keep = np.zeros(len(left), dtype=bool)
+        for start in range(0, len(left), VERIFY_BATCH):
+            stop = start + VERIFY_BATCH
+            agree = (left_signatures[left[start:stop]] == right_signatures[right[start:stop]]).mean(axis=1)
+            keep[start:stop] = agree >= self.threshold
+        metrics.inc("dedup_candidate_pairs_total", int(keep.sum()), result="match")
+        metrics.inc("dedup_candidate_pairs_total", len(left) - int(keep.sum()), result="rejected")
+        return left[keep], right[keep]
+
+    def _load_buckets(self):
+        keys, bands = [], []
+        cursor = self.db.execute("SELECT msg_key, signature FROM canonicals ORDER BY msg_key")
+        while rows := cursor.fetchmany(100000):
+            keys.append(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+            bands.append(self.band_hashes(np.frombuffer(b''.join(r[1] for r in rows),
+                                                        dtype=np.uint32).reshape(-1, self.num_perm)))
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+        bands = np.concatenate(bands) if bands else np.empty((0, self.bands), dtype=np.int64)
+        # np.unique keeps the first, i.e. earliest, canonical of each bucket
+        self.buckets = []
+        for band in range(self.bands):
+            hashes, first = np.unique(bands[:, band], return_index=True)
+            self.buckets.append((hashes, keys[first]))
+
+    def _add_to_buckets(self, keys, bands):
+        """Adds new canonicals to buckets that have none yet, keeping every band sorted."""
+        for band, (hashes, owners) in enumerate(self.buckets):
+            new_hashes, first = np.unique(bands[:, band], return_index=True)
+            positions = np.searchsorted(hashes, new_hashes)
+            fresh = np.ones(len(new_hashes), dtype=bool)
+            if len(hashes):
+                fresh = hashes[np.minimum(positions, len(hashes) - 1)] != new_hashes
+            self.buckets[band] = (np.insert(hashes, positions[fresh], new_hashes[fresh]),
+                                  np.insert(owners, positions[fresh], keys[first][fresh]))
+
+    def _history_matches(self, bands, signatures):
+        """msg_key of the earliest indexed canonical each row matches, or _NO_MATCH."""
+        if self.buckets is None:
+            self._load_buckets()
+        matched = np.full(len(bands), _NO_MATCH, dtype=np.int64)
+        rows, canonicals = [], []
+        for band, (hashes, owners) in enumerate(self.buckets):
+            if not len(hashes):
+                continue
+            positions = np.minimum(np.searchsorted(hashes, bands[:, band]), len(hashes) - 1)
+            hit = np.flatnonzero(hashes[positions] == bands[:, band])
+            rows.append(hit)
+            canonicals.append(owners[positions[hit]])
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        if not len(rows):
+            return matched
+        canonicals = np.concatenate(canonicals)
+        # A pair found in several bands is verified once
+        by_pair = np.lexsort((canonicals, rows))
+        rows, canonicals = rows[by_pair], canonicals[by_pair]
+        first = np.r_[True, (rows[1:] != rows[:-1]) | (canonicals[1:] != canonicals[:-1])]
+        pairs = np.stack([rows[first], canonicals[first]], axis=1)
+
+        # Only the candidates' signatures are read back from disk
+        wanted = np.unique(pairs[:, 1])
+        found = {}
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500].tolist()
+            found.update(self.db.execute(
+                f"SELECT msg_key, signature FROM canonicals WHERE msg_key IN ({', '.join('?' * len(chunk))})",
+                chunk).fetchall())
+        history = np.frombuffer(b''.join(found[k] for k in wanted.tolist()),
+                                dtype=np.uint32).reshape(-1, self.num_perm)
+        rows, hits = self._verified(pairs[:, 0], signatures, np.searchsorted(wanted, pairs[:, 1]), history)
+        np.minimum.at(matched, rows, wanted[hits])
+        return matched
+
+    def replace_canonicals(self, removed, msg_keys, texts):
+        """
+        Drops the `removed` canonicals (messages deleted from the refined table)
+        and indexes `msg_keys`, the copies that now stand for their clusters, so
+        later reposts join them. Not committed, like assign().
+        """
+        self.db.executemany("DELETE FROM canonicals WHERE msg_key = ?", ((int(k),) for k in removed))
+        texts = [normalize(t) for t in texts]
+        keep = [i for i, t in enumerate(texts) if len(t) >= self.min_chars]
+        if keep:
+            signatures = self.signatures([texts[i] for i in keep])
+            self.db.executemany("INSERT OR REPLACE INTO canonicals (msg_key, signature) VALUES (?, ?)",
+                                ((int(msg_keys[i]), s.tobytes()) for i, s in zip(keep, signatures)))
+        # A bucket keeps only its earliest owner, so removals rebuild them on next use
+        self.buckets = None
+
+    def canonical_count(self):
+        return self.db.execute("SELECT COUNT(*) FROM canonicals").fetchone()[0]
+
+    def reset(self):
+        """Forgets every cluster; the next assign() starts a fresh history."""
+        self.db.executescript("DELETE FROM canonicals; DELETE FROM settings;")
+        self._check_settings()
+        self.buckets = None
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate index of refined.medical_data")
+    parser.add_argument('--reset', action='store_true',
+                        help="delete the index (e.g. after changing DEDUP_* settings); "
+                             "re-cluster with `python src/data_cleaner.py`")
+    args = parser.parse_args()
+
+    if args.reset:
+        if os.path.exists(DEDUP_INDEX_PATH):
+            os.remove(DEDUP_INDEX_PATH)
+        print(f"✅ Removed {DEDUP_INDEX_PATH}")
+    else:
+        index = NearDuplicateIndex()
+        print(f"--- {index.canonical_count()} clusters indexed in {DEDUP_INDEX_PATH} ---")
+        index.close()
@@ -0,0 +1,49 @@
+# Filename: scrape_state.py
+# Author: MAYSHLAMY
+# Problem: Persisted per-channel high-water marks for incremental scraping
+
+import os
+import json
+
+
+class ScrapeState:
+    """
+    Small JSON-backed store of how far each channel has been scraped.
+
+    Per channel it keeps:
+      - last_message_id:   newest message id already saved (incremental high-water mark)
+      - oldest_message_id: oldest message id already saved (backfill cursor)
+      - backfill_complete: True once paging backwards hit the start of the channel
+    Every update is flushed with an atomic rename, so an interrupted run resumes cleanly.
+    """
+
+    def __init__(self, path='data/state/scrape_state.json'):
+        self.path = path
+        self.channels = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.channels = json.load(f)
+
+    def get(self, channel):
+        return self.channels.get(channel, {})
+
+    def record(self, channel, message_ids):
+        """Widens the channel's [oldest, last] window to cover `message_ids`."""
+        if not message_ids:
+            return
+        entry = self.channels.setdefault(channel, {})
+        newest, oldest = max(message_ids), min(message_ids)
+        entry["last_message_id"] = max(newest, entry.get("last_message_id", newest))
+        entry["oldest_message_id"] = min(oldest, entry.get("oldest_message_id", oldest))
+        self.save()
+
+    def mark_backfill_complete(self, channel):
+        self.channels.setdefault(channel, {})["backfill_complete"] = True
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.channels, f, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.path)
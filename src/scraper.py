@@ -1,79 +1,324 @@
 import os
 import sys
 import json
+import time
+import asyncio
 from datetime import datetime
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 from dotenv import load_dotenv
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from scripts.discover_channels import get_discovered_channels
+from src.scrape_state import ScrapeState
+from src.media_store import MediaStore
+from src.instrumentation import metrics, span
 
 
 load_dotenv()
 API_ID = os.getenv('TG_API_ID')
 API_HASH = os.getenv('TG_API_HASH')
 
+# How many channels are scraped at once, and how many photo downloads may be
+# in flight across all of them. A channel holds its slot from listing through its
+# photos and backfill, so this also bounds how many message lists are in memory.
+# Setting both to 1 gives the old serial run.
+CHANNEL_CONCURRENCY = int(os.getenv('SCRAPE_CHANNEL_CONCURRENCY', 4))
+MEDIA_CONCURRENCY = int(os.getenv('SCRAPE_MEDIA_CONCURRENCY', 8))
+# Give up on a channel after this many FloodWait pauses in a single run
+MAX_FLOOD_WAITS = int(os.getenv('SCRAPE_MAX_FLOOD_WAITS', 5))
+# A message whose photo fails is saved without it; the photo is retried on later
+# runs until it has failed this many times
+MAX_PHOTO_ATTEMPTS = int(os.getenv('SCRAPE_MAX_PHOTO_ATTEMPTS', 3))
+# Messages fetched per channel per run (newest on the first run, newer-than-last afterwards)
+SCRAPE_LIMIT = int(os.getenv('SCRAPE_LIMIT', 100))
+INCREMENTAL = os.getenv('SCRAPE_INCREMENTAL', '1') == '1'
+# Backfill pages backwards in chunks; the cursor is saved after every chunk
+BACKFILL_CHUNK_SIZE = int(os.getenv('SCRAPE_BACKFILL_CHUNK_SIZE', 500))
+BACKFILL_MAX_CHUNKS = int(os.getenv('SCRAPE_BACKFILL_MAX_CHUNKS', 10))
+
 class Solution:
-    def __init__(self):
-        self.client = TelegramClient('scraping_session', API_ID, API_HASH)
+    def __init__(self, client=None, channel_concurrency=CHANNEL_CONCURRENCY,
+                 media_concurrency=MEDIA_CONCURRENCY, incremental=INCREMENTAL, backfill=False,
+                 state=None, media_store=None):
+        # A pre-built client (e.g. benchmarks.fake_telegram) can be injected
+        self.client = client or TelegramClient('scraping_session', API_ID, API_HASH)
         # We start with your specific required channels
         self.target_channels = ['CheMed123', 'tikvahpharma', 'lobelia4cosmetics']
+        self.channel_slots = asyncio.Semaphore(max(1, channel_concurrency))
+        self.media_slots = asyncio.Semaphore(max(1, media_concurrency))
+        # Per-channel throughput, filled in by scrape_channel()
+        self.stats = {}
+        # Incremental mode: only fetch above each channel's saved high-water mark
+        self.incremental = incremental
+        self.limit = SCRAPE_LIMIT
+        self.state = state or ScrapeState()
+        # Photos are stored once per unique image; see src/media_store.py
+        self.media = media_store or MediaStore()
+        self._inflight = {}
+        # Backfill mode: additionally page backwards below the oldest saved message
+        self.backfill = backfill
+        self.backfill_chunk_size = BACKFILL_CHUNK_SIZE
+        self.backfill_chunks = BACKFILL_MAX_CHUNKS
 
-    async def scrape_channel(self, channel_username):
-        print(f"--- Scraping: {channel_username} ---")
+    async def _download_photo(self, message, channel_username):
+        """
+        Stores the message's photo in the content-addressed media store and
+        returns (image hash, bytes downloaded). A photo id that is already
+        stored, or already being downloaded for another message, costs nothing.
+        """
+        photo_id = message.photo.id
+        sha = self.media.lookup_photo(photo_id)
+        downloaded = 0
+        if sha is None:
+            task = self._inflight.get(photo_id)
+            owner = task is None
+            if owner:
+                task = self._inflight[photo_id] = asyncio.ensure_future(self._fetch_photo(message))
+            try:
+                sha, size = await asyncio.shield(task)
+            finally:
+                if owner:
+                    self._inflight.pop(photo_id, None)
+            downloaded = size if owner else 0
+        self.media.link(channel_username, message.id, sha)
+        return sha, downloaded
+
+    async def _fetch_photo(self, message):
+        """
+        Downloads one photo into memory, sleeping through FloodWait without
+        holding a slot; gives up after MAX_FLOOD_WAITS pauses, like a channel.
+        """
+        flood_waits = 0
+        while True:
+            async with self.media_slots:
+                try:
+                    payload = await self.client.download_media(message.photo, file=bytes)
+                    break
+                except FloodWaitError as e:
+                    wait = e.seconds
+            flood_waits += 1
+            if flood_waits > MAX_FLOOD_WAITS:
+                raise RuntimeError(f"Gave up on photo {message.photo.id} after {MAX_FLOOD_WAITS} FloodWaits")
+            print(f"⏳ FloodWait on photo {message.photo.id}: sleeping {wait}s")
+            await asyncio.sleep(wait)
+
+        # Hashing and the file write run in a worker thread so other channels' downloads
+        # keep going; the SQLite index stays on the event loop's thread
+        sha = await asyncio.to_thread(self.media.write_object, payload)
+        self.media.record_photo(message.photo.id, sha)
+        return sha, len(payload)
+
+    async def _fetch_messages(self, channel_username, limit=100, min_id=0, offset_id=0, reverse=False):
+        """
+        Collects up to `limit` messages (newest first, or oldest first with
+        `reverse`). On FloodWait it sleeps and resumes after the last message
+        seen. Runs inside the channel's slot (see scrape_channel).
+        Returns the messages and whether it gave up after MAX_FLOOD_WAITS
+        (the messages are then only a prefix).
+        """
+        messages = []
+        flood_waits = 0
+        while True:
+            if messages and reverse:
+                min_id = messages[-1].id
+            elif messages:
+                offset_id = messages[-1].id
+            try:
+                async for message in self.client.iter_messages(
+                        channel_username, limit=limit - len(messages), min_id=min_id,
+                        offset_id=offset_id, reverse=reverse):
+                    messages.append(message)
+                return messages, False
+            except FloodWaitError as e:
+                wait = e.seconds
+            flood_waits += 1
+            if flood_waits > MAX_FLOOD_WAITS:
+                print(f"⚠️ Giving up on {channel_username} after {MAX_FLOOD_WAITS} FloodWaits")
+                return messages, True
+            print(f"⏳ FloodWait on {channel_username}: sleeping {wait}s")
+            await asyncio.sleep(wait)
+
+    async def _store_batch(self, channel_username, messages):
+        """
+        Downloads the photos of `messages`, merges them into today's JSON file and
+        advances the channel's state. Returns (records saved, bytes downloaded).
+        """
+        with span("scrape", batch=True, channel=channel_username, messages=len(messages)):
+            return await self._store_messages(channel_username, messages)
+
+    async def _store_messages(self, channel_username, messages):
         messages_data = []
-        
-        try:
-            image_dir = f"data/raw/images/{channel_username}"
-            os.makedirs(image_dir, exist_ok=True)
-
-            async for message in self.client.iter_messages(channel_username, limit=100):
-                data = {
-                    "message_id": message.id,
-                    "channel_name": channel_username,
-                    "message_date": str(message.date),
-                    "message_text": message.text or "",
-                    "has_media": message.media is not None,
-                    "views": message.views or 0,
-                    "forwards": message.forwards or 0,
-                    "image_path": None
-                }
-
-                if message.photo:
-                    file_path = f"{image_dir}/{message.id}.jpg"
-                    await self.client.download_media(message.photo, file=file_path)
-                    data["image_path"] = file_path
-                
-                messages_data.append(data)
+        downloads = []
+        for message in messages:
+            data = {
+                "message_id": message.id,
+                "channel_name": channel_username,
+                "message_date": str(message.date),
+                "message_text": message.text or "",
+                "has_media": message.media is not None,
+                "views": message.views or 0,
+                "forwards": message.forwards or 0,
+                "image_path": None,
+                "image_hash": None
+            }
+
+            if message.photo:
+                downloads.append((data, message, self._download_photo(message, channel_username)))
+
+            messages_data.append(data)
+
+        # Photos of this channel download concurrently, bounded by media_slots. A photo
+        # that fails leaves its message without an image: the batch is still saved and
+        # the high-water mark moves, and the photo is retried on the next runs
+        # (_retry_failed_photos) until it has failed MAX_PHOTO_ATTEMPTS times.
+        results = await asyncio.gather(*(download for _, _, download in downloads), return_exceptions=True)
+        bytes_downloaded = 0
+        for (data, message, _), result in zip(downloads, results):
+            if isinstance(result, Exception):
+                attempts = self.media.record_failure(channel_username, message.id, message.photo.id, result)
+                metrics.inc("photos_failed_total", channel=channel_username)
+                gave_up = " (giving up)" if attempts >= MAX_PHOTO_ATTEMPTS else ""
+                print(f"⚠️ Photo of {channel_username}/{message.id} failed, attempt {attempts}{gave_up}: {result}")
+                continue
+            sha, downloaded = result
+            data["image_path"] = self.media.object_path(sha)
+            data["image_hash"] = sha
+            bytes_downloaded += downloaded
+            self.media.clear_failure(channel_username, message.id)
+        self.media.commit()
+
+        if messages_data:
             today_str = datetime.now().strftime("%Y-%m-%d")
             json_dir = f"data/raw/telegram_messages/{today_str}"
             os.makedirs(json_dir, exist_ok=True)
-            
-            with open(f"{json_dir}/{channel_username}.json", 'w', encoding='utf-8') as f:
-                json.dump(messages_data, f, indent=4, ensure_ascii=False)
-            
-            print(f"✅ Saved {len(messages_data)} records for {channel_username}")
+            json_path = f"{json_dir}/{channel_username}.json"
+
+            # Several incremental/backfill batches can land on the same day
+            merged = {}
+            if os.path.exists(json_path):
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    merged = {m["message_id"]: m for m in json.load(f)}
+            merged.update({m["message_id"]: m for m in messages_data})
+
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(sorted(merged.values(), key=lambda m: m["message_id"], reverse=True),
+                          f, indent=4, ensure_ascii=False)
+
+            # Only move the high-water mark once the batch is safely on disk
+            self.state.record(channel_username, [m["message_id"] for m in messages_data])
 
-        except Exception as e:
-            print(f"❌ Error on {channel_username}: {e}")
+        return len(messages_data), bytes_downloaded
+
+    async def _retry_failed_photos(self, channel_username):
+        """
+        Fetches again the messages whose photo failed on an earlier run and saves
+        them with the photo this time. Returns (records saved, bytes downloaded).
+        """
+        message_ids = self.media.failed_photos(channel_username, MAX_PHOTO_ATTEMPTS)
+        if not message_ids:
+            return 0, 0
+        messages = await self.client.get_messages(channel_username, ids=message_ids)
+        for message_id, message in zip(message_ids, messages):
+            if message is None or not message.photo:
+                # Deleted or edited since: nothing left to download
+                self.media.clear_failure(channel_username, message_id)
+        self.media.commit()
+        return await self._store_batch(channel_username, [m for m in messages if m is not None and m.photo])
+
+    async def _backfill_channel(self, channel_username):
+        """Pages backwards below the oldest saved message, one resumable chunk at a time."""
+        saved, size = 0, 0
+        for _ in range(self.backfill_chunks):
+            state = self.state.get(channel_username)
+            if state.get("backfill_complete") or not state.get("oldest_message_id"):
+                break
+            chunk, gave_up = await self._fetch_messages(channel_username, limit=self.backfill_chunk_size,
+                                                           offset_id=state["oldest_message_id"])
+            count, chunk_bytes = await self._store_batch(channel_username, chunk)
+            saved, size = saved + count, size + chunk_bytes
+            if gave_up:
+                # A FloodWait-cut chunk is short too, but older history is still there; resume next run
+                break
+            if len(chunk) < self.backfill_chunk_size:
+                self.state.mark_backfill_complete(channel_username)
+                print(f"📜 Backfill complete for {channel_username}")
+        return saved, size
+
+    async def scrape_channel(self, channel_username):
+        saved = 0
+        bytes_downloaded = 0
+
+        # The slot is held for the listing, the photos and the backfill, and the
+        # channel's time runs from getting it to giving it back, not from queueing
+        async with self.channel_slots:
+            print(f"--- Scraping: {channel_username} ---")
+            started = time.perf_counter()
+            try:
+                # Photos that failed on earlier runs, before this run adds its own failures
+                retried, bytes_downloaded = await self._retry_failed_photos(channel_username)
+                if retried:
+                    print(f"✅ Retried the photos of {retried} earlier records for {channel_username}")
+
+                last_seen = self.state.get(channel_username).get("last_message_id")
+                if self.incremental and last_seen:
+                    # Only messages newer than the high-water mark, oldest first,
+                    # so a capped run never leaves a gap behind it
+                    messages, _ = await self._fetch_messages(
+                        channel_username, limit=self.limit, min_id=last_seen, reverse=True)
+                else:
+                    messages, _ = await self._fetch_messages(channel_username, limit=self.limit)
+                saved, new_bytes = await self._store_batch(channel_username, messages)
+                bytes_downloaded += new_bytes
+                print(f"✅ Saved {saved} new records for {channel_username}")
+
+                if self.backfill:
+                    backfilled, backfill_bytes = await self._backfill_channel(channel_username)
+                    saved, bytes_downloaded = saved + backfilled, bytes_downloaded + backfill_bytes
+                    print(f"✅ Backfilled {backfilled} older records for {channel_username}")
+
+            except Exception as e:
+                print(f"❌ Error on {channel_username}: {e}")
+
+            elapsed = time.perf_counter() - started
+        metrics.inc("messages_scraped_total", saved, channel=channel_username)
+        metrics.inc("media_bytes_downloaded_total", bytes_downloaded, channel=channel_username)
+        self.stats[channel_username] = {
+            "messages": saved,
+            "bytes": bytes_downloaded,
+            "seconds": elapsed,
+            "messages_per_sec": saved / elapsed if elapsed else 0.0,
+            "bytes_per_sec": bytes_downloaded / elapsed if elapsed else 0.0,
+        }
+
+    def report_throughput(self):
+        print("--- Per-channel throughput ---")
+        for channel, s in sorted(self.stats.items()):
+            print(f"{channel:<30} {s['messages']:>6} msgs {s['messages_per_sec']:>8.1f} msg/s "
+                  f"{s['bytes_per_sec'] / 1024:>10.1f} KiB/s ({s['seconds']:.1f}s)")
+
+    async def scrape_all(self, channels):
+        """Scrapes every channel concurrently; the semaphores bound the parallelism."""
+        await asyncio.gather(*(self.scrape_channel(channel) for channel in channels))
+        self.report_throughput()
 
     async def run(self):
         await self.client.start()
-        
-        # 1. Discover more channels
-        discovered = await get_discovered_channels(self.client)
-        
-        # 2. Combine required + discovered (use set to avoid duplicates)
-        all_channels = list(set(self.target_channels + discovered))
+
+        # 1. Discover more channels, most relevant first
+        discovered = await get_discovered_channels(self.client, exclude=self.target_channels)
+
+        # 2. Required channels first, then the discoveries in rank order, without duplicates
+        all_channels = list(dict.fromkeys(self.target_channels + discovered))
         print(f"Total unique channels to scrape: {len(all_channels)}")
 
         # 3. Scrape them all
-        for channel in all_channels:
-            await self.scrape_channel(channel)
+        with span("scrape", channels=len(all_channels)):
+            await self.scrape_all(all_channels)
 
 if __name__ == '__main__':
-    sol = Solution()
+    sol = Solution(backfill='--backfill' in sys.argv)
     with sol.client:
-        sol.client.loop.run_until_complete(sol.run())
\ No newline at end of file
+        sol.client.loop.run_until_complete(sol.run())
@@ -0,0 +1,108 @@
+# Filename: search_index.py
+# Author: MAYSHLAMY
+# Problem: Ranked full-text + trigram search over refined.medical_data instead of ILIKE scans
+
+import os
+import sys
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 'simple' does no stemming or stop words, so Amharic and Arabic tokens are kept as written
+SEARCH_CONFIG = os.getenv('SEARCH_TS_CONFIG', 'simple')
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+
+# Whether pg_trgm is installed, looked up once per process by search_messages
+_trigram = None
+
+def has_trigram(conn, cached=True):
+    """True when the pg_trgm extension is installed in this database."""
+    global _trigram
+    if _trigram is None or not cached:
+        _trigram = conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")).scalar()
+    return _trigram
+
+def install_trigram(conn):
+    """
+    One-time setup (`python src/search_index.py`): CREATE EXTENSION needs a
+    privileged role, so it is not repeated on every refinement.
+    """
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+def ensure_search_index(conn):
+    """
+    Adds the generated search_vector column with its GIN index and, when pg_trgm
+    is installed, a trigram GIN index on cleaned_content for fuzzy and non-Latin
+    substring matches. Safe to run after every refinement; a replaced table
+    simply gets them back.
+    """
+    conn.execute(text(f"""
+        ALTER TABLE refined.medical_data
+            ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', coalesce(cleaned_content, ''))) STORED;
+        CREATE INDEX IF NOT EXISTS medical_data_search_idx
+            ON refined.medical_data USING GIN (search_vector);
+    """))
+    if has_trigram(conn, cached=False):
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS medical_data_trgm_idx
+                ON refined.medical_data USING GIN (cleaned_content gin_trgm_ops);
+        """))
+
+def search_messages(conn, keyword, limit=SEARCH_PAGE_SIZE, offset=0, fuzzy=False, unique=False):
+    """
+    Full-text matches (websearch syntax: "quoted phrases", OR, -exclude) plus
+    case-insensitive substring matches, both served by GIN indexes. With fuzzy,
+    misspelt words within trigram distance match too. Rows are ranked by
+    ts_rank_cd plus trigram word similarity; only the returned page gets a
+    highlighted ts_headline snippet. With unique, reposts of an earlier
+    message (is_canonical = FALSE, see src/near_duplicates.py) are left out.
+    Without pg_trgm, fuzzy is ignored and rows are ranked by ts_rank_cd alone.
+    """
+    pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    trigram = has_trigram(conn)
+    fuzzy_match = "OR :keyword <% m.cleaned_content" if fuzzy and trigram else ""
+    similarity = "+ word_similarity(:keyword, m.cleaned_content)" if trigram else ""
+    canonical_only = "AND m.is_canonical IS NOT FALSE" if unique else ""
+    query = text(f"""
+        WITH q AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}', :keyword) AS tsq),
+        hits AS (
+            SELECT m.msg_key, m.channel_name, m.content, m.message_timestamp, m.view_count,
+                   m.forward_count, m.image_path, m.cleaned_content, m.has_detection, m.detection_count,
+                   ts_rank_cd(m.search_vector, q.tsq) {similarity} AS rank,
+                   q.tsq
+            FROM refined.medical_data m, q
+            WHERE (m.search_vector @@ q.tsq
+                   OR m.cleaned_content ILIKE :pattern
+                   {fuzzy_match})
+              {canonical_only}
+            ORDER BY rank DESC, m.msg_key
+            LIMIT :limit OFFSET :offset
+        )
+        SELECT msg_key, channel_name, content, message_timestamp, view_count, forward_count,
+               image_path, cleaned_content, has_detection, detection_count, rank,
+               ts_headline('{SEARCH_CONFIG}', cleaned_content, tsq,
+                           'StartSel=<b>, StopSel=</b>, MaxFragments=2, MaxWords=20, MinWords=5') AS snippet
+        FROM hits
+        ORDER BY rank DESC, msg_key
+    """)
+    result = conn.execute(query, {"keyword": keyword, "pattern": pattern, "limit": limit, "offset": offset})
+    return [dict(row) for row in result.mappings()]
+
+if __name__ == "__main__":
+    db_url = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+    try:
+        with create_engine(db_url).begin() as conn:
+            install_trigram(conn)
+    except Exception as e:
+        print(f"⚠️ pg_trgm not installed, fuzzy search stays off: {e}")
+    with create_engine(db_url).begin() as conn:
+        print("--- Building search index on refined.medical_data ---")
+        ensure_search_index(conn)
+    print("✅ Search index ready")
+    if len(sys.argv) > 1:
+        with create_engine(db_url).connect() as conn:
+            for hit in search_messages(conn, ' '.join(sys.argv[1:])):
+                print(f"{hit['rank']:.3f} {hit['channel_name']}: {hit['snippet']}")
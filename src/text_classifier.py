@@ -0,0 +1,157 @@
+# Filename: text_classifier.py
+# Author: MAYSHLAMY
+# Problem: Batch medical/noise classification of whole message columns with precompiled patterns
+
+import os
+import re
+import csv
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# The lexicon doubles as a dbt seed, so the warehouse can count the same terms
+LEXICON_PATH = os.getenv('MEDICAL_LEXICON_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'medical_warehouse', 'seeds', 'medical_lexicon.csv'))
+
+FILTERED_NOISE = "FILTERED_NOISE"
+# Messages without a medical term shorter than this many words are junk
+MIN_WORDS = 15
+
+CYRILLIC = re.compile(r'[\u0400-\u04FF]')
+LINKS_AND_MENTIONS = re.compile(r'http\S+|www\S+|https\S+|@\w+')
+WHITESPACE = re.compile(r'\s+')
+
+# Batch mode runs on Arrow's RE2 kernels. RE2's \s, \S and \w are ASCII-only,
+# so the batch patterns spell out Python's Unicode classes explicitly.
+_SPACES = [c for c in range(0x3001) if chr(c).isspace()]
+_SPACE_CLASS = ''.join(f'\\x{{{c:x}}}' for c in _SPACES)
+_SPACE_CLASS_BUT_BLANK = ''.join(f'\\x{{{c:x}}}' for c in _SPACES if c != 0x20)
+BATCH_CYRILLIC = r'[\x{0400}-\x{04FF}]'
+BATCH_NON_SPACE = f'[^{_SPACE_CLASS}]'
+BATCH_LINKS_AND_MENTIONS = f'http{BATCH_NON_SPACE}+|www{BATCH_NON_SPACE}+|https{BATCH_NON_SPACE}+|@[\\pL\\pN_]+'
+# Words are runs of non-whitespace, exactly what str.split() returns
+BATCH_MIN_WORDS = f'^[{_SPACE_CLASS}]*(?:{BATCH_NON_SPACE}+[{_SPACE_CLASS}]+){{{MIN_WORDS - 1}}}{BATCH_NON_SPACE}'
+# Runs of 2+ whitespace, or one non-' ' whitespace char: same result as \s+ -> ' '
+# without rewriting every single space
+BATCH_WHITESPACE = f'[{_SPACE_CLASS}]{{2,}}|[{_SPACE_CLASS_BUT_BLANK}]'
+
+# Labels, in the order the rules are applied
+EMPTY = 'empty'
+CYRILLIC_SCRIPT = 'cyrillic'
+NOISE_TERM = 'noise_term'
+SHORT_NON_MEDICAL = 'short_non_medical'
+MEDICAL = 'medical'
+LONG_NON_MEDICAL = 'long_non_medical'
+FILTERED_LABELS = (CYRILLIC_SCRIPT, NOISE_TERM, SHORT_NON_MEDICAL)
+_LABELS = np.array([EMPTY, CYRILLIC_SCRIPT, NOISE_TERM, SHORT_NON_MEDICAL, MEDICAL, LONG_NON_MEDICAL], dtype=object)
+
+
+def load_lexicon(path=LEXICON_PATH):
+    """Reads term,category,language rows; returns {'noise': [...], 'medical': [...]}."""
+    lexicon = {'noise': [], 'medical': []}
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            lexicon.setdefault(row['category'], []).append(row['term'])
+    return lexicon
+
+
+def _escape(term):
+    # re.escape() also escapes spaces, which RE2 rejects; escape only metacharacters
+    return re.sub(r'([\\.^$|?*+()\[\]{}])', r'\\\1', term)
+
+
+def _to_numpy(mask):
+    return mask.to_numpy(zero_copy_only=False)
+
+
+def _alternation(terms):
+    # Longest first, so overlapping terms report the most specific match
+    return re.compile('|'.join(_escape(t) for t in sorted(set(terms), key=len, reverse=True)))
+
+
+class MedicalTextClassifier:
+    """
+    Applies the cleaner's rules to a whole column at once:
+      1. Cyrillic script anywhere             -> cyrillic
+      2. a noise term (case-sensitive)        -> noise_term
+      3. no medical term (case-insensitive)
+         and fewer than MIN_WORDS words       -> short_non_medical
+      4. otherwise medical / long_non_medical, with URLs and @mentions stripped
+    Each term list is compiled once into a single alternation, so every message
+    is scanned once per rule instead of once per term, and classify() runs
+    those scans over a whole Arrow column at a time.
+    """
+
+    def __init__(self, lexicon_path=LEXICON_PATH):
+        lexicon = load_lexicon(lexicon_path)
+        self.noise_terms = lexicon['noise']
+        self.medical_terms = [t.lower() for t in lexicon['medical']]
+        self.noise_pattern = _alternation(self.noise_terms)
+        self.medical_pattern = _alternation(self.medical_terms)
+
+    def classify(self, values, with_terms=True):
+        """
+        Classifies a pandas Series, a pyarrow Array/ChunkedArray or any sequence of
+        strings. Returns a DataFrame aligned with the input with columns
+        label, matched_terms and cleaned_content (FILTERED_NOISE for filtered rows).
+        Pass with_terms=False to skip collecting matched_terms when only the
+        labels and cleaned text are needed.
+
+        Each rule is one RE2 scan over the whole Arrow column; Python only
+        touches the matched rows, to list their terms.
+        """
+        index = values.index if isinstance(values, pd.Series) else None
+        if isinstance(values, (pa.Array, pa.ChunkedArray)):
+            array = values
+        else:
+            # Zero-copy for Arrow-backed string columns (the pandas 3 default)
+            array = pa.array(values if isinstance(values, pd.Series) else list(values), from_pandas=True)
+        text = pc.fill_null(array.cast(pa.large_string()), "")
+        n = len(text)
+
+        empty = _to_numpy(pc.equal(text, ""))
+        cyrillic = _to_numpy(pc.match_substring_regex(text, BATCH_CYRILLIC))
+        noisy = _to_numpy(pc.match_substring_regex(text, self.noise_pattern.pattern))
+        lowered = pc.utf8_lower(text)
+        has_medical = _to_numpy(pc.match_substring_regex(lowered, self.medical_pattern.pattern))
+
+        # Anchored "at least MIN_WORDS words" test; stops scanning after the last one needed
+        short = ~_to_numpy(pc.match_substring_regex(text, BATCH_MIN_WORDS))
+
+        # First rule that fires wins; positions index into _LABELS
+        code = np.select([empty, cyrillic, noisy, short & ~has_medical, has_medical], [0, 1, 2, 3, 4], 5)
+        label = _LABELS[code]
+
+        # Noise rows report their noise terms, medical rows their medical terms
+        matched = np.empty(n, dtype=object)
+        if with_terms:
+            matched[:] = [[] for _ in range(n)]
+            for rows, source, pattern in ((code == 2, text, self.noise_pattern),
+                                          (code == 4, lowered, self.medical_pattern)):
+                rows = np.flatnonzero(rows)
+                for row, hit_text in zip(rows, source.take(pa.array(rows)).to_pylist()):
+                    matched[row] = pattern.findall(hit_text)
+
+        cleaned = np.where((code >= 1) & (code <= 3), FILTERED_NOISE, "").astype(object)
+        kept = np.flatnonzero(code >= 4)
+        if len(kept):
+            kept_text = pc.replace_substring_regex(text.take(pa.array(kept)), BATCH_LINKS_AND_MENTIONS, '')
+            kept_text = pc.replace_substring_regex(kept_text, BATCH_WHITESPACE, ' ')
+            # After collapsing, any leading/trailing whitespace is a single space
+            kept_text = pc.utf8_trim(kept_text, ' ')
+            cleaned[kept] = kept_text.to_pylist()
+
+        return pd.DataFrame({'label': label, 'matched_terms': matched, 'cleaned_content': cleaned},
+                            index=index)
+
+    def clean_one(self, text):
+        """Single-message version of classify(); returns just the cleaned text."""
+        if not text:
+            return ""
+        if CYRILLIC.search(text) or self.noise_pattern.search(text):
+            return FILTERED_NOISE
+        if not self.medical_pattern.search(text.lower()) and len(text.split()) < MIN_WORDS:
+            return FILTERED_NOISE
+        text = LINKS_AND_MENTIONS.sub('', text)
+        return WHITESPACE.sub(' ', text).strip()